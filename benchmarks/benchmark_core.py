@@ -0,0 +1,161 @@
+"""
+Time the core setup functions on synthetic skeletons outside of MotionBuilder.
+
+Runs read_template_file, create_skeleton, get_joints_info, map_markers_to_character and update_spreadsheet
+against the in-memory stand-in of pyfbsdk for skeletons of increasing size and prints the best time of each.
+
+Usage:
+    python benchmarks/benchmark_core.py [--sizes 50 100 500 1000 5000 10000] [--repeat 3] [--output results.csv]
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+# Make the flexible_mocap package in the repository's root importable.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flexible_mocap import core, standin
+from flexible_mocap.sdk import HEADLESS
+from flexible_mocap.template import SkeletonTemplate, open_csv
+
+DEFAULT_SIZES = [50, 100, 500, 1000, 5000, 10000]
+FUNCTIONS = ['read_template_file', 'create_skeleton', 'get_joints_info', 'map_markers_to_character',
+             'update_spreadsheet']
+SKELETON_NAMESPACE = 'Mocap'
+MARKER_NAMESPACE = 'C3D'
+
+
+def make_template(num_joints, branching=3, markers_per_bone=2):
+    """
+    Create a skeleton template with about num_joints joints. Bones are added breadth first, so the hierarchy
+    stays shallow. The first bones get HumanIK names, so markers can be mapped to the character.
+    :param num_joints: Number of joints including markers and end joints.
+    :type num_joints: int
+    :param branching: Number of child bones per bone.
+    :type branching: int
+    :param markers_per_bone: Number of markers attached to each bone.
+    :type markers_per_bone: int
+    :return: Synthetic skeleton template.
+    :rtype: SkeletonTemplate
+    """
+    rows = list()
+    hik_names = [name for name in standin.HIK_JOINT_NAMES if name != 'Reference']
+    num_bones = max(1, num_joints // (markers_per_bone + 1))
+    bone_names = list()
+    for i in range(num_bones):
+        name = hik_names[i] if i < len(hik_names) else 'Joint{:05d}'.format(i)
+        parent = bone_names[(i - 1) // branching] if i else ''
+        is_leaf = i * branching + 1 >= num_bones
+        rows.append({'name': name, 'parent': parent,
+                     'offset_x': 0.1 if parent else '', 'offset_y': 0.05 * (i % 5) if parent else '',
+                     'offset_z': 0.0 if parent else '',
+                     'type': 'end' if is_leaf and parent else 'bone',
+                     'rotation_mode': '' if is_leaf or not parent else 'ball'})
+        bone_names.append(name)
+        for j in range(markers_per_bone):
+            if len(rows) >= num_joints:
+                break
+            rows.append({'name': 'M{:05d}_{}'.format(i, j), 'parent': name,
+                         'offset_x': 0.02 * j, 'offset_y': 0.03, 'offset_z': 0.05, 'type': 'marker'})
+    return SkeletonTemplate.from_rows(rows)
+
+
+def create_markers(template):
+    """ Create an optical marker in the marker namespace for each marker of the template. """
+    for name in template.get_names('marker'):
+        standin.FBModelMarkerOptical(MARKER_NAMESPACE + ':' + name)
+
+
+def best_time(func, repeat, setup=None):
+    """
+    Run func repeat times and return the shortest duration in seconds.
+    :param func: Function without arguments to time.
+    :param repeat: How often to run func.
+    :param setup: Function without arguments that's called before each run and isn't timed.
+    :return: Shortest duration.
+    :rtype: float
+    """
+    durations = list()
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        func()
+        durations.append(timeit.default_timer() - start)
+    return min(durations)
+
+
+def benchmark_size(num_joints, repeat, directory):
+    """
+    Time all functions for one skeleton size.
+    :return: Dictionary of function name to best time in seconds.
+    :rtype: dict
+    """
+    scene = standin.FBSystem().Scene
+    template = make_template(num_joints)
+    template_path = os.path.join(directory, 'template_{}.csv'.format(num_joints))
+    core.write_template(template_path, template)
+    results = dict()
+
+    results['read_template_file'] = best_time(lambda: core.read_template_file(template_path), repeat)
+
+    results['create_skeleton'] = best_time(lambda: core.create_skeleton(SKELETON_NAMESPACE, template, True),
+                                           repeat, setup=scene.clear)
+
+    # The last created skeleton is used for the remaining functions.
+    root = core.scene_registry.find(template.get_children('')[0], SKELETON_NAMESPACE)
+    results['get_joints_info'] = best_time(lambda: core.get_joints_info(root), repeat)
+
+    create_markers(template)
+    joints = core.get_joint_list(root)
+    character = core.characterize_skeleton('Benchmark', [j for j in joints if j.Name in standin.HIK_JOINT_NAMES])
+    results['map_markers_to_character'] = best_time(
+        lambda: core.map_markers_to_character(template, MARKER_NAMESPACE, character), repeat)
+
+    spread = standin.FBSpread()
+    results['update_spreadsheet'] = best_time(lambda: core.update_spreadsheet(spread, template), repeat)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Numbers of joints.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per function, the best one counts.")
+    parser.add_argument('--output', help="Optional CSV file to write the results to.")
+    args = parser.parse_args(argv)
+
+    if not HEADLESS:
+        print("The benchmarks run against the stand-in, not inside MotionBuilder.", file=sys.stderr)
+        return 1
+
+    # Keep the registry up to date like the tool does.
+    standin.FBSystem().Scene.OnChange.Add(core.scene_registry.on_scene_change)
+    rows = list()
+    directory = tempfile.mkdtemp()
+    try:
+        print("{:>8}  ".format('joints') + "  ".join("{:>24}".format(name) for name in FUNCTIONS))
+        for size in args.sizes:
+            results = benchmark_size(size, args.repeat, directory)
+            print("{:>8}  ".format(size) + "  ".join("{:>22.2f}ms".format(results[name] * 1000.0)
+                                                     for name in FUNCTIONS))
+            row = {'joints': size}
+            row.update(results)
+            rows.append(row)
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output:
+        with open_csv(args.output, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=['joints'] + FUNCTIONS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Measure the latency budget of the head pose fast path on a live replay of a C3D file.
+
+A C3DStreamServer in a separate process streams the recording over UDP at the given rate. This process receives
+each frame into a ring buffer, computes the head pose from the head and HMD markers right away and then solves the
+full body, and prints percentiles of the time each stage takes. Frames that arrive while a frame is processed are
+skipped, so the latest frame is always processed next:
+
+- network: from sending the frame to committing it into the ring buffer
+- head: computing the head pose
+- head total: from sending the frame to the head pose being ready
+- body: solving the full body after the head
+- body total: from sending the frame to the full body being solved
+
+Usage:
+    python benchmarks/benchmark_head_latency.py [--rate 480] [--frames 2000] [--look-ahead 0.0] [--budget 2.0]
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import timeit
+
+import numpy as np
+
+# Make the flexible_mocap package in the repository's root importable.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from flexible_mocap.batch import read_labels
+from flexible_mocap.headpose import HeadPoseTracker
+from flexible_mocap.solver import SegmentSolver
+from flexible_mocap.stream import C3DStreamServer, MarkerRingBuffer, MarkerStreamReceiver
+from flexible_mocap.template import load_template
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'sample_data')
+STAGES = ['network', 'head', 'head total', 'body', 'body total']
+
+
+def serve(c3d_path, address, rate, max_frames):
+    """ Stream the recording, run in a separate process so it doesn't compete for the interpreter lock. """
+    server = C3DStreamServer(c3d_path, address, 'udp', rate=rate, loop=True)
+    server.run(max_frames)
+    server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=480.0, help="Frames per second to stream.")
+    parser.add_argument('--frames', type=int, default=2000, help="Number of frames to stream.")
+    parser.add_argument('--look-ahead', type=float, default=0.0, help="Seconds the head markers are extrapolated.")
+    parser.add_argument('--budget', type=float, default=2.0, help="Milliseconds the head pose may take in total.")
+    parser.add_argument('--port', type=int, default=7490)
+    parser.add_argument('--template', default=os.path.join(SAMPLE_DIR, 'skeleton_template.csv'))
+    parser.add_argument('--c3d', default=os.path.join(SAMPLE_DIR, 'sample_recording.c3d'))
+    parser.add_argument('--labels', default=os.path.join(SAMPLE_DIR, 'MarkerLabels-template.txt'))
+    args = parser.parse_args(argv)
+
+    template = load_template(args.template)
+    labels = read_labels(args.labels)
+    ring = MarkerRingBuffer(int(args.rate), len(labels))
+    frame = np.zeros((len(labels), 4), dtype=np.float32)
+    head = HeadPoseTracker(template, labels, frame_rate=args.rate if args.look_ahead else None,
+                           look_ahead=args.look_ahead)
+    solver = SegmentSolver(template)
+    body_indices = [labels.index(name) for name in solver.marker_names]
+    address = ('127.0.0.1', args.port)
+    durations = dict((stage, np.zeros(args.frames)) for stage in STAGES)
+    count = 0
+
+    receiver = MarkerStreamReceiver(ring, address, 'udp', timeout=1.0)
+    receiver.open()
+    server = multiprocessing.Process(target=serve, args=(args.c3d, address, args.rate, args.frames))
+    server.start()
+    try:
+        # Receive in this thread, so frames are processed as soon as they arrive. Frames that arrived while the
+        # previous frame was processed are skipped.
+        while count < args.frames and receiver.receive_latest():
+            _, sent, arrived = ring.read_latest(frame)
+            # Send and arrival times are comparable because both processes run on this machine.
+            start = timeit.default_timer()
+            if not head.calibrated:
+                head.calibrate(frame)
+            head.update(frame)
+            head_done = timeit.default_timer()
+            solver.solve(frame[body_indices][np.newaxis])
+            body_done = timeit.default_timer()
+            now = time.time()
+            durations['network'][count] = arrived - sent
+            durations['head'][count] = head_done - start
+            durations['head total'][count] = now - (body_done - head_done) - sent
+            durations['body'][count] = body_done - head_done
+            durations['body total'][count] = now - sent
+            count += 1
+    finally:
+        receiver.close()
+        server.join()
+
+    print("{} frames at {} Hz processed, {} skipped, {} lost, head markers {}".format(
+        count, args.rate, ring.write_count - count, ring.lost_count, ", ".join(head.marker_names)))
+    print("{:>12}  {:>9}  {:>9}  {:>9}".format('stage', 'p50', 'p95', 'p99'))
+    for stage in STAGES:
+        values = durations[stage][:count] * 1000.0
+        print("{:>12}  {:>7.3f}ms  {:>7.3f}ms  {:>7.3f}ms".format(stage, *np.percentile(values, [50, 95, 99])))
+    within = (durations['head total'][:count] * 1000.0 <= args.budget).mean() * 100.0
+    print("Head pose within the budget of {:.1f}ms: {:.1f}% of the frames".format(args.budget, within))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
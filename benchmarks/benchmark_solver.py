@@ -0,0 +1,102 @@
+"""
+Time the segment solver per frame for several performers on a replay of a C3D file.
+
+Every performer gets the frames of the same recording, shifted in space and time, so the performers don't share a
+pose. Prints the mean and the 99th percentile of the time per frame and the share of one core it takes at a rate.
+
+Usage:
+    python benchmarks/benchmark_solver.py [--performers 1 5 10 20] [--rate 240] [--frames 2000]
+                                          [--template sample_data/skeleton_template.csv]
+                                          [--c3d sample_data/sample_recording.c3d]
+                                          [--labels sample_data/MarkerLabels-template.txt]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+# Make the flexible_mocap package in the repository's root importable.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from flexible_mocap.batch import read_labels
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.solver import SegmentSolver
+from flexible_mocap.stream import UNIT_SCALES
+from flexible_mocap.template import load_template
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'sample_data')
+
+
+def read_marker_frames(c3d_path, labels_path, marker_names, max_frames=None):
+    """
+    Read the template's markers from a C3D file in meter.
+    :return: Points of shape (frames, markers, 4) with residuals.
+    :rtype: numpy.ndarray
+    """
+    with C3DFile(c3d_path) as c3d:
+        if labels_path:
+            c3d.labels = read_labels(labels_path)
+        indices = c3d.marker_indices(marker_names)
+        missing = [name for name, i in zip(marker_names, indices) if i is None]
+        if missing:
+            raise ValueError("Marker(s) {} couldn't be found in {}.".format(",".join(missing), c3d_path))
+        points, _ = c3d.read_points(0, max_frames, indices)
+        points[..., :3] *= UNIT_SCALES.get(c3d.units, 1.0)
+    return points
+
+
+def benchmark_performers(template, points, num_performers):
+    """
+    Solve all frames for a number of performers.
+    :return: Durations of the frames in seconds.
+    :rtype: numpy.ndarray
+    """
+    solver = SegmentSolver([template] * num_performers)
+    num_frames = len(points)
+    shifts = np.zeros((num_performers, 1, 4), dtype=points.dtype)
+    shifts[:, 0, 0] = np.arange(num_performers) * 2.0
+    frame = np.empty((num_performers,) + points.shape[1:], dtype=points.dtype)
+    durations = np.empty(num_frames)
+    for f in range(num_frames):
+        for p in range(num_performers):
+            frame[p] = points[(f + p * 37) % num_frames]
+        frame += shifts
+        start = timeit.default_timer()
+        solver.solve(frame)
+        durations[f] = timeit.default_timer() - start
+    return durations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--performers', type=int, nargs='+', default=[1, 5, 10, 20], help="Numbers of performers.")
+    parser.add_argument('--rate', type=float, default=240.0, help="Frame rate the solver has to keep up with.")
+    parser.add_argument('--frames', type=int, default=2000, help="Maximum number of frames to solve.")
+    parser.add_argument('--template', default=os.path.join(SAMPLE_DIR, 'skeleton_template.csv'))
+    parser.add_argument('--c3d', default=os.path.join(SAMPLE_DIR, 'sample_recording.c3d'))
+    parser.add_argument('--labels', default=os.path.join(SAMPLE_DIR, 'MarkerLabels-template.txt'),
+                        help="Marker labels of the C3D in order, '' to use the C3D's labels.")
+    args = parser.parse_args(argv)
+
+    template = load_template(args.template)
+    points = read_marker_frames(args.c3d, args.labels, template.get_names('marker'), args.frames)
+    budget = 1.0 / args.rate
+    print("{} frames, {} markers, budget {:.2f}ms per frame at {} Hz".format(len(points), points.shape[1],
+                                                                              budget * 1000.0, args.rate))
+    print("{:>10}  {:>10}  {:>10}  {:>10}".format('performers', 'mean', 'p99', 'core'))
+    for num_performers in args.performers:
+        durations = benchmark_performers(template, points, num_performers)
+        mean = durations.mean()
+        print("{:>10}  {:>8.3f}ms  {:>8.3f}ms  {:>9.0f}%".format(num_performers, mean * 1000.0,
+                                                                 np.percentile(durations, 99) * 1000.0,
+                                                                 mean / budget * 100.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,12 +24,23 @@
 # * The prefix "FB" in MotionBuilder's types stands for "FilmBox", MotionBuilders former name.
 # ***************************************************************************************
 import os.path
-import csv
+import inspect
+import sys
 
 # Import MotionBuilder libraries
 from pyfbsdk import *
 from pyfbsdk_additions import *
 
+# Make the flexible_mocap package next to this script importable.
+script_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+if script_dir not in sys.path:
+    sys.path.append(script_dir)
+
+# Template, skeleton, marker and mapping functions that don't depend on the user interface.
+from flexible_mocap.core import *
+# Opt-in timing of the setup steps, see flexible_mocap.profiling.
+from flexible_mocap.profiling import profiled, profiler
+
 # FixMe: for development. Disable when executed in MoBu!
 #from pyfbsdk_gen_doc import *
 
@@ -41,595 +52,6 @@ class Nonlocals(object):
         self.__dict__.update(kwargs)
         
         
-def is_empty(any_structure):
-    """
-    Check if any object evaluates as being empty, e.g. empty list.
-    :param any_structure: Any object which can be interpreted as being emtpy.
-    :return: Is the structure empty or not?
-    :rtype: bool
-    """
-    if any_structure:
-        return False
-    else:
-        return True
-
-
-def deselect_all():
-    """Deselects each component in the scene.
-    """
-    for comp in FBSystem().Scene.Components:
-        comp.Selected = False
-      
-      
-# ---MARKER FUNCTIONS---
-def get_optical_markers(root=None, marker_list=None):
-    """
-    Recursively find models of subtype FBModelMarkerOptical in the scene.
-    :param root: Parent, is not returned
-    :param marker_list: Used in recursion. List to add markers to. If None is given, it'll be created.
-    :type marker_list: list
-    :return: List of optical markers in scene.
-    :rtype: list
-    """
-    if marker_list is None:
-        marker_list = list()
-    if not root:
-        root = FBSystem().Scene.RootModel
-    for child in root.Children:
-        if child.FbxGetObjectSubType() == 'FBModelMarkerOptical':
-            marker_list.append(child)
-        get_optical_markers(child, marker_list)
-    return marker_list
-    
-
-def check_optical_markers(marker_names, marker_namespace):
-    """
-    Checks if FBModelMarkerOptical models by names in marker_names are in the scene.
-    Pops up an error message if markers weren't found.
-    :param marker_names: The names of the markers that should be in the scene.
-    :type marker_names: list
-    :param marker_namespace: In which Namespace the markers are located.
-    :type marker_namespace: str
-    :return: Do the names check out or not?
-    :rtype: bool
-    """
-    fails = list()
-    for name in marker_names:
-        model = FBFindModelByLabelName(":".join([marker_namespace, name]) if marker_namespace else name)
-        if not model or model.FbxGetObjectSubType() != 'FBModelMarkerOptical':
-            fails.append(name)
-    if not is_empty(fails):
-        FBMessageBox("Error", "Marker(s) {} couldn't be found.".format(",".join(fails)), "Ok")
-        return False
-    else:
-        return True
-
-
-def read_marker_labels(filename):
-    """
-    Reads a text file and puts each line into a list.
-    :param filename: full file path to the text file.
-    :type filename: str
-    :return: List with marker labels.
-    :rtype: list
-    """
-    marker_labels = list()
-    try:
-        with open(filename, 'r') as f:
-            marker_labels = f.read().splitlines()
-            # Get rid of any quotation marks.
-            marker_labels[:] = [s.strip('\"') for s in marker_labels]
-    except IOError:
-        FBMessageBox("Error", "Could not read from file\n{}\nMake sure that the file exists.".format(filename), "OK")
-    return marker_labels
-
-
-def rename_markers(new_labels):
-    """
-    Gets markers from scene and renames them to the labels provided. Numbers must match.
-    :param new_labels: List of new names for the markers.
-    :type new_labels: list
-    """
-    markers = get_optical_markers()
-    if len(markers) != len(new_labels):
-        FBMessageBox("Error", "Number of labels must match number of markers.", "OK")
-    else:
-        for i, marker in enumerate(markers):
-            marker.Name = new_labels[i]
-            
-    
-def move_markers(position_map):
-    """
-    Takes the markers in the scene and if they appear in the position map, they will be moved.
-    :param position_map: Dictionary of marker label to position.
-    :type position_map: dict
-    """
-    markers = get_optical_markers()
-    for marker in markers:
-        if marker.Name in position_map:
-            position = FBVector3d(position_map[marker.Name])
-            marker.Translation = position
-    
-    
-# ---SKELETON FUNCTIONS---
-def read_template_file(fullpath):
-    """
-    Read skeleton data from CSV file.
-    :param fullpath: full file path to the CSV file.
-    :type fullpath: str
-    :return: List of dictionaries with information on joint's name, parent, offsets, type, rotation_mode.
-    :rtype: list
-    """
-    skeleton_info = list()
-    try:
-        with open(fullpath) as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # We don't read all keys. Only those that are necessary for now.
-                entry = {'name': row['name'],
-                         'parent': row['parent'],
-                         'offset_x': row['offset_x'],
-                         'offset_y': row['offset_y'],
-                         'offset_z': row['offset_z'],
-                         'type': row['type'],
-                         'rotation_mode': row['rotation_mode']}
-                skeleton_info.append(entry)
-    except IOError:
-        FBMessageBox("Error", "Could not read from file\n{}\nMake sure that the file exists.".format(fullpath), "OK")
-    finally:
-        return skeleton_info
-
-
-def write_template(fullpath, content):
-    """
-    Save data as CSV file.
-    :param fullpath: full file path to where the CSV file should be saved.
-    :type fullpath: str
-    :param content: List containing information for each joint with name, parent, offsets, bounds, type, rotation_mode.
-    :type content: list
-    """
-    try:
-        with open(fullpath, 'wb') as csvFile:
-            fieldnames = ['name', 'parent', 'offset_x', 'offset_y', 'offset_z',
-                          'bound_x_min', 'bound_x_max', 'bound_y_min', 'bound_y_max', 'bound_z_min', 'bound_z_max',
-                          'type', 'rotation_mode', 'optimize_group']
-            csvWriter = csv.DictWriter(csvFile, fieldnames=fieldnames)
-            csvWriter.writeheader()
-            for item in content:
-                csvWriter.writerow(item)
-    except IOError:
-        FBMessageBox("Error",
-                     "Could not write to file\n{}\nMake sure you have permission\nto write to folder.".format(fullpath),
-                     "Ok")
-
-
-def create_skeleton(namespace, joint_list, create_marker_dummies=False):
-    """
-    Create a joint_map in a T-pose facing along the positive Z axis.
-    :param namespace: namespace to precede the joint names.
-    :type namespace: str
-    :param joint_list: joint data
-    :type joint_list: list
-    :param create_marker_dummies: Whether to create dummy joints for the estimated marker positions or not.
-    :type create_marker_dummies: bool
-    :return: List of FBModelSkeleton nodes.
-    :rtype: list
-    """
-
-    # If there is already a Namespace of that name, show warning and abort.
-    if FBSystem().Scene.NamespaceExist(namespace):
-        FBMessageBox("Warning",
-                     "{} namespace already exists.\nChange or delete the namespace\n"
-                     "before creating a new skeleton.".format(namespace),
-                     "Ok")
-        return None
-    
-    # If there's no joint_list, show warning and abort
-    if is_empty(joint_list):
-        FBMessageBox("Warning", "No skeleton definition.", "Ok")
-        return None
-    
-    joint_map = {}  # A dictionary of joint name to FBModelSkeleton node mappings.
-    # Populate the joint_map with joints.
-    for joint_info in joint_list:
-        name = joint_info['name']
-        joint_type = joint_info['type']
-        if not joint_info['parent']:
-            # If it is the root node, create an FBModelRoot.
-            joint = FBModelRoot(name)
-        else:
-            # Otherwise, create an FBModelSkeleton.
-            if not create_marker_dummies and joint_type == 'marker':
-                continue
-            joint = FBModelSkeleton(name)  # FixMe: Add Namespace from the beginning, otherwise a number is appended and characterization doesn't work.
-        
-        joint.LongName = namespace + ':' + joint.Name  # Apply the specified namespace to each joint.
-        joint.Size = 100  # Arbitrary size: big enough to see in viewport.
-        joint.Show = True  # Make the joint visible in the scene.
-        if joint_type == 'marker':  # Differentiate markers from joints.
-            joint.Color = FBColor(1.0, 0.0, 0)
-        else:
-            joint.Color = FBColor(0.3, 0.8, 1)
-        
-        # Add the joint to our joint_map.
-        joint_map[name] = joint
-    
-    # Once all the joints have been created, apply the parent/child relationships to each of the joint_map's joints.
-    for joint_info in joint_list:
-        if not create_marker_dummies and joint_info['type'] == 'marker':
-            continue
-
-        name = joint_info['name']
-        # Only assign a parent if it exists.
-        parent_name = joint_info['parent']
-        if parent_name in joint_map:
-            joint_map[name].Parent = joint_map[parent_name]
-        
-        # The translation should be set after the parent has been assigned.
-        try:
-            translation = (float(joint_info['offset_x']) * 100.0,
-                           float(joint_info['offset_y']) * 100.0,
-                           float(joint_info['offset_z']) * 100.0)  # Convert to cm.
-        except ValueError:  # e.g. root joints that don't have an offset.
-            translation = (0.0, 0.0, 0.0)
-        
-        joint_map[name].Translation = FBVector3d(translation)
-        # Rotation/Scaling pivot offsets are placed where offset would be globally, must be 0.
-        prop_rot_pivot = joint_map[name].PropertyList.Find('Rotation Pivot')
-        prop_rot_pivot.Data = FBVector3d(0, 0, 0)
-        prop_scale_pivot = joint_map[name].PropertyList.Find('Scaling Pivot')
-        prop_scale_pivot.Data = FBVector3d(0, 0, 0)
-    return list(joint_map.itervalues())
-        
-
-def get_skeleton_data():
-    """
-    Get information on selected joint and its children as dictionaries in a list.
-    :return: list of selected joint and its children.
-    :rtype: list
-    """
-    selected_models = FBModelList()
-    FBGetSelectedModels(selected_models)
-    if len(selected_models) != 1:
-        FBMessageBox("Warning", "Please only select the root joint.", "Ok")
-        return None
-    joint_list = get_joints_info(selected_models[0])
-    return joint_list
-
-
-def get_joint_list(node=None, joint_list=None):
-    """
-    Get all the joints in selected hierarchy.
-    :return: A list of FBModelSkeleton nodes.
-    :rtype: list
-    """
-    if is_empty(joint_list):
-        joint_list = list()
-        
-    if node is None:
-        selected_models = FBModelList()
-        FBGetSelectedModels(selected_models)
-        if len(selected_models) == 0:
-            FBMessageBox("Warning", "Please select at least one joint.", "Ok")
-            return None
-        else:
-            for node in selected_models:
-                get_joint_list(node, joint_list)
-    else:
-        joint_list.append(node)
-        for child in node.Children:
-            get_joint_list(child, joint_list)
-    joint_list = list(set(joint_list))  # Remove possible duplicates.
-    return joint_list
-    
-    
-def zero_joint_rotation(node=None):
-    """Sets rotation of selected joint and child-nodes to 0,0,0.
-    """
-    if node is None:
-        selected_models = FBModelList()
-        FBGetSelectedModels(selected_models)
-        if len(selected_models) == 0:
-            FBMessageBox("Warning", "Please select at least one joint.", "Ok")
-            return None
-        else:
-            for node in selected_models:
-                zero_joint_rotation(node)
-    else:
-        node.Rotation = FBVector3d(0.0, 0.0, 0.0)
-        for child in node.Children:
-            zero_joint_rotation(child)
-
-
-def get_bounds(offset):
-    """
-    Returns a dictionary with min/max bounds for x,y,z around the offset-vector.
-    :param offset: Vector describing 3D coordinates.
-    :type offset: FBVector3d
-    :return: bounds in meter as dictionary.
-    :rtype: dict
-    """
-    bounds = dict()
-    for i, val in enumerate(offset):
-        axis = chr(120 + i)  # x, y, or z
-        bounds['bound_{}_min'.format(axis)] = (offset[i] - 20.0) / 100.0
-        bounds['bound_{}_max'.format(axis)] = (offset[i] + 20.0) / 100.0
-    return bounds
-
-
-def get_joints_info(node, joint_list=None):
-    """
-    Recurse through the skeleton from given node downwards and collect information on the joints.
-    Save this information as dictionaries in a list.
-    :param node: starting node of the topology.
-    :type node: FBModelSkeleton
-    :param joint_list: Used in recursion. List to add joints to. If None is given, it'll be created.
-    :return: List of dictionaries with information on joints.
-    :rtype: list
-    """
-    if is_empty(joint_list):
-        joint_list = list()
-    # We only want skeleton nodes.
-    node_type = node.FbxGetObjectSubType()
-    if node_type == 'FBModelRoot' or node_type == 'FBModelSkeleton':
-        entry = {'name': node.Name}
-        try:
-            entry['parent'] = node.Parent.Name
-        except AttributeError:  # root has no parent.
-            pass
-        try:
-            if node.Color == FBColor(1.0, 0.0, 0.0):
-                entry['type'] = 'marker'
-                entry['rotation_mode'] = ''
-            else:
-                entry['type'] = 'bone'
-                if node.RotationActive:
-                    entry['rotation_mode'] = 'hinge'  # Todo: or 'twist', by checking limits? Check limits to determine if hingeX, hingeY, or hingeZ.
-                else:
-                    entry['rotation_mode'] = 'ball'
-        except AttributeError:  # FBModelRoot has no Attribute Color
-            pass
-        if node.Parent:
-            node_translation = FBVector3d()
-            node.GetVector(node_translation)
-            parent_translation = FBVector3d()
-            node.Parent.GetVector(parent_translation)
-            offset = node_translation - parent_translation
-            entry['offset_x'] = offset[0] / 100.0
-            entry['offset_y'] = offset[1] / 100.0
-            entry['offset_z'] = offset[2] / 100.0
-        else:  # Must be root.
-            entry['parent'] = ''
-            entry['type'] = 'bone'
-            offset = None
-            entry['offset_x'] = ''
-            entry['offset_y'] = ''
-            entry['offset_z'] = ''
-            entry['rotation_mode'] = ''
-        
-        if len(node.Children) == 0 and entry['type'] == 'bone':
-            entry['type'] = 'end'
-            entry['rotation_mode'] = ''
-        else:
-            if not is_empty(offset):
-                entry.update(get_bounds(offset))
-        
-        joint_list.append(entry)
-        for child in node.Children:
-            get_joints_info(child, joint_list)
-        return joint_list
-        
-
-def get_estimated_offsets(fullfilepath):
-    """
-    Load joint estimations from csv file.
-    :param fullfilepath: full path to csv file
-    :type fullfilepath: str
-    :return: Dictionary containing offsets for joint labels.
-    :rtype: dict
-    """
-    estimations = dict()
-    try:
-        with open(fullfilepath, 'rb') as filehandle:
-            reader = csv.reader(filehandle)
-            for row in reader:
-                offset = [float(o) for o in row[1:]]
-                estimations.update({row[0]: FBVector3d(offset)})
-    except IOError:
-        FBMessageBox("Error", "Estimation file {}\n could not be read.".format(os.path.basename(fullfilepath)), "OK")
-        return None
-    except ImportError as e:
-        FBMessageBox("Error", "Wrong file format\n{}".format(e.message), "OK")
-    return estimations
-
-
-def characterize_skeleton(char_name, joints, create_control_rig=False):
-    """
-    Characterize the skeleton and create a control rig if necessary.
-    :param char_name: Name of the character.
-    :type char_name: str
-    :param joints: List of FBModelSkeleton nodes.
-    :type joints: list
-    :param create_control_rig: Whether to create a control rig.
-    :type create_control_rig: bool
-    :return: character
-    :rtype: FBCharacter
-    """
-    # Create a new character.
-    character = FBCharacter(char_name)
-    FBApplication().CurrentCharacter = character
-    
-    # Add each joint in our list to the character.
-    fails = list()
-    for joint in joints:
-        slot = character.PropertyList.Find(joint.Name + 'Link')  # todo: This only works for HIK naming convention. Prompt for preset?
-        if slot is not None:
-            slot.append(joint)
-        else:
-            fails.append(joint.Name)
-    if not is_empty(fails):
-        print "While characterization, no slots were found for {}.".format(",".join(fails))
-    
-    # Flag that the character has been characterized.
-    character.SetCharacterizeOn(True)
-    
-    if create_control_rig:
-        # Create a control rig using Forward and Inverse Kinematics
-        character.CreateControlRig(create_control_rig)
-        # Set the control rig to active.
-        character.ActiveInput = create_control_rig
-    
-    return character
-
-
-# Just for visual style and to prevent error when no mesh is attached to skeleton
-def create_visualization_primitive(geometry='Sphere'):
-    """
-    Create a model which will be applied to each joint in the skeleton.
-    :param geometry: Which form of primitive model should be created.
-    :type geometry: str
-    :return: model
-    """
-    # Create a sphere.
-    model = FBCreateObject('Browsing/Templates/Elements/Primitives', geometry, geometry)
-    model.Scaling = FBVector3d(0.5, 0.5, 0.5)
-    
-    # Define a slightly reflective dark material.
-    material = FBMaterial('SkeletonMaterial')
-    material.Ambient = FBColor(0, 0, 0)
-    material.Diffuse = FBColor(0, 0.04, 0.08)
-    material.Specular = FBColor(0, 0.7, 0.86)
-    material.Shininess = 100
-    model.Materials.append(material)
-    
-    # Create a cartoon-like shader.
-    shader = FBCreateObject('Browsing/Templates/Shading Elements/Shaders', 'Edge Cartoon', 'SkeletonShader')
-    
-    # For a list of all the shader's properties do:
-    # for item in shader.PropertyList:
-    #    print(item.Name)
-    alias_prop = shader.PropertyList.Find('Antialiasing')
-    alias_prop.Data = True
-    color_prop = shader.PropertyList.Find('EdgeColor')
-    color_prop.Data = FBColor(0, 0.83, 1)
-    width_prop = shader.PropertyList.Find('EdgeWidth')
-    width_prop.Data = 8
-    
-    # Append the cartoon shader to the model.
-    model.Shaders.append(shader)
-    
-    # The default shader must also be applied to the model.
-    default_shader = FBSystem().Scene.Shaders[0]
-    model.Shaders.append(default_shader)
-    
-    # Use the default shading mode.
-    model.ShadingMode = FBModelShadingMode.kFBModelShadingDefault
-    
-    return model
-
-
-def apply_model_to_skeleton(skeleton_node, model):
-    """
-    Apply a copy of model to each joint in the skeleton.
-    :param skeleton_node: Reference to root skeleton node in the scene.
-    :param model: Reference to the model that should be applied.
-    """
-    # Do not apply the model to the Reference node.
-    if skeleton_node.Name.lower() == 'reference':
-        return
-    # Do not apply model to leaves.
-    if len(skeleton_node.Children) == 0:
-        return
-    else:
-        # Parent the copied model to the joint.
-        new_model = model.Clone()
-        new_model.Parent = skeleton_node
-        new_model.Show = True
-        
-        # Use the joint name as a prefix.
-        new_model.Name = skeleton_node.Name + "_" + model.Name
-        new_model.ProcessObjectNamespace(FBNamespaceAction.kFBConcatNamespace, skeleton_node.OwnerNamespace.Name)
-        
-        # Reset the model's translation to place it at the same
-        # location as its parent joint.
-        new_model.Translation = FBVector3d(0, 0, 0)  # ToDo: Copy rotation in case model is not a sphere? Scale model to bone length.
-        # Recurse through the topology.
-        for child in skeleton_node.Children:
-            apply_model_to_skeleton(child, model)
-
-
-def map_markers_to_character(joint_list, marker_namespace, character=None):
-    """
-    Connect the markers to the skeleton with flexible mocap workflow.
-    :param joint_list: List with information for each joint's name, parent, offset_x/y/z, type, rotation_mode
-    :type joint_list: list
-    :param character: Character whose joints shall be constrained to markers.
-    :return: Whether the mapping was successful or not.
-    :rtype: bool
-    """
-    if character is None:
-        character = FBApplication().CurrentCharacter
-    # If there's still no character, abort.
-    if character is None:
-        FBMessageBox("Warning", "No character to map markers to!\nCharacterize skeleton first.", "Ok")
-        return False
-    
-    # Get rid of any existing MarkerSet first and create new one.
-    marker_set = character.GetCharacterMarkerSet(True)
-    if marker_set:
-        marker_set.FBDelete()
-    character.CreateCharacterMarkerSet(True)
-    marker_set = character.GetCharacterMarkerSet(True)
-    
-    # Whatever THAT does, but it's in the sample code, so...
-    FBBeginChangeAllModels()
-    
-    # Fill the markerset properties.
-    for prop in marker_set.PropertyList:
-        if prop.Name.endswith('.Markers'):
-            joint_name = prop.Name.replace('.Markers', '')
-            # Todo: Doesn't this require joints to follow HIK naming convention? Need Mapping?
-            # Entries that have this joint as parent and are of type marker.
-            marker_names = [m['name'] for m in joint_list if m['parent'] == joint_name and m['type'] == 'marker']
-            # If the joint has no markers as children, or if there's no such joint in the list, we can't map to it.
-            if is_empty(marker_names):
-                continue
-            # Find the matching marker models in the scene.
-            marker_models = list()
-            for marker_name in marker_names:
-                marker = FBFindModelByLabelName(':'.join([marker_namespace, marker_name]) if marker_namespace else marker_name)
-                if marker:
-                    marker_models.append(marker)
-            num_markers = len(marker_models)
-            
-            # Begins a change on multiple plugs.
-            prop.BeginChange()
-            prop.DisconnectAllSrc()
-            # Connect the marker models to the joint.
-            for marker in marker_models:
-                prop.ConnectSrc(marker)
-            
-            # Ends a change on multiple plugs.
-            prop.EndChange()
-            
-            # Set the type of goal for the joint.
-            constraint_type = marker_set.PropertyList.Find(prop.Name.replace('.Markers', '.Constraint'))
-            if constraint_type is not None and num_markers > 0:
-                # Make the goal type dependent on the number of markers.
-                if num_markers == 1:
-                    goal_type = 1  # Aim joint at markers.
-                elif num_markers == 2:
-                    goal_type = 2  # Rotate joint in markers.
-                elif num_markers >= 3:
-                    goal_type = 0  # Position and rotate joint in markers.
-                # Expects an integer
-                constraint_type.Data = goal_type
-    
-    # Again, I have no idea...
-    FBEndChangeAllModels()
-    return True
-
-
 ###############################################################
 # User Interface                                              #
 ###############################################################
@@ -654,6 +76,8 @@ def populate_tool(main_layout):
     
     spread = FBSpread()
     spread.Caption = "Joints"
+    # Only writes the cells that changed when the skeleton data is updated.
+    spread_view = SpreadsheetView(spread)
     
     def on_character_name_change(control, event):
         nl.character_name = control.Text
@@ -703,7 +127,7 @@ def populate_tool(main_layout):
         # Map markers
 
         # BVH:
-        # Remember Frame (all markers visible)
+        # Remember Frame (all markers visible), see flexible_mocap.calibration.find_calibration_frame
         # zero rotation
         # Read skeleton topology
         # Characterize
@@ -711,6 +135,7 @@ def populate_tool(main_layout):
         # Map markers
         pass
     
+    @profiled("Load Template")
     def load_btn_callback(control, event):
         """
         Load skeleton data from template file.
@@ -738,11 +163,12 @@ def populate_tool(main_layout):
             nl.template_path = lFp.FullFilename
             # First update the joint_map dictionary, then update the display.
             nl.skeleton_data = read_template_file(lFp.FullFilename)
-            update_spreadsheet(spread, nl.skeleton_data)
+            spread_view.update(nl.skeleton_data)
         
         # Cleanup.
         del (lFp, lRes)
     
+    @profiled("Load Estimations")
     def load_offsets_btn_callback(control, event):
         """
         Prompts file dialog and reads offsets to apply to skeleton data.
@@ -767,21 +193,19 @@ def populate_tool(main_layout):
         lRes = lFp.Execute()
         if lRes:
             # First update the joint_map dictionary.
-            offset_map = get_estimated_offsets(lFp.FullFilename)
-            if not is_empty(offset_map):
-                for joint_info in nl.skeleton_data:
-                    joint_name = joint_info['name']
-                    if joint_name in offset_map.iterkeys():
-                        # Since these are mutable data types, we work directly on them and nl.skeleton_data gets updated.
-                        joint_info['offset_x'] = offset_map[joint_name][0]
-                        joint_info['offset_y'] = offset_map[joint_name][1]
-                        joint_info['offset_z'] = offset_map[joint_name][2]
+            if not nl.skeleton_data:
+                FBMessageBox("Error", "Load a skeleton template before the offsets.", "Ok")
+                return
+            estimations = get_estimated_offsets(lFp.FullFilename)
+            if estimations is not None:
+                apply_estimated_offsets(nl.skeleton_data, *estimations)
                 # Now update the display.
-                update_spreadsheet(spread, nl.skeleton_data)
+                spread_view.update(nl.skeleton_data)
 
         # Cleanup.
         del (lFp, lRes)
     
+    @profiled("Create Skeleton")
     def create_btn_callback(control, event):
         """
         Creates a new skeleton.
@@ -791,6 +215,7 @@ def populate_tool(main_layout):
         nl.joint_nodes = create_skeleton(nl.namespace, nl.skeleton_data, nl.create_markers)
         update_namespaces_list()
         
+    @profiled("Create Geometry")
     def create_geometry_btn_callback(control, event):
         """
         Attaches meshes to nl.joint_nodes.
@@ -799,8 +224,9 @@ def populate_tool(main_layout):
         """
         if nl.joint_nodes:
             # Find root of skeleton.
+            root_names = nl.skeleton_data.get_children('') if nl.skeleton_data else list()
             for j in nl.joint_nodes:
-                if j.Parent is None:
+                if j.Name in root_names or j.Parent is None:
                     root = j
                     break
             # Apply a model to each limb of the skeleton.
@@ -822,6 +248,7 @@ def populate_tool(main_layout):
         """
         zero_joint_rotation()
     
+    @profiled("Characterize")
     def characterize_btn_callback(control, event):
         """
         Characterize the skeleton and create a control rig.
@@ -854,24 +281,42 @@ def populate_tool(main_layout):
             new_names = read_marker_labels(lFp.FullFilename)
             rename_markers(new_names)
         
+    def get_dummy_positions():
+        """
+        Get global positions of the marker dummies of the created skeleton.
+        :return: Dictionary of marker label to position.
+        :rtype: dict
+        """
+        positions = dict()
+        joint_map = {j.Name: j for j in nl.joint_nodes}
+        # Search for joints in nl.skeleton_data that are marker dummies.
+        for dummy_name in nl.skeleton_data.get_names('marker'):
+            if dummy_name in joint_map:
+                global_vector = FBVector3d()
+                joint_map[dummy_name].GetVector(global_vector)
+                positions.update({dummy_name: global_vector})
+        return positions
+    
+    def rename_markers_by_position_btn_callback(control, event):
+        """
+        Renames markers in scene to the label of the closest marker dummy.
+        :param control: Widget in which event occurred.
+        :param event: Which event occurred.
+        """
+        if not nl.joint_nodes or not nl.skeleton_data:
+            FBMessageBox("Error", "Create a skeleton with dummy markers first.", "Ok")
+            return
+        rename_markers_by_position(get_dummy_positions())
+    
     def move_markers_btn_callback(control, event):
         """
         Move optical markers to dummy joints that match name.
         :param control: Widget in which event occurred.
         :param event: Which event occurred.
         """
-        positions = dict()
-        joint_map = {j.Name: j for j in nl.joint_nodes}
-        for info in nl.skeleton_data:
-            # Search for joint in nl.skeleton_data to determine if it is a marker dummy.
-            if info['type'] == 'marker':
-                dummy_name = info['name']
-                if dummy_name in joint_map:
-                    global_vector = FBVector3d()
-                    joint_map[dummy_name].GetVector(global_vector)
-                    positions.update({dummy_name: global_vector})
-        move_markers(positions)
+        move_markers(get_dummy_positions())
         
+    @profiled("Map Markers")
     def mapping_btn_callback(control, event):
         """
         Setup the markers as constraints for the joints.
@@ -879,7 +324,7 @@ def populate_tool(main_layout):
         :param event: Which event occurred.
         """
         if nl.skeleton_data:
-            marker_names = [info['name'] for info in nl.skeleton_data if info['type'] == 'marker']
+            marker_names = nl.skeleton_data.get_names('marker')
         else:
             FBMessageBox("Error", "No skeleton data available for mapping.", "Ok")
             return
@@ -894,6 +339,7 @@ def populate_tool(main_layout):
         else:
             nl.control_rig = False
             
+    @profiled("Save")
     def save_btn_callback(control, event):
         """
         Overwrite existing template file with skeleton data. Call SaveAs if file does not exist.
@@ -906,6 +352,7 @@ def populate_tool(main_layout):
         else:
             write_template(nl.template_path, nl.skeleton_data)
     
+    @profiled("SaveAs")
     def saveAs_btn_callback(control, event):
         """
         Save skeleton data to template file.
@@ -948,9 +395,10 @@ def populate_tool(main_layout):
         :param control: Widget in which event occurred.
         :param event: Which event occurred.
         """
-        nl.skeleton_data = list()
-        spreadInit(spread)
+        nl.skeleton_data = SkeletonTemplate.from_rows(list())
+        spread_view.clear()
     
+    @profiled("Update from Skeleton")
     def update_from_skeleton_btn_callback(control, event):
         """
         Update skeleton data from selected skeleton.
@@ -959,7 +407,7 @@ def populate_tool(main_layout):
         """
         nl.skeleton_data = get_skeleton_data()
         nl.joint_nodes = get_joint_list()
-        update_spreadsheet(spread, nl.skeleton_data)
+        spread_view.update(nl.skeleton_data)
     
     '''*************#
     # Create Layout #
@@ -1144,11 +592,19 @@ def populate_tool(main_layout):
     tasks_layout.Add(row, 60)
     
     # Marker manipulation buttons
+    row = FBHBoxLayout(FBAttachType.kFBAttachLeft)
     btn = FBButton()
     btn.Caption = "Rename Markers"
     btn.Justify = FBTextJustify.kFBTextJustifyLeft
     btn.OnClick.Add(rename_markers_btn_callback)
-    tasks_layout.Add(btn, 60)
+    row.Add(btn, 200)
+    
+    btn = FBButton()
+    btn.Caption = "Rename Markers by Position"
+    btn.Justify = FBTextJustify.kFBTextJustifyLeft
+    btn.OnClick.Add(rename_markers_by_position_btn_callback)
+    row.Add(btn, 200)
+    tasks_layout.Add(row, 60)
     
     btn = FBButton()
     btn.Caption = "Move Markers to Dummies"
@@ -1335,61 +791,6 @@ def populate_tool(main_layout):
     tab.TabPanel.TabStyle = 0  # normal tabs
 
 
-def spreadInit(spread):
-    """
-    Deletes spreadsheet content and resets columns.
-    :param spread: spread sheet instance.
-    """
-    # Delete the previous content.
-    spread.Clear()
-    
-    spread.GetColumn(-1).Width = 100
-    spread.ColumnAdd("Parent")
-    spread.GetColumn(0).Width = 100
-    spread.ColumnAdd("Type")
-    spread.GetColumn(1).Width = 80
-    spread.ColumnAdd("Rotation Mode")
-    spread.GetColumn(2).Width = 80
-    spread.ColumnAdd("rel. X")
-    spread.GetColumn(3).Width = 60
-    spread.ColumnAdd("rel. Y")
-    spread.GetColumn(4).Width = 60
-    spread.ColumnAdd("rel. Z")
-    spread.GetColumn(5).Width = 60
-    #spread.ColumnAdd("ConstraintType")
-    #spread.GetColumn(6).Width = 150
-
-
-def update_spreadsheet(spread, joint_list):
-    """
-    Resets the spreadsheet and fills the cells with data from joint_list.
-    :param spread: spreadsheet instance.
-    :param joint_list: List of dictionaries with information on joint's name, parent, offsets, type, rotation_mode.
-    :type joint_list: list
-    """
-    spreadInit(spread)
-    
-    rowRefIndex = 0
-    for joint_info in joint_list:
-        # Add a joint.
-        spread.RowAdd(joint_info['name'], rowRefIndex)
-        # Set cell values.
-        spread.SetCellValue(rowRefIndex, 0, joint_info['parent'])
-        spread.SetCellValue(rowRefIndex, 1, joint_info['type'])
-        spread.SetCellValue(rowRefIndex, 2, joint_info['rotation_mode'])
-        spread.GetSpreadCell(rowRefIndex, 3).Style = FBCellStyle.kFBCellStyleDouble
-        # Convert offsets to floats. Check if offset is not empty.
-        spread.SetCellValue(rowRefIndex, 3, float(joint_info['offset_x']) if joint_info['offset_x'] else '')
-        spread.GetSpreadCell(rowRefIndex, 4).Style = FBCellStyle.kFBCellStyleDouble
-        spread.SetCellValue(rowRefIndex, 4, float(joint_info['offset_y']) if joint_info['offset_y'] else '')
-        spread.GetSpreadCell(rowRefIndex, 5).Style = FBCellStyle.kFBCellStyleDouble
-        spread.SetCellValue(rowRefIndex, 5, float(joint_info['offset_z']) if joint_info['offset_z'] else '')
-        # todo: Show the type of constraint in one cell.
-        # todo Radiobutton for 3 options for contraint?
-        
-        rowRefIndex += 1
-
-
 def createTool():
     """
     Tool creation will serve as the hub for all other controls.
@@ -1397,6 +798,15 @@ def createTool():
     tool = FBCreateUniqueTool("Flexible Motion Capture Skeleton Setup")
     tool.StartSizeX = 768
     tool.StartSizeY = 768
+    # Keep the scene_registry up to date while the tool exists.
+    FBSystem().Scene.OnChange.Add(scene_registry.on_scene_change)
+    
+    def on_tool_unbind(control, event):
+        FBSystem().Scene.OnChange.Remove(scene_registry.on_scene_change)
+        if profiler.enabled:
+            print("Wrote profiling report to {}".format(profiler.write_report()))
+    
+    tool.OnUnbind.Add(on_tool_unbind)
     populate_tool(tool)
     ShowTool(tool)
 
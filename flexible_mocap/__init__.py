@@ -0,0 +1,6 @@
+"""
+Headless helpers for the Flexible MoCap Character Setup.
+
+Everything in this package runs without MotionBuilder, so marker data and skeleton templates
+can be processed outside of the MoBu process. The MotionBuilder script imports from here.
+"""
@@ -0,0 +1,213 @@
+"""
+Build the setups of many performer sessions at once, without MotionBuilder.
+
+A manifest CSV lists one session per row with the columns name, template, offsets, c3d and optionally labels
+(a marker labels text file to rename the C3D's markers in order, like the Rename Markers button). Relative paths
+are relative to the manifest. Each session is processed in a worker process:
+
+1. Load the skeleton template.
+2. Apply the estimated offsets.
+3. Check that the C3D contains all markers of the template.
+4. Find the best calibration frame.
+
+The template with offsets is written to the output directory as <name>.csv and a summary of all sessions to
+summary.csv. Session names must therefore be unique file names, also on case-insensitive file systems.
+
+Usage:
+    python -m flexible_mocap.batch manifest.csv output_dir [--processes N]
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+from flexible_mocap.c3d import C3DError, C3DFile
+from flexible_mocap.calibration import find_calibration_frame
+from flexible_mocap.template import load_template, open_csv, read_offsets, save_template
+
+MANIFEST_FIELDS = ['name', 'template', 'offsets', 'c3d', 'labels']
+SUMMARY_FIELDS = ['name', 'status', 'template', 'joints', 'markers', 'unknown_offsets', 'missing_offsets',
+                  'missing_markers', 'calibration_frame', 'all_visible', 'seconds', 'error']
+SUMMARY_NAME = 'summary'
+# Characters that aren't allowed in file names on Windows, which includes the path separators.
+INVALID_NAME_CHARACTERS = set('<>:"/\\|?*')
+
+
+def check_session_names(sessions):
+    """
+    Make sure the session names can be used as file names in the output directory without overwriting each other
+    or the summary. Names are compared case-insensitively, like Windows and macOS file systems do.
+    :param sessions: Sessions with a name each.
+    :type sessions: list
+    :raises ValueError: If a name is empty, contains path separators or other invalid characters, is reserved
+                        or used more than once.
+    """
+    seen = set()
+    for session in sessions:
+        name = session['name']
+        if not name or name.strip('. ') == '' or name != name.rstrip('. '):
+            raise ValueError("Session name '{}' isn't a valid file name.".format(name))
+        invalid = sorted(set(c for c in name if c in INVALID_NAME_CHARACTERS or ord(c) < 32))
+        if invalid:
+            raise ValueError("Session name '{}' contains invalid character(s) {}.".format(name, " ".join(
+                repr(c) for c in invalid)))
+        key = name.lower()
+        if key == SUMMARY_NAME:
+            raise ValueError("Session name '{}' is reserved for the summary.".format(name))
+        if key in seen:
+            raise ValueError("Session name '{}' is used more than once.".format(name))
+        seen.add(key)
+
+
+def read_manifest(fullpath):
+    """
+    Read the sessions from a manifest CSV file.
+    :param fullpath: full file path to the manifest.
+    :type fullpath: str
+    :return: List of dictionaries with keys of MANIFEST_FIELDS. Paths are absolute, missing optional files are ''.
+    :rtype: list
+    """
+    base_dir = os.path.dirname(os.path.abspath(fullpath))
+    sessions = list()
+    with open_csv(fullpath) as csvfile:
+        for i, row in enumerate(csv.DictReader(csvfile)):
+            session = dict((field, (row.get(field) or '').strip()) for field in MANIFEST_FIELDS)
+            if not session['template'] or not session['c3d']:
+                raise ValueError("Session in row {} of {} needs a template and a c3d file.".format(i + 1, fullpath))
+            if not session['name']:
+                session['name'] = os.path.splitext(os.path.basename(session['c3d']))[0]
+            for field in ('template', 'offsets', 'c3d', 'labels'):
+                if session[field]:
+                    session[field] = os.path.join(base_dir, session[field])
+            sessions.append(session)
+    check_session_names(sessions)
+    return sessions
+
+
+def read_labels(fullpath):
+    """ Read marker labels, one per line, like read_marker_labels does. """
+    with open(fullpath, 'r') as f:
+        return [line.strip('"') for line in f.read().splitlines()]
+
+
+def process_session(session, output_dir):
+    """
+    Build the setup of one session. Errors don't propagate, they are reported in the summary.
+    :param session: Session as read by read_manifest.
+    :type session: dict
+    :param output_dir: Directory to write the session's template to.
+    :type output_dir: str
+    :return: Summary of the session with keys of SUMMARY_FIELDS.
+    :rtype: dict
+    """
+    start = time.time()
+    summary = dict((field, '') for field in SUMMARY_FIELDS)
+    summary['name'] = session['name']
+    try:
+        template = load_template(session['template'])
+        summary['joints'] = len(template)
+        if session['offsets']:
+            names, offsets = read_offsets(session['offsets'])
+            summary['unknown_offsets'] = ' '.join(template.apply_offsets(names, offsets))
+            summary['missing_offsets'] = ' '.join(template.get_missing_offsets(names))
+
+        marker_names = template.get_names('marker')
+        summary['markers'] = len(marker_names)
+        with C3DFile(session['c3d']) as c3d:
+            if session['labels']:
+                labels = read_labels(session['labels'])
+                if len(labels) != len(c3d.labels):
+                    raise C3DError("{} has {} labels for {} markers.".format(session['labels'], len(labels),
+                                                                             len(c3d.labels)))
+                c3d.labels = labels
+            missing = [name for name, i in zip(marker_names, c3d.marker_indices(marker_names)) if i is None]
+            summary['missing_markers'] = ' '.join(missing)
+            if missing:
+                raise C3DError("{} marker(s) of the template couldn't be found.".format(len(missing)))
+            frame, all_visible = find_calibration_frame(template, c3d)
+        summary['calibration_frame'] = frame
+        summary['all_visible'] = all_visible
+
+        summary['template'] = os.path.join(output_dir, session['name'] + '.csv')
+        save_template(summary['template'], template)
+        summary['status'] = 'ok' if all_visible and not summary['unknown_offsets'] else 'warning'
+    except (IOError, OSError, KeyError, ValueError, C3DError) as e:
+        summary['status'] = 'error'
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.time() - start, 3)
+    return summary
+
+
+def _process_session_args(args):
+    """ Unpack the arguments for process_session, because Pool.imap passes one argument. """
+    return process_session(*args)
+
+
+def run_batch(sessions, output_dir, processes=None):
+    """
+    Process sessions in a pool of worker processes.
+    :param sessions: Sessions as read by read_manifest.
+    :type sessions: list
+    :param output_dir: Directory to write the templates to. It's created if it doesn't exist.
+    :type output_dir: str
+    :param processes: Number of worker processes. None uses all cores, 1 processes sessions in this process.
+    :type processes: int
+    :return: Summaries of the sessions in the order of sessions.
+    :rtype: list
+    :raises ValueError: If the session names can't be used as file names, see check_session_names.
+    """
+    # Check all names up front, so no session's output is written before a conflict is found.
+    check_session_names(sessions)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    tasks = [(session, output_dir) for session in sessions]
+    if processes == 1 or len(tasks) <= 1:
+        return [_process_session_args(task) for task in tasks]
+    pool = multiprocessing.Pool(processes)
+    try:
+        # Sessions take different times, so hand them out one at a time.
+        return list(pool.imap(_process_session_args, tasks, chunksize=1))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def write_summary(fullpath, summaries):
+    """
+    Write the summaries of all sessions as CSV file.
+    :param fullpath: full file path to where the CSV file should be saved.
+    :type fullpath: str
+    :param summaries: Summaries as returned by process_session.
+    :type summaries: list
+    """
+    with open_csv(fullpath, 'w') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the setups of many performer sessions at once.")
+    parser.add_argument('manifest', help="CSV file with the columns name, template, offsets, c3d, labels.")
+    parser.add_argument('output_dir', help="Directory for the session templates and summary.csv.")
+    parser.add_argument('--processes', type=int, default=None, help="Number of worker processes. Default: all cores.")
+    args = parser.parse_args(argv)
+
+    try:
+        sessions = read_manifest(args.manifest)
+    except (IOError, OSError, KeyError, ValueError) as e:
+        print("Could not read manifest: {}".format(e), file=sys.stderr)
+        return 2
+    summaries = run_batch(sessions, args.output_dir, args.processes)
+    write_summary(os.path.join(args.output_dir, SUMMARY_NAME + '.csv'), summaries)
+    for summary in summaries:
+        print("{name}: {status} {error}".format(**summary).rstrip())
+    return 1 if any(summary['status'] == 'error' for summary in summaries) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
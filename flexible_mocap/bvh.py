@@ -0,0 +1,435 @@
+"""
+Streaming reader and writer for BVH motion files.
+
+The HIERARCHY section is parsed into joint arrays and can be converted to a SkeletonTemplate, the same structure
+get_joints_info collects from a skeleton in the scene. The MOTION section is parsed chunk by chunk directly into
+NumPy arrays of shape (frames, channels), without creating Python objects per frame or value. The writer works the
+other way round and appends chunks of frames, so long captures never have to be held in memory.
+"""
+import numpy as np
+
+from flexible_mocap.kinematics import ForwardKinematics
+from flexible_mocap.template import SkeletonTemplate
+from flexible_mocap.transforms import euler_to_matrix
+
+# Bytes of motion data that are parsed at once.
+CHUNK_BYTES = 1 << 22
+
+POSITION_CHANNELS = ('Xposition', 'Yposition', 'Zposition')
+ROTATION_CHANNELS = ('Xrotation', 'Yrotation', 'Zrotation')
+
+
+class BVHError(Exception):
+    """ Raised when a file isn't a valid BVH file. """
+    pass
+
+
+class BVHFile(object):
+    """
+    Read access to a BVH file. The hierarchy is parsed on opening, motion data on request.
+
+    :ivar names: Names of the joints in file order, End Sites excluded.
+    :ivar parent_indices: Indices of the parents as array, -1 for the root.
+    :ivar offsets: Offsets of the joints to their parents in file units as array of shape (joints, 3).
+    :ivar channels: Names of each joint's channels, e.g. ('Zrotation', 'Xrotation', 'Yrotation').
+    :ivar channel_starts: Index of each joint's first channel in a frame as array.
+    :ivar channel_count: Number of channels per frame.
+    :ivar end_sites: Dictionary of joint index to End Site offset of shape (3,).
+    :ivar frame_count: Number of frames as stated in the file.
+    :ivar frame_time: Duration of a frame in seconds.
+    """
+    def __init__(self, fullpath):
+        """
+        :param fullpath: full file path to the BVH file.
+        :type fullpath: str
+        """
+        self.fullpath = fullpath
+        self._file = open(fullpath, 'rb')
+        try:
+            self._read_hierarchy()
+            self._read_motion_header()
+        except Exception:
+            self._file.close()
+            raise
+        self._motion_start = self._file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _next_line(self):
+        """ Next non-empty line split into tokens. """
+        for line in iter(self._file.readline, b''):
+            tokens = line.decode('utf-8').split()
+            if tokens:
+                return tokens
+        raise BVHError("Unexpected end of file {}.".format(self.fullpath))
+
+    def _read_hierarchy(self):
+        """ Parse joints, offsets and channels up to the MOTION keyword. """
+        if self._next_line()[0].upper() != 'HIERARCHY':
+            raise BVHError("{} doesn't start with HIERARCHY.".format(self.fullpath))
+        names, parents, offsets, channels, end_sites = [], [], [], [], dict()
+        end_site = -2  # Marks End Sites on the stack.
+        stack = list()  # Indices of the joints whose braces are open.
+        current = None
+        while True:
+            tokens = self._next_line()
+            key = tokens[0].upper()
+            if key in ('ROOT', 'JOINT'):
+                current = len(names)
+                names.append(' '.join(tokens[1:]))
+                parents.append(stack[-1] if stack else -1)
+                offsets.append((0.0, 0.0, 0.0))
+                channels.append(())
+            elif key == 'END':
+                current = end_site
+            elif key == '{':
+                stack.append(current)
+            elif key == '}':
+                if not stack:
+                    raise BVHError("Unbalanced braces in {}.".format(self.fullpath))
+                stack.pop()
+            elif key == 'OFFSET':
+                offset = tuple(float(v) for v in tokens[1:4])
+                if stack and stack[-1] == end_site:
+                    end_sites[stack[-2]] = np.array(offset)
+                elif stack:
+                    offsets[stack[-1]] = offset
+            elif key == 'CHANNELS':
+                channels[stack[-1]] = tuple(tokens[2:2 + int(tokens[1])])
+            elif key == 'MOTION':
+                break
+            else:
+                raise BVHError("Unknown keyword {} in {}.".format(tokens[0], self.fullpath))
+        if not names or stack:
+            raise BVHError("Incomplete hierarchy in {}.".format(self.fullpath))
+
+        self.names = names
+        self.parent_indices = np.array(parents, dtype=np.intp)
+        self.offsets = np.array(offsets, dtype=np.float64).reshape(-1, 3)
+        self.channels = channels
+        counts = np.array([len(c) for c in channels], dtype=np.intp)
+        self.channel_starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+        self.channel_count = int(counts.sum())
+        self.end_sites = end_sites
+
+    def _read_motion_header(self):
+        """ Parse the number of frames and frame time. """
+        tokens = self._next_line()
+        if tokens[0].upper() != 'FRAMES:':
+            raise BVHError("Expected Frames: in {}.".format(self.fullpath))
+        self.frame_count = int(tokens[1])
+        tokens = self._next_line()
+        if ' '.join(tokens[:2]).upper() != 'FRAME TIME:':
+            raise BVHError("Expected Frame Time: in {}.".format(self.fullpath))
+        self.frame_time = float(tokens[2])
+
+    @property
+    def frame_rate(self):
+        return 1.0 / self.frame_time if self.frame_time > 0 else 0.0
+
+    @property
+    def parents(self):
+        """ Names of the joints' parents, '' for the root. """
+        return [self.names[i] if i >= 0 else '' for i in self.parent_indices]
+
+    def iter_motion(self, chunk_size=4096):
+        """
+        Iterate over the motion data in chunks of frames.
+        :param chunk_size: Number of frames per chunk.
+        :type chunk_size: int
+        :return: Yields the index of the first frame and an array of shape (frames, channels).
+        :rtype: generator
+        """
+        self._file.seek(self._motion_start)
+        channel_count = self.channel_count
+        pending = np.empty(0)  # Values of frames that didn't fill a chunk yet.
+        start = 0
+        end_of_file = False
+        while not end_of_file:
+            data = self._file.read(CHUNK_BYTES)
+            end_of_file = len(data) < CHUNK_BYTES
+            if not end_of_file:
+                # A number may be cut off at the end of the read, so only parse up to the last line break.
+                end = data.rfind(b'\n') + 1
+                if end:
+                    self._file.seek(end - len(data), 1)
+                    data = data[:end]
+            try:
+                values = np.fromstring(data, sep=' ') if data.strip() else np.empty(0)
+            except ValueError:
+                raise BVHError("Invalid motion data in {}.".format(self.fullpath))
+            if len(pending):
+                values = np.concatenate([pending, values])
+            num_frames = len(values) // channel_count
+            if end_of_file:
+                if len(values) % channel_count:
+                    raise BVHError("Incomplete frame at the end of {}.".format(self.fullpath))
+            else:
+                num_frames -= num_frames % chunk_size
+            for i in range(0, num_frames, chunk_size):
+                frames = values[i * channel_count:min(i + chunk_size, num_frames) * channel_count]
+                frames = frames.reshape(-1, channel_count)
+                yield start, frames
+                start += len(frames)
+            pending = values[num_frames * channel_count:]
+
+    def read_motion(self):
+        """
+        Read all motion data.
+        :return: Array of shape (frames, channels).
+        :rtype: numpy.ndarray
+        """
+        motion = np.empty((self.frame_count, self.channel_count))
+        count = 0
+        for start, frames in self.iter_motion():
+            stop = min(start + len(frames), self.frame_count)
+            motion[start:stop] = frames[:stop - start]
+            count = stop
+            if stop == self.frame_count:
+                break
+        return motion[:count]
+
+    def get_channel_indices(self, channel_names):
+        """
+        Get the indices of channels of every joint.
+        :param channel_names: Names of the channels, e.g. ROTATION_CHANNELS.
+        :type channel_names: tuple
+        :return: Array of shape (joints, len(channel_names)), -1 where a joint doesn't have the channel.
+        :rtype: numpy.ndarray
+        """
+        indices = np.full((len(self.names), len(channel_names)), -1, dtype=np.intp)
+        for joint, joint_channels in enumerate(self.channels):
+            for i, name in enumerate(channel_names):
+                if name in joint_channels:
+                    indices[joint, i] = self.channel_starts[joint] + joint_channels.index(name)
+        return indices
+
+    @property
+    def rotation_orders(self):
+        """ Order of each joint's rotation channels, e.g. 'ZXY'. '' for joints without rotation channels. """
+        return [''.join(c[0].upper() for c in channels if c in ROTATION_CHANNELS) for channels in self.channels]
+
+    def get_local_transforms(self, motion):
+        """
+        Get the local translations and rotations of all joints for all frames.
+        :param motion: Motion data of shape (frames, channels).
+        :type motion: numpy.ndarray
+        :return: Translations in file units of shape (frames, joints, 3) and rotation matrices of shape
+                 (frames, joints, 3, 3). Joints without position channels use their offset.
+        :rtype: tuple
+        """
+        motion = np.asarray(motion, dtype=np.float64).reshape(-1, self.channel_count)
+        num_frames = len(motion)
+        translations = np.repeat(self.offsets[np.newaxis], num_frames, axis=0)
+        position_indices = self.get_channel_indices(POSITION_CHANNELS)
+        for axis in range(3):
+            has_channel = position_indices[:, axis] >= 0
+            translations[:, has_channel, axis] = motion[:, position_indices[has_channel, axis]]
+
+        rotations = np.empty((num_frames, len(self.names), 3, 3))
+        rotations[:] = np.eye(3)
+        orders = self.rotation_orders
+        # Convert all joints that share a rotation order at once.
+        for order in set(orders):
+            if len(order) != 3:
+                continue
+            joints = [i for i, o in enumerate(orders) if o == order]
+            indices = self.get_channel_indices(tuple(axis + 'rotation' for axis in order))[joints]
+            rotations[:, joints] = euler_to_matrix(motion[:, indices], order)
+        return translations, rotations
+
+    def get_global_transforms(self, motion):
+        """
+        Get the global rotations and positions of all joints for all frames.
+        :param motion: Motion data of shape (frames, channels).
+        :type motion: numpy.ndarray
+        :return: Rotation matrices of shape (frames, joints, 3, 3) and positions in file units of shape
+                 (frames, joints, 3).
+        :rtype: tuple
+        """
+        translations, rotations = self.get_local_transforms(motion)
+        return ForwardKinematics(self.parent_indices, self.offsets).compute(rotations, translations)
+
+    def get_template(self, scale=0.01):
+        """
+        Convert the hierarchy to a skeleton template like get_joints_info creates from a skeleton in the scene.
+        :param scale: Factor to convert offsets from file units to meter, e.g. 0.01 for cm.
+        :type scale: float
+        :return: Skeleton template without markers.
+        :rtype: SkeletonTemplate
+        """
+        num_joints = len(self.names)
+        offsets = self.offsets * scale
+        has_children = np.zeros(num_joints, dtype=bool)
+        has_children[self.parent_indices[self.parent_indices >= 0]] = True
+        is_root = self.parent_indices < 0
+        offsets[is_root] = np.nan
+        types = ['bone' if has_children[i] or is_root[i] else 'end' for i in range(num_joints)]
+        rotation_modes = ['ball' if t == 'bone' and not is_root[i] else '' for i, t in enumerate(types)]
+        # Same bounds of +-20 cm around the offset as get_bounds.
+        bounds = np.repeat(offsets, 2, axis=1) + np.tile([-0.2, 0.2], 3)
+        bounds[np.array(types) == 'end'] = np.nan
+        return SkeletonTemplate(self.names, self.parents, offsets, bounds, types, rotation_modes)
+
+
+def read_bvh(fullpath):
+    """
+    Read hierarchy and motion data of a BVH file.
+    :param fullpath: full file path to the BVH file.
+    :type fullpath: str
+    :return: The opened and closed BVHFile with its hierarchy and the motion of shape (frames, channels).
+    :rtype: tuple
+    """
+    with BVHFile(fullpath) as bvh:
+        return bvh, bvh.read_motion()
+
+
+class BVHWriter(object):
+    """
+    Write a skeleton template and its animation to a BVH file, chunk by chunk.
+    The number of frames doesn't need to be known in advance, it's filled in when the writer is closed.
+
+    Bones and end joints of the template are written as joints, markers are left out. The root has position and
+    rotation channels, all other joints rotation channels only. Every joint ends in an End Site at its own position,
+    so end joints keep their names.
+
+    :ivar names: Names of the written joints in the order of their channels.
+    :ivar channels: Names of each joint's channels.
+    :ivar channel_count: Number of channels per frame.
+    :ivar frame_count: Number of frames written so far.
+    """
+    # Room for the number of frames, which is only known at the end.
+    FRAMES_WIDTH = 12
+
+    def __init__(self, fullpath, template, frame_time, rotation_order='ZXY', scale=100.0, precision=6):
+        """
+        :param fullpath: full file path to where the BVH file should be saved.
+        :type fullpath: str
+        :param template: Skeleton template with the hierarchy and offsets in meter.
+        :type template: flexible_mocap.template.SkeletonTemplate
+        :param frame_time: Duration of a frame in seconds.
+        :type frame_time: float
+        :param rotation_order: Order of the rotation channels, e.g. 'ZXY'.
+        :type rotation_order: str
+        :param scale: Factor to convert offsets from meter to file units, e.g. 100 for cm.
+        :type scale: float
+        :param precision: Number of decimals of the written values.
+        :type precision: int
+        """
+        self.fullpath = fullpath
+        self.precision = precision
+        rotation_channels = tuple(axis.upper() + 'rotation' for axis in rotation_order)
+        joints = [i for i in template.order if template.types[i] != 'marker']
+        self.names = [template.names[i] for i in joints]
+        self.channels = [POSITION_CHANNELS + rotation_channels if template.parent_indices[i] < 0
+                         else rotation_channels for i in joints]
+        self.channel_count = sum(len(c) for c in self.channels)
+        self.frame_count = 0
+        self._line_format = ' '.join(['%.{}f'.format(precision)] * self.channel_count) + '\n'
+        self._file = open(fullpath, 'w')
+        try:
+            self._write_header(template, frame_time, scale)
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_header(self, template, frame_time, scale):
+        """ Write the hierarchy and the MOTION header with a placeholder for the number of frames. """
+        offsets = np.nan_to_num(template.offsets) * scale
+        offset_format = 'OFFSET {0:.{3}f} {1:.{3}f} {2:.{3}f}'
+        children = [list() for _ in template.names]
+        for i in template.order:
+            parent = template.parent_indices[i]
+            if parent >= 0 and template.types[i] != 'marker':
+                children[parent].append(i)
+        lines = ['HIERARCHY']
+        channels = dict(zip(self.names, self.channels))
+        # The stack holds joints to open and closing braces (None), so deep hierarchies don't hit recursion limits.
+        roots = [i for i in template.order if template.parent_indices[i] < 0 and template.types[i] != 'marker']
+        stack = [(i, 0) for i in reversed(roots)]
+        while stack:
+            i, depth = stack.pop()
+            indent = '\t' * depth
+            if i is None:
+                lines.append(indent + '}')
+                continue
+            name = template.names[i]
+            lines.append('{}{} {}'.format(indent, 'ROOT' if template.parent_indices[i] < 0 else 'JOINT', name))
+            lines.append(indent + '{')
+            lines.append(indent + '\t' + offset_format.format(*(list(offsets[i]) + [self.precision])))
+            lines.append('{}\tCHANNELS {} {}'.format(indent, len(channels[name]), ' '.join(channels[name])))
+            if not children[i]:
+                lines.extend([indent + '\tEnd Site', indent + '\t{',
+                              indent + '\t\t' + offset_format.format(0.0, 0.0, 0.0, self.precision),
+                              indent + '\t}'])
+            stack.append((None, depth))
+            stack.extend((child, depth + 1) for child in reversed(children[i]))
+        lines.append('MOTION')
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.write('Frames: ')
+        self._frames_position = self._file.tell()
+        self._file.write(' ' * self.FRAMES_WIDTH + '\n')
+        self._file.write('Frame Time: {:.6f}\n'.format(frame_time))
+
+    def write_frames(self, frames):
+        """
+        Append frames to the file.
+        :param frames: Channel values of shape (frames, channels) or (channels,) for a single frame.
+                       Positions in file units, rotations in degrees, in the order of names and channels.
+        :type frames: numpy.ndarray
+        """
+        frames = np.atleast_2d(np.asarray(frames, dtype=np.float64))
+        if frames.shape[1] != self.channel_count:
+            raise BVHError("Expected {} channels per frame, got {}.".format(self.channel_count, frames.shape[1]))
+        if not len(frames):
+            return
+        # Format the whole chunk with one operation instead of line by line.
+        self._file.write((self._line_format * len(frames)) % tuple(frames.ravel().tolist()))
+        self.frame_count += len(frames)
+
+    def close(self):
+        """ Fill in the number of frames and close the file. """
+        if self._file.closed:
+            return
+        self._file.seek(self._frames_position)
+        self._file.write('{:<{}d}'.format(self.frame_count, self.FRAMES_WIDTH))
+        self._file.close()
+
+
+def write_bvh(fullpath, template, motion, frame_time, chunk_size=4096, **kwargs):
+    """
+    Write a skeleton template and its animation to a BVH file.
+    :param fullpath: full file path to where the BVH file should be saved.
+    :type fullpath: str
+    :param template: Skeleton template with the hierarchy and offsets in meter.
+    :type template: flexible_mocap.template.SkeletonTemplate
+    :param motion: Array of shape (frames, channels) or an iterable of such arrays, e.g. a generator of chunks.
+                   The channel layout is the one of BVHWriter.
+    :param frame_time: Duration of a frame in seconds.
+    :type frame_time: float
+    :param chunk_size: Number of frames of an array that are written at once.
+    :type chunk_size: int
+    :param kwargs: rotation_order, scale and precision, see BVHWriter.
+    :return: Number of frames written.
+    :rtype: int
+    """
+    with BVHWriter(fullpath, template, frame_time, **kwargs) as writer:
+        if isinstance(motion, np.ndarray):
+            array = motion
+            motion = (array[i:i + chunk_size] for i in range(0, len(array), chunk_size))
+        for frames in motion:
+            writer.write_frames(frames)
+        return writer.frame_count
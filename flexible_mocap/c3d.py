@@ -0,0 +1,354 @@
+"""
+Memory-mapped reader for C3D motion capture files.
+
+Only the header and the parameter section are parsed up front. Point data stays on disk and is
+decoded in chunks on request, so recordings of several GB can be processed without loading them.
+See https://www.c3d.org/docs/C3D_User_Guide.pdf for the file format.
+"""
+import struct
+
+import numpy as np
+
+BLOCK_SIZE = 512
+
+# Processor type stored in the 4th byte of the parameter section header.
+PROCESSOR_INTEL = 84
+PROCESSOR_DEC = 85
+PROCESSOR_MIPS = 86
+
+# Parameter data types.
+TYPE_CHAR = -1
+TYPE_BYTE = 1
+TYPE_INT = 2
+TYPE_FLOAT = 4
+
+
+class C3DError(Exception):
+    """ Raised when a file isn't a valid C3D file or uses unsupported features. """
+    pass
+
+
+def _dec_to_ieee(raw):
+    """
+    Convert DEC (VAX) single precision floats to IEEE floats.
+    :param raw: Array of little endian uint32 words as they were read from file.
+    :type raw: numpy.ndarray
+    :return: IEEE floats.
+    :rtype: numpy.ndarray
+    """
+    # DEC floats have their 16 bit words swapped and an exponent bias that's off by 2 compared to IEEE.
+    swapped = ((raw & 0xffff) << 16) | (raw >> 16)
+    return swapped.astype('u4').view('f4') / 4.0
+
+
+class C3DFile(object):
+    """
+    Read-only access to a C3D file.
+    Point data is memory-mapped and only decoded for the frames that are requested.
+
+    :ivar parameters: Dictionary of group name to dictionary of parameter name to value.
+    :ivar labels: Marker labels in the order of the point data.
+    :ivar frame_rate: Capture rate in Hz.
+    :ivar scale: Scale factor of point data. Negative values indicate floating point storage.
+    :ivar units: Units of the point coordinates, e.g. 'mm'.
+    :ivar first_frame: Number of the first frame in the file.
+    :ivar frame_count: Number of frames of point data available in the file.
+    :ivar point_count: Number of markers per frame.
+    """
+    def __init__(self, fullpath):
+        """
+        :param fullpath: full file path to the C3D file.
+        :type fullpath: str
+        """
+        self.fullpath = fullpath
+        self._mmap = np.memmap(fullpath, dtype='u1', mode='r')
+        if len(self._mmap) < BLOCK_SIZE or self._mmap[1] != 0x50:
+            raise C3DError("{} is not a C3D file.".format(fullpath))
+
+        param_block = int(self._mmap[0])
+        param_start = (param_block - 1) * BLOCK_SIZE
+        self.processor = int(self._mmap[param_start + 3])
+        if self.processor == PROCESSOR_MIPS:
+            self._endian = '>'
+        elif self.processor in (PROCESSOR_INTEL, PROCESSOR_DEC):
+            self._endian = '<'
+        else:
+            raise C3DError("Unknown processor type {} in {}.".format(self.processor, fullpath))
+
+        self._read_header()
+        param_blocks = int(self._mmap[param_start + 2])
+        self.parameters = self._read_parameters(param_start, param_blocks)
+        self._setup_points()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Release the memory map. Arrays returned by read_points stay valid. """
+        self._mmap = None
+        self._data = None
+
+    def _unpack(self, fmt, offset):
+        """ Unpack values from the memory map at offset with the file's byte order. """
+        size = struct.calcsize(self._endian + fmt)
+        values = struct.unpack(self._endian + fmt, self._mmap[offset:offset + size].tobytes())
+        if self.processor == PROCESSOR_DEC:
+            values = tuple(self._dec_float(v) if f == 'f' else v for f, v in zip(fmt, values))
+        return values
+
+    def _dec_float(self, value):
+        """ Convert a single float that was unpacked from a DEC file. """
+        raw = np.array([value], dtype='f4').view('u4')
+        return float(_dec_to_ieee(raw)[0])
+
+    def _read_header(self):
+        """ Read the header section (first block) of the file. """
+        (self.point_count,
+         self.analog_per_frame,
+         self.header_first_frame,
+         self.header_last_frame,
+         self.max_gap,
+         self.scale,
+         self.data_block,
+         self.analog_samples_per_frame,
+         self.frame_rate) = self._unpack('HHHHHfHHf', 2)
+
+    def _read_parameters(self, param_start, param_blocks):
+        """
+        Read all groups and parameters of the parameter section.
+        :param param_start: Byte offset of the parameter section.
+        :type param_start: int
+        :param param_blocks: Number of blocks in the parameter section.
+        :type param_blocks: int
+        :return: Dictionary of group name to dictionary of parameter name to value.
+        :rtype: dict
+        """
+        section = self._mmap[param_start:param_start + param_blocks * BLOCK_SIZE].tobytes()
+        group_names = dict()  # Group id to name.
+        group_params = dict()  # Group id to parameters, because parameters may precede their group.
+        pos = 4
+        while pos < len(section) - 2:
+            name_length, item_id = struct.unpack('bb', section[pos:pos + 2])
+            name_length = abs(name_length)  # Negative length marks a locked item.
+            if name_length == 0 or item_id == 0:
+                break
+            name = section[pos + 2:pos + 2 + name_length].decode('latin-1').upper()
+            pos += 2 + name_length
+            next_offset, = struct.unpack(self._endian + 'h', section[pos:pos + 2])
+            next_pos = pos + next_offset
+            if item_id < 0:
+                group_names[-item_id] = name
+                group_params.setdefault(-item_id, dict())
+            else:
+                group_params.setdefault(item_id, dict())[name] = self._read_parameter_value(section, pos + 2)
+            if next_offset == 0:  # Last item.
+                break
+            pos = next_pos
+
+        parameters = dict()
+        for group_id, params in group_params.items():
+            parameters[group_names.get(group_id, str(group_id))] = params
+        return parameters
+
+    def _read_parameter_value(self, section, pos):
+        """
+        Decode a parameter's data.
+        :param section: Bytes of the parameter section.
+        :type section: bytes
+        :param pos: Offset of the parameter's data type byte.
+        :type pos: int
+        :return: Scalar, string, list of strings or numpy array depending on type and dimensions.
+        """
+        data_type, num_dims = struct.unpack('bB', section[pos:pos + 2])
+        pos += 2
+        dims = list(struct.unpack('B' * num_dims, section[pos:pos + num_dims]))
+        pos += num_dims
+        element_size = abs(data_type)
+        count = int(np.prod(dims)) if dims else 1
+        raw = section[pos:pos + count * element_size]
+
+        if data_type == TYPE_CHAR:
+            if len(dims) <= 1:
+                return raw.decode('latin-1').strip()
+            # First dimension is the string length, the others are the shape of the string array.
+            length = dims[0]
+            return [raw[i:i + length].decode('latin-1').strip() for i in range(0, len(raw), length)]
+        elif data_type == TYPE_BYTE:
+            values = np.frombuffer(raw, dtype='u1')
+        elif data_type == TYPE_INT:
+            values = np.frombuffer(raw, dtype=self._endian + 'i2')
+        elif data_type == TYPE_FLOAT:
+            if self.processor == PROCESSOR_DEC:
+                values = _dec_to_ieee(np.frombuffer(raw, dtype='<u4'))
+            else:
+                values = np.frombuffer(raw, dtype=self._endian + 'f4')
+        else:
+            raise C3DError("Unknown parameter data type {} in {}.".format(data_type, self.fullpath))
+
+        if not dims:
+            return values[0].item()
+        # C3D stores arrays in Fortran order.
+        return values.reshape(dims[::-1])
+
+    def get(self, group, name, default=None):
+        """
+        Get a parameter's value.
+        :param group: Group name, e.g. 'POINT'.
+        :type group: str
+        :param name: Parameter name, e.g. 'LABELS'.
+        :type name: str
+        :param default: Returned when the parameter doesn't exist.
+        :return: Value of the parameter.
+        """
+        return self.parameters.get(group.upper(), dict()).get(name.upper(), default)
+
+    def _setup_points(self):
+        """ Collect point meta data from parameters and create the view onto the point data. """
+        self.scale = float(self.get('POINT', 'SCALE', self.scale))
+        self.frame_rate = float(self.get('POINT', 'RATE', self.frame_rate))
+        self.units = self.get('POINT', 'UNITS', '')
+        self.data_block = int(self.get('POINT', 'DATA_START', self.data_block))
+        point_count = self.get('POINT', 'USED', self.point_count)
+        self.point_count = int(point_count) & 0xffff  # Stored as signed int.
+
+        # Labels may continue in LABELS2, LABELS3, ... for more than 255 markers.
+        labels = list()
+        suffix = ''
+        index = 1
+        while self.get('POINT', 'LABELS' + suffix) is not None:
+            value = self.get('POINT', 'LABELS' + suffix)
+            labels.extend(value if isinstance(value, list) else [value])
+            index += 1
+            suffix = str(index)
+        labels = labels[:self.point_count]
+        # Unlabeled points get generic names.
+        labels.extend('M{:03d}'.format(i) for i in range(len(labels), self.point_count))
+        self.labels = labels
+
+        # The header only holds 16 bit frame numbers, long recordings store them in the TRIAL group.
+        start_field = self.get('TRIAL', 'ACTUAL_START_FIELD')
+        end_field = self.get('TRIAL', 'ACTUAL_END_FIELD')
+        if start_field is not None and end_field is not None:
+            start_field = start_field.astype('u2').astype('u4')
+            end_field = end_field.astype('u2').astype('u4')
+            self.first_frame = int(start_field[0] | (start_field[1] << 16))
+            last_frame = int(end_field[0] | (end_field[1] << 16))
+        else:
+            self.first_frame = self.header_first_frame
+            last_frame = self.header_last_frame
+            frames = self.get('POINT', 'FRAMES')
+            if frames is not None and int(frames) & 0xffff > last_frame - self.first_frame + 1:
+                last_frame = self.first_frame + (int(frames) & 0xffff) - 1
+
+        self.is_float = self.scale < 0.0
+        element_size = 4 if self.is_float else 2
+        self._frame_stride = self.point_count * 4 + self.analog_per_frame  # Values per frame.
+        data_start = (self.data_block - 1) * BLOCK_SIZE
+        stride_bytes = self._frame_stride * element_size
+        # Recordings that were cut off while writing don't contain all frames.
+        available = (len(self._mmap) - data_start) // stride_bytes if stride_bytes else 0
+        self.frame_count = max(0, min(last_frame - self.first_frame + 1, available))
+
+        if self.is_float and self.processor == PROCESSOR_DEC:
+            dtype = '<u4'
+        elif self.is_float:
+            dtype = self._endian + 'f4'
+        else:
+            dtype = self._endian + 'i2'
+        self._data = np.ndarray((self.frame_count, self._frame_stride),
+                                dtype=dtype,
+                                buffer=self._mmap,
+                                offset=data_start)
+
+    def read_points(self, start=0, stop=None, markers=None):
+        """
+        Decode point data of a range of frames.
+        Only the requested frames are read from disk.
+        :param start: Index of the first frame to read, relative to the first frame in the file.
+        :type start: int
+        :param stop: Index after the last frame to read. None reads until the end.
+        :type stop: int
+        :param markers: Optional indices of the markers to read. None reads all markers.
+        :type markers: list
+        :return: Array of shape (frames, markers, 4) with X, Y, Z and residual, and boolean visibility mask
+                 of shape (frames, markers). Residuals of invisible markers are -1.
+        :rtype: tuple
+        """
+        if self._data is None:
+            raise C3DError("File {} is closed.".format(self.fullpath))
+        frames = self._data[start:stop, :self.point_count * 4].reshape(-1, self.point_count, 4)
+        if markers is not None:
+            frames = frames[:, markers]
+
+        if self.processor == PROCESSOR_DEC and self.is_float:
+            raw = _dec_to_ieee(np.asarray(frames))
+        else:
+            raw = np.asarray(frames, dtype='f4')
+
+        # The 4th word holds the residual in the low byte and the camera mask in the high byte.
+        # A negative value marks the point as invalid.
+        residual_word = raw[..., 3]
+        visible = residual_word >= 0.0
+        residual = (residual_word.astype('i4') & 0xff).astype('f4') * abs(self.scale)
+
+        points = np.empty(raw.shape, dtype='f4')
+        if self.is_float:
+            points[..., :3] = raw[..., :3]
+        else:
+            points[..., :3] = raw[..., :3] * self.scale
+        points[..., 3] = np.where(visible, residual, -1.0)
+        return points, visible
+
+    def iter_points(self, chunk_size=4096, markers=None):
+        """
+        Generator over the point data in chunks of frames.
+        :param chunk_size: Number of frames per chunk.
+        :type chunk_size: int
+        :param markers: Optional indices of the markers to read. None reads all markers.
+        :type markers: list
+        :return: Yields tuples of index of the chunk's first frame, points and visibility mask.
+        :rtype: generator
+        """
+        for start in range(0, self.frame_count, chunk_size):
+            points, visible = self.read_points(start, start + chunk_size, markers)
+            yield start, points, visible
+
+    def marker_indices(self, names):
+        """
+        Get the indices of markers by their labels.
+        :param names: Marker labels. Labels with a namespace prefix (e.g. 'C3D:A0') are matched without it.
+        :type names: list
+        :return: List of indices, None for labels that weren't found.
+        :rtype: list
+        """
+        index = dict()
+        for i, label in enumerate(self.labels):
+            index.setdefault(label, i)
+            index.setdefault(label.split(':')[-1], i)
+        return [index.get(name, index.get(name.split(':')[-1])) for name in names]
+
+
+def read_c3d(fullpath, marker_names=None):
+    """
+    Read all point data from a C3D file.
+    :param fullpath: full file path to the C3D file.
+    :type fullpath: str
+    :param marker_names: Optional labels of markers to read. Missing markers raise a C3DError.
+    :type marker_names: list
+    :return: Points of shape (frames, markers, 4), visibility mask of shape (frames, markers) and marker labels.
+    :rtype: tuple
+    """
+    with C3DFile(fullpath) as c3d:
+        markers = None
+        labels = c3d.labels
+        if marker_names is not None:
+            markers = c3d.marker_indices(marker_names)
+            missing = [name for name, i in zip(marker_names, markers) if i is None]
+            if missing:
+                raise C3DError("Marker(s) {} couldn't be found in {}.".format(",".join(missing), fullpath))
+            labels = list(marker_names)
+        points, visible = c3d.read_points(markers=markers)
+    return points, visible, labels
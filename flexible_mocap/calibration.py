@@ -0,0 +1,208 @@
+"""
+Find frames in a recording that are suitable to calibrate a skeleton on.
+
+A good calibration frame has all of the template's markers visible, resembles the T-pose of the
+skeleton template and has little marker jitter. All frames are scored at once with array operations.
+"""
+import numpy as np
+
+from flexible_mocap.c3d import C3DError
+
+
+def get_marker_rest_positions(template):
+    """
+    Accumulate the offsets of the skeleton template to get each marker's position in the T-pose.
+    :param template: The skeleton template.
+    :type template: flexible_mocap.template.SkeletonTemplate
+    :return: Names of the markers and their positions relative to the root as array of shape (markers, 3).
+    :rtype: tuple
+    """
+    names = template.get_names('marker')
+    positions = template.get_global_offsets()
+    rest_positions = positions[[template.index[name] for name in names]].reshape(-1, 3)
+    return names, rest_positions
+
+
+def get_jitter(points, visible, window=5):
+    """
+    Mean acceleration magnitude of the markers per frame, averaged over a window of frames.
+    :param points: Marker positions of shape (frames, markers, 3).
+    :type points: numpy.ndarray
+    :param visible: Visibility mask of shape (frames, markers).
+    :type visible: numpy.ndarray
+    :param window: Number of frames to average over.
+    :type window: int
+    :return: Jitter per frame. Frames at which not all visible markers have neighbours are infinite.
+    :rtype: numpy.ndarray
+    """
+    frame_count = points.shape[0]
+    jitter = np.full(frame_count, np.inf)
+    if frame_count < 3:
+        return jitter
+    # Second finite difference, only valid where the marker is visible in all three frames.
+    acceleration = points[2:] + points[:-2]
+    acceleration -= points[1:-1]
+    acceleration -= points[1:-1]
+    valid = visible[2:] & visible[1:-1] & visible[:-2]
+    magnitude = np.sqrt(np.einsum('fmi,fmi->fm', acceleration, acceleration))
+    valid_count = valid.sum(axis=1)
+    per_frame = np.where(valid_count > 0,
+                         np.where(valid, magnitude, 0.0).sum(axis=1) / np.maximum(valid_count, 1),
+                         np.inf)
+    jitter[1:-1] = per_frame
+
+    window = max(1, min(int(window), frame_count))
+    if window > 1:
+        # Moving average by cumulative sums, infinite values propagate to their neighbourhood.
+        finite = np.isfinite(jitter)
+        cumsum = np.concatenate(([0.0], np.cumsum(np.where(finite, jitter, 0.0))))
+        bad = np.concatenate(([0], np.cumsum(~finite)))
+        half = window // 2
+        lower = np.clip(np.arange(frame_count) - half, 0, frame_count)
+        upper = np.clip(np.arange(frame_count) + window - half, 0, frame_count)
+        jitter = np.where(bad[upper] - bad[lower] > 0,
+                          np.inf,
+                          (cumsum[upper] - cumsum[lower]) / (upper - lower))
+    return jitter
+
+
+def _symmetric_eigenvalues(matrices):
+    """
+    Eigenvalues of symmetric 3x3 matrices in closed form (trigonometric solution of the characteristic polynomial).
+    Several times faster than numpy.linalg.eigvalsh for many small matrices.
+    :param matrices: Symmetric matrices of shape (n, 3, 3).
+    :type matrices: numpy.ndarray
+    :return: Eigenvalues of shape (n, 3) in ascending order.
+    :rtype: numpy.ndarray
+    """
+    a01, a02, a12 = matrices[:, 0, 1], matrices[:, 0, 2], matrices[:, 1, 2]
+    mean = (matrices[:, 0, 0] + matrices[:, 1, 1] + matrices[:, 2, 2]) / 3.0
+    # Eigenvalues of the matrix shifted by the mean eigenvalue and scaled by their spread are 2 cos(phi + k 2pi/3).
+    b00, b11, b22 = matrices[:, 0, 0] - mean, matrices[:, 1, 1] - mean, matrices[:, 2, 2] - mean
+    spread = np.sqrt((b00 * b00 + b11 * b11 + b22 * b22 + 2.0 * (a01 * a01 + a02 * a02 + a12 * a12)) / 6.0)
+    det = b00 * (b11 * b22 - a12 * a12) - a01 * (a01 * b22 - a12 * a02) + a02 * (a01 * a12 - b11 * a02)
+    half_det = det / (2.0 * np.where(spread > 0, spread, 1.0) ** 3)
+    phi = np.arccos(np.clip(half_det, -1.0, 1.0)) / 3.0
+    eigenvalues = np.empty((len(matrices), 3))
+    eigenvalues[:, 2] = mean + 2.0 * spread * np.cos(phi)
+    eigenvalues[:, 0] = mean + 2.0 * spread * np.cos(phi + 2.0 * np.pi / 3.0)
+    eigenvalues[:, 1] = 3.0 * mean - eigenvalues[:, 0] - eigenvalues[:, 2]
+    return eigenvalues
+
+
+def get_pose_error(points, visible, rest_positions):
+    """
+    Root mean square distance of the markers to the template pose after the best similarity transform per frame.
+    Since the template is scaled to fit, the error is in the units of points regardless of the template's units.
+    :param points: Marker positions of shape (frames, markers, 3).
+    :type points: numpy.ndarray
+    :param visible: Visibility mask of shape (frames, markers).
+    :type visible: numpy.ndarray
+    :param rest_positions: Marker positions of the template pose of shape (markers, 3).
+    :type rest_positions: numpy.ndarray
+    :return: Error per frame. Frames with less than 3 visible markers are infinite.
+    :rtype: numpy.ndarray
+    """
+    return _get_masked_pose_error(points * visible[..., np.newaxis].astype(points.dtype), visible, rest_positions)
+
+
+def _get_masked_pose_error(masked, visible, rest_positions):
+    """ get_pose_error of points whose invisible markers are 0. """
+    num_frames, num_markers = visible.shape
+    counts = np.count_nonzero(visible, axis=1).astype(np.float64)
+    safe_counts = np.maximum(counts, 1.0)
+
+    # The sums over the visible markers of each frame are matrix products, so they run as BLAS calls over all frames
+    # instead of as small products per frame: the cross-covariance with the template and the centroid from the
+    # points, the template's centroid and sum of squares from the visibility.
+    sums_matrix = np.zeros((num_markers, 3, 12), dtype=masked.dtype)
+    for j in range(3):
+        sums_matrix[:, j, j:9:3] = rest_positions
+        sums_matrix[:, j, 9 + j] = 1.0
+    sums = masked.reshape(num_frames, -1).dot(sums_matrix.reshape(-1, 12)).astype(np.float64)
+    rest_sums = visible.astype(np.float64).dot(np.column_stack([rest_positions,
+                                                                 np.einsum('mi,mi->m', rest_positions,
+                                                                           rest_positions)]))
+
+    # Centroids of the visible markers of each frame and of the corresponding template markers.
+    centroid = sums[:, 9:] / safe_counts[:, np.newaxis]
+    rest_centroid = rest_sums[:, :3] / safe_counts[:, np.newaxis]
+    # Sums of squares and cross-covariance around the centroids, expanded to avoid centering every marker.
+    sum_sq = np.einsum('fk,fk->f', masked.reshape(num_frames, -1), masked.reshape(num_frames, -1),
+                       dtype=np.float64) - counts * np.einsum('fi,fi->f', centroid, centroid)
+    rest_sq = rest_sums[:, 3] - counts * np.einsum('fi,fi->f', rest_centroid, rest_centroid)
+    covariance = sums[:, :9].reshape(-1, 3, 3) - \
+        counts[:, np.newaxis, np.newaxis] * rest_centroid[:, :, np.newaxis] * centroid[:, np.newaxis, :]
+
+    # Optimal rotation (Kabsch/Umeyama): the residual only depends on the singular values.
+    # Getting them from the closed form eigenvalues of the symmetric product is faster than a batched SVD.
+    eigenvalues = _symmetric_eigenvalues(np.einsum('fki,fkj->fij', covariance, covariance))
+    singular_values = np.sqrt(np.maximum(eigenvalues, 0.0))  # In ascending order.
+    determinant = np.einsum('fi,fi->f', covariance[:, 0], np.cross(covariance[:, 1], covariance[:, 2]))
+    reflection = determinant < 0
+    trace = singular_values[:, 2] + singular_values[:, 1] + np.where(reflection, -1.0, 1.0) * singular_values[:, 0]
+    residual = sum_sq - np.where(rest_sq > 0, trace ** 2 / np.maximum(rest_sq, 1e-12), 0.0)
+    error = np.sqrt(np.maximum(residual, 0.0) / safe_counts)
+    return np.where(counts >= 3, error, np.inf)
+
+
+def rank_calibration_frames(points, visible, rest_positions, jitter_weight=1.0, window=5):
+    """
+    Rank all frames by visibility, T-pose likeness and marker jitter.
+    Frames with more visible markers always rank higher. Among equally visible frames, the sum of the pose error
+    and the weighted jitter, each normalized by its median, decides.
+    :param points: Positions of the template's markers of shape (frames, markers, 3) or (frames, markers, 4).
+    :type points: numpy.ndarray
+    :param visible: Visibility mask of shape (frames, markers).
+    :type visible: numpy.ndarray
+    :param rest_positions: Marker positions of the template pose of shape (markers, 3) in the same marker order.
+    :type rest_positions: numpy.ndarray
+    :param jitter_weight: Importance of low jitter relative to T-pose likeness.
+    :type jitter_weight: float
+    :param window: Number of frames to average the jitter over.
+    :type window: int
+    :return: Frame indices ordered from best to worst and the score per frame (lower is better).
+    :rtype: tuple
+    """
+    points = np.asarray(points)
+    visible = np.asarray(visible, dtype=bool)
+    if points.shape[1] != len(rest_positions):
+        raise ValueError("Number of markers in points ({}) and template ({}) don't match.".format(points.shape[1],
+                                                                                                  len(rest_positions)))
+    # A copy of the positions with the invisible markers zeroed. The jitter only uses visible markers anyway.
+    points = np.array(points[..., :3])
+    points[~visible] = 0.0
+    pose_error = _get_masked_pose_error(points, visible, np.asarray(rest_positions, dtype=np.float64))
+    jitter = get_jitter(points, visible, window)
+
+    def normalized(values):
+        finite = values[np.isfinite(values)]
+        median = np.median(finite) if finite.size else 1.0
+        return values / median if median > 0 else values
+
+    score = normalized(pose_error) + jitter_weight * normalized(jitter)
+    visible_count = visible.sum(axis=1)
+    # lexsort sorts by the last key first.
+    order = np.lexsort((score, -visible_count))
+    return order, score
+
+
+def find_calibration_frame(template, c3d_file):
+    """
+    Find the best frame to calibrate the skeleton template on in a recording.
+    :param template: The skeleton template.
+    :type template: flexible_mocap.template.SkeletonTemplate
+    :param c3d_file: Recording containing the template's markers.
+    :type c3d_file: flexible_mocap.c3d.C3DFile
+    :return: Frame number of the best frame and whether all markers are visible in it.
+    :rtype: tuple
+    """
+    marker_names, rest_positions = get_marker_rest_positions(template)
+    indices = c3d_file.marker_indices(marker_names)
+    missing = [name for name, i in zip(marker_names, indices) if i is None]
+    if missing:
+        raise C3DError("Marker(s) {} couldn't be found in {}.".format(",".join(missing), c3d_file.fullpath))
+    points, visible = c3d_file.read_points(markers=indices)
+    order = rank_calibration_frames(points, visible, rest_positions)[0]
+    best = int(order[0])
+    return c3d_file.first_frame + best, bool(visible[best].all())
@@ -0,0 +1,125 @@
+"""
+Buffer scene mutations and apply them in one batch.
+
+Creating a skeleton joint by joint sets parents, translations and properties model by model, and MotionBuilder
+evaluates the scene after each change. The command buffer records these operations, keeps only the last value
+per model and attribute and applies everything between FBBeginChangeAllModels and FBEndChangeAllModels.
+"""
+import collections
+
+
+class SceneCommandBuffer(object):
+    """
+    Records create, parent, translate, pivot and attribute operations on models and applies them with flush().
+    Models are referred to by their label name (namespace:name), which they also get at creation.
+    """
+    def __init__(self, sdk):
+        """
+        :param sdk: Module that provides the model classes, FBVector3d, FBBeginChangeAllModels and
+                    FBEndChangeAllModels, i.e. pyfbsdk or flexible_mocap.standin.
+        """
+        self.sdk = sdk
+        self._creates = collections.OrderedDict()  # Label name to model class name.
+        self._parents = collections.OrderedDict()  # Label name to parent label name.
+        self._translations = dict()  # Label name to translation.
+        self._attributes = collections.OrderedDict()  # Label name to dictionary of attribute name to value.
+        self._pivot_resets = collections.OrderedDict()  # Label names of models whose pivots are reset.
+        self.models = dict()  # Label name to model, filled by flush.
+
+    def __len__(self):
+        """ Number of pending operations after coalescing. """
+        return (len(self._creates) + len(self._parents) + len(self._translations) +
+                sum(len(attributes) for attributes in self._attributes.values()) + len(self._pivot_resets))
+
+    def create(self, model_class, label_name):
+        """
+        Record the creation of a model.
+        :param model_class: Name of the model class, e.g. 'FBModelSkeleton'.
+        :type model_class: str
+        :param label_name: Name of the new model including namespace, e.g. 'Mocap:Hips'.
+        :type label_name: str
+        :return: label_name, to refer to the model in further operations.
+        :rtype: str
+        """
+        self._creates[label_name] = model_class
+        return label_name
+
+    def track(self, model):
+        """
+        Refer to a model that already exists in the scene, so it doesn't have to be searched for on flush.
+        :param model: Model in the scene.
+        :return: The model's label name, to refer to it in further operations.
+        :rtype: str
+        """
+        label_name = model.LongName
+        self.models[label_name] = model
+        return label_name
+
+    def set_parent(self, label_name, parent_label_name):
+        """ Record setting the parent of a model. The last parent recorded for a model wins. """
+        self._parents[label_name] = parent_label_name
+
+    def set_translation(self, label_name, translation):
+        """ Record setting the local translation of a model. The last translation recorded for a model wins. """
+        self._translations[label_name] = tuple(translation)
+
+    def set_attributes(self, label_name, **attributes):
+        """ Record setting attributes of a model, e.g. Size=100. The last value recorded for an attribute wins. """
+        self._attributes.setdefault(label_name, dict()).update(attributes)
+
+    def reset_pivots(self, label_name):
+        """ Record setting the rotation and scaling pivots of a model to 0. """
+        self._pivot_resets[label_name] = True
+
+    def _get_model(self, label_name):
+        """ Get a model that was created by the buffer or already exists in the scene. """
+        model = self.models.get(label_name)
+        if model is None:
+            model = self.sdk.FBFindModelByLabelName(label_name)
+            if model is None:
+                raise KeyError("Model {} neither exists nor was created.".format(label_name))
+            self.models[label_name] = model
+        return model
+
+    def flush(self):
+        """
+        Apply all recorded operations in one change block and clear the buffer.
+        Models are created first, then parented, translated, their attributes set and pivots reset.
+        :return: Dictionary of label name to model of all models the buffer created or modified.
+        :rtype: dict
+        """
+        sdk = self.sdk
+        sdk.FBBeginChangeAllModels()
+        try:
+            for label_name, model_class in self._creates.items():
+                self.models[label_name] = getattr(sdk, model_class)(label_name)
+            for label_name, parent_label_name in self._parents.items():
+                self._get_model(label_name).Parent = self._get_model(parent_label_name)
+            # The translation should be set after the parent has been assigned.
+            for label_name, translation in self._translations.items():
+                self._get_model(label_name).Translation = sdk.FBVector3d(translation)
+            for label_name, attributes in self._attributes.items():
+                model = self._get_model(label_name)
+                for name, value in attributes.items():
+                    setattr(model, name, value)
+            for label_name in self._pivot_resets:
+                # Rotation/Scaling pivot offsets are placed where offset would be globally, must be 0.
+                property_list = self._get_model(label_name).PropertyList
+                for property_name in ('Rotation Pivot', 'Scaling Pivot'):
+                    pivot = property_list.Find(property_name)
+                    if pivot is not None:
+                        pivot.Data = sdk.FBVector3d(0, 0, 0)
+        finally:
+            sdk.FBEndChangeAllModels()
+        models = self.models
+        self.clear()
+        return models
+
+    def clear(self):
+        """ Discard all recorded operations. """
+        self._creates.clear()
+        self._parents.clear()
+        self._translations.clear()
+        self._attributes.clear()
+        self._pivot_resets.clear()
+        self.models = dict()
@@ -0,0 +1,805 @@
+"""
+Headless core of the flexible mocap setup: template, skeleton, marker and mapping logic without user interface.
+
+It uses pyfbsdk inside MotionBuilder and the in-memory stand-in everywhere else (see flexible_mocap.sdk), so the
+same functions can run and be timed outside of MotionBuilder.
+"""
+from __future__ import print_function
+
+import os.path
+
+from flexible_mocap import sdk
+from flexible_mocap.sdk import *
+from flexible_mocap.commands import SceneCommandBuffer
+from flexible_mocap.goals import GOAL_TYPE_NAMES, get_goal_type
+from flexible_mocap.labeling import assign_labels
+from flexible_mocap.profiling import profiled
+from flexible_mocap.registry import SceneRegistry, get_label_name, walk_hierarchy
+from flexible_mocap.template import SkeletonTemplate, load_template, read_offsets, save_template
+
+
+# Index of the scene's models by name. Shared by the marker functions, rebuilt after the scene changed.
+scene_registry = SceneRegistry(FBSystem().Scene,
+                               ignored_changes=(FBSceneChangeType.kFBSceneChangeSelect,
+                                                FBSceneChangeType.kFBSceneChangeUnselect))
+
+
+# ---HELPER FUNCTIONS---
+def is_empty(any_structure):
+    """
+    Check if any object evaluates as being empty, e.g. empty list.
+    :param any_structure: Any object which can be interpreted as being emtpy.
+    :return: Is the structure empty or not?
+    :rtype: bool
+    """
+    if any_structure:
+        return False
+    else:
+        return True
+
+
+def deselect_all():
+    """Deselects each component in the scene.
+    """
+    for comp in FBSystem().Scene.Components:
+        comp.Selected = False
+      
+      
+# ---MARKER FUNCTIONS---
+def get_optical_markers(root=None, marker_list=None):
+    """
+    Recursively find models of subtype FBModelMarkerOptical in the scene.
+    :param root: Parent, is not returned. If None is given, the markers of the whole scene come from the scene_registry.
+    :param marker_list: Used in recursion. List to add markers to. If None is given, it'll be created.
+    :type marker_list: list
+    :return: List of optical markers in scene.
+    :rtype: list
+    """
+    if not root:
+        return scene_registry.get_optical_markers()
+    if marker_list is None:
+        marker_list = list()
+    for child in root.Children:
+        if child.FbxGetObjectSubType() == 'FBModelMarkerOptical':
+            marker_list.append(child)
+        get_optical_markers(child, marker_list)
+    return marker_list
+    
+
+def check_optical_markers(marker_names, marker_namespace):
+    """
+    Checks if FBModelMarkerOptical models by names in marker_names are in the scene.
+    Pops up an error message if markers weren't found.
+    :param marker_names: The names of the markers that should be in the scene.
+    :type marker_names: list
+    :param marker_namespace: In which Namespace the markers are located.
+    :type marker_namespace: str
+    :return: Do the names check out or not?
+    :rtype: bool
+    """
+    models = scene_registry.find_all(marker_names, marker_namespace, 'FBModelMarkerOptical')
+    fails = [name for name, model in zip(marker_names, models) if model is None]
+    if not is_empty(fails):
+        FBMessageBox("Error", "Marker(s) {} couldn't be found.".format(",".join(fails)), "Ok")
+        return False
+    else:
+        return True
+
+
+def read_marker_labels(filename):
+    """
+    Reads a text file and puts each line into a list.
+    :param filename: full file path to the text file.
+    :type filename: str
+    :return: List with marker labels.
+    :rtype: list
+    """
+    marker_labels = list()
+    try:
+        with open(filename, 'r') as f:
+            marker_labels = f.read().splitlines()
+            # Get rid of any quotation marks.
+            marker_labels[:] = [s.strip('\"') for s in marker_labels]
+    except IOError:
+        FBMessageBox("Error", "Could not read from file\n{}\nMake sure that the file exists.".format(filename), "OK")
+    return marker_labels
+
+
+def rename_markers(new_labels):
+    """
+    Gets markers from scene and renames them to the labels provided. Numbers must match.
+    :param new_labels: List of new names for the markers.
+    :type new_labels: list
+    """
+    markers = get_optical_markers()
+    if len(markers) != len(new_labels):
+        FBMessageBox("Error", "Number of labels must match number of markers.", "OK")
+    else:
+        for i, marker in enumerate(markers):
+            marker.Name = new_labels[i]
+        scene_registry.invalidate()
+
+
+def rename_markers_by_position(position_map, max_distance=10.0):
+    """
+    Gets markers from scene and renames them to the label of the closest position. Numbers don't need to match.
+    :param position_map: Dictionary of marker label to position, e.g. of the marker dummies.
+    :type position_map: dict
+    :param max_distance: Markers that are farther away than this (in cm) from any position keep their names.
+    :type max_distance: float
+    """
+    markers = get_optical_markers()
+    if is_empty(markers) or is_empty(position_map):
+        FBMessageBox("Error", "Need markers in the scene and marker dummies to rename markers by position.", "OK")
+        return
+    labels = list(position_map.keys())
+    label_positions = [[position_map[label][i] for i in range(3)] for label in labels]
+    marker_positions = list()
+    for marker in markers:
+        global_vector = FBVector3d()
+        marker.GetVector(global_vector)
+        marker_positions.append([global_vector[i] for i in range(3)])
+    
+    new_labels = assign_labels(marker_positions, label_positions, labels, max_distance)
+    fails = list()
+    for marker, label in zip(markers, new_labels):
+        if label is None:
+            fails.append(marker.Name)
+        else:
+            marker.Name = label
+    scene_registry.invalidate()
+    if not is_empty(fails):
+        FBMessageBox("Warning", "No label found for marker(s) {}.".format(",".join(fails)), "OK")
+            
+    
+def move_markers(position_map):
+    """
+    Takes the markers in the scene and if they appear in the position map, they will be moved.
+    :param position_map: Dictionary of marker label to position.
+    :type position_map: dict
+    """
+    markers = get_optical_markers()
+    for marker in markers:
+        if marker.Name in position_map:
+            position = FBVector3d(position_map[marker.Name])
+            marker.Translation = position
+    
+    
+# ---SKELETON FUNCTIONS---
+@profiled()
+def read_template_file(fullpath):
+    """
+    Read skeleton data from CSV file.
+    :param fullpath: full file path to the CSV file.
+    :type fullpath: str
+    :return: Skeleton template with information on joint's name, parent, offsets, bounds, type, rotation_mode.
+    :rtype: SkeletonTemplate
+    """
+    try:
+        return load_template(fullpath)
+    except IOError:
+        FBMessageBox("Error", "Could not read from file\n{}\nMake sure that the file exists.".format(fullpath), "OK")
+    except (KeyError, ValueError) as e:
+        FBMessageBox("Error", "Wrong file format\n{}".format(e), "OK")
+    return SkeletonTemplate.from_rows(list())
+
+
+@profiled()
+def write_template(fullpath, template):
+    """
+    Save data as CSV file.
+    :param fullpath: full file path to where the CSV file should be saved.
+    :type fullpath: str
+    :param template: Skeleton template with information for each joint.
+    :type template: SkeletonTemplate
+    """
+    try:
+        save_template(fullpath, template)
+    except IOError:
+        FBMessageBox("Error",
+                     "Could not write to file\n{}\nMake sure you have permission\nto write to folder.".format(fullpath),
+                     "Ok")
+
+
+def record_skeleton(command_buffer, namespace, template, create_marker_dummies=False):
+    """
+    Record the creation of a skeleton in a T-pose facing along the positive Z axis in a command buffer.
+    :param command_buffer: Buffer to record the scene operations in.
+    :type command_buffer: SceneCommandBuffer
+    :param namespace: namespace to precede the joint names.
+    :type namespace: str
+    :param template: joint data
+    :type template: SkeletonTemplate
+    :param create_marker_dummies: Whether to create dummy joints for the estimated marker positions or not.
+    :type create_marker_dummies: bool
+    :return: Label names of the joints that will be created when the buffer is flushed.
+    :rtype: list
+    """
+    label_names = {}  # A dictionary of joint name to label name of the joints to create.
+    # Empty offsets, e.g. of root joints, are NaN. Convert to cm.
+    translations = (template.offsets * 100.0).tolist()
+    # Parents come first in template order, so the parent/child relationships can be recorded right away.
+    for i in template.order:
+        joint_info = template[i]
+        name = joint_info.name
+        joint_type = joint_info.type
+        if not joint_info.parent:
+            # If it is the root node, create an FBModelRoot.
+            model_class = 'FBModelRoot'
+        else:
+            # Otherwise, create an FBModelSkeleton.
+            if not create_marker_dummies and joint_type == 'marker':
+                continue
+            model_class = 'FBModelSkeleton'
+        
+        # Create the joint in the namespace right away, renaming it later appends a number to the name.
+        label_name = command_buffer.create(model_class, get_label_name(name, namespace))
+        label_names[name] = label_name
+        
+        # Only assign a parent if it exists.
+        if joint_info.parent in label_names:
+            command_buffer.set_parent(label_name, label_names[joint_info.parent])
+        
+        translation = translations[i]
+        if translation[0] != translation[0]:  # NaN, e.g. root joints that don't have an offset.
+            translation = (0.0, 0.0, 0.0)
+        command_buffer.set_translation(label_name, translation)
+        
+        if joint_type == 'marker':  # Differentiate markers from joints.
+            color = FBColor(1.0, 0.0, 0)
+        else:
+            color = FBColor(0.3, 0.8, 1)
+        # Arbitrary size: big enough to see in viewport. Make the joint visible in the scene.
+        command_buffer.set_attributes(label_name, Size=100, Show=True, Color=color)
+        command_buffer.reset_pivots(label_name)
+    return [label_names[name] for name in template.names if name in label_names]
+
+
+def create_skeletons(namespaces, template, create_marker_dummies=False):
+    """
+    Create a skeleton for each namespace, e.g. for several performers, in a single batch of scene changes.
+    :param namespaces: namespaces to precede the joint names of each skeleton.
+    :type namespaces: list
+    :param template: joint data
+    :type template: SkeletonTemplate
+    :param create_marker_dummies: Whether to create dummy joints for the estimated marker positions or not.
+    :type create_marker_dummies: bool
+    :return: List of FBModelSkeleton nodes for each namespace.
+    :rtype: list
+    """
+    # If there is already a Namespace of that name, show warning and abort.
+    for namespace in namespaces:
+        if FBSystem().Scene.NamespaceExist(namespace):
+            FBMessageBox("Warning",
+                         "{} namespace already exists.\nChange or delete the namespace\n"
+                         "before creating a new skeleton.".format(namespace),
+                         "Ok")
+            return None
+    
+    # If there's no template, show warning and abort
+    if is_empty(template):
+        FBMessageBox("Warning", "No skeleton definition.", "Ok")
+        return None
+    
+    command_buffer = SceneCommandBuffer(sdk)
+    skeletons = [record_skeleton(command_buffer, namespace, template, create_marker_dummies)
+                 for namespace in namespaces]
+    models = command_buffer.flush()
+    scene_registry.invalidate()
+    return [[models[label_name] for label_name in label_names] for label_names in skeletons]
+
+
+@profiled()
+def create_skeleton(namespace, template, create_marker_dummies=False):
+    """
+    Create a joint_map in a T-pose facing along the positive Z axis.
+    :param namespace: namespace to precede the joint names.
+    :type namespace: str
+    :param template: joint data
+    :type template: SkeletonTemplate
+    :param create_marker_dummies: Whether to create dummy joints for the estimated marker positions or not.
+    :type create_marker_dummies: bool
+    :return: List of FBModelSkeleton nodes.
+    :rtype: list
+    """
+    skeletons = create_skeletons([namespace], template, create_marker_dummies)
+    if skeletons is None:
+        return None
+    return skeletons[0]
+        
+
+@profiled()
+def get_skeleton_data():
+    """
+    Get information on selected joint and its children as skeleton template.
+    :return: Skeleton template of selected joint and its children.
+    :rtype: SkeletonTemplate
+    """
+    selected_models = FBModelList()
+    FBGetSelectedModels(selected_models)
+    if len(selected_models) != 1:
+        FBMessageBox("Warning", "Please only select the root joint.", "Ok")
+        return None
+    joint_list = get_joints_info(selected_models[0])
+    return SkeletonTemplate.from_rows(joint_list)
+
+
+def get_selected_models():
+    """
+    Get the selected models. Pops up a warning if nothing is selected.
+    :return: List of selected models, None if nothing is selected.
+    :rtype: list
+    """
+    selected_models = FBModelList()
+    FBGetSelectedModels(selected_models)
+    if len(selected_models) == 0:
+        FBMessageBox("Warning", "Please select at least one joint.", "Ok")
+        return None
+    return list(selected_models)
+
+
+def get_joint_list(node=None, joint_list=None):
+    """
+    Get all the joints in selected hierarchy.
+    :param node: Joint whose hierarchy to get. If None is given, the hierarchies of the selected models are used.
+    :param joint_list: List to add joints to. If None is given, it'll be created.
+    :return: A list of FBModelSkeleton nodes, parents before their children and without duplicates.
+    :rtype: list
+    """
+    if joint_list is None:
+        joint_list = list()
+    
+    if node is None:
+        roots = get_selected_models()
+        if roots is None:
+            return None
+    else:
+        roots = [node]
+    joint_list.extend(walk_hierarchy(roots))
+    return joint_list
+    
+    
+def zero_joint_rotation(node=None, command_buffer=None):
+    """
+    Sets rotation of selected joint and child-nodes to 0,0,0.
+    :param node: Joint whose hierarchy to reset. If None is given, the hierarchies of the selected models are used.
+    :param command_buffer: Buffer to record the rotation changes in. If None is given, the changes are applied
+                           right away in one batch.
+    :type command_buffer: SceneCommandBuffer
+    """
+    joints = get_joint_list(node)
+    if joints is None:
+        return None
+    buffer = command_buffer if command_buffer is not None else SceneCommandBuffer(sdk)
+    for joint in joints:
+        buffer.set_attributes(buffer.track(joint), Rotation=FBVector3d(0.0, 0.0, 0.0))
+    if command_buffer is None:
+        buffer.flush()
+
+
+def get_bounds(offset):
+    """
+    Returns a dictionary with min/max bounds for x,y,z around the offset-vector.
+    :param offset: Vector describing 3D coordinates.
+    :type offset: FBVector3d
+    :return: bounds in meter as dictionary.
+    :rtype: dict
+    """
+    bounds = dict()
+    for i, val in enumerate(offset):
+        axis = chr(120 + i)  # x, y, or z
+        bounds['bound_{}_min'.format(axis)] = (offset[i] - 20.0) / 100.0
+        bounds['bound_{}_max'.format(axis)] = (offset[i] + 20.0) / 100.0
+    return bounds
+
+
+def get_joints_info(node, joint_list=None):
+    """
+    Walk through the skeleton from given node downwards and collect information on the joints.
+    Save this information as dictionaries in a list, parents before their children.
+    Each node's global position is only queried once and handed down to its children.
+    :param node: starting node of the topology.
+    :type node: FBModelSkeleton
+    :param joint_list: List to add joints to. If None is given, it'll be created.
+    :return: List of dictionaries with information on joints.
+    :rtype: list
+    """
+    if joint_list is None:
+        joint_list = list()
+    # Nodes to visit with their parent's global position, None if it wasn't queried yet.
+    stack = [(node, None)]
+    while stack:
+        node, parent_translation = stack.pop()
+        # We only want skeleton nodes.
+        node_type = node.FbxGetObjectSubType()
+        if node_type != 'FBModelRoot' and node_type != 'FBModelSkeleton':
+            continue
+        entry = {'name': node.Name}
+        try:
+            entry['parent'] = node.Parent.Name
+        except AttributeError:  # root has no parent.
+            pass
+        try:
+            if node.Color == FBColor(1.0, 0.0, 0.0):
+                entry['type'] = 'marker'
+                entry['rotation_mode'] = ''
+            else:
+                entry['type'] = 'bone'
+                if node.RotationActive:
+                    entry['rotation_mode'] = 'hinge'  # Todo: or 'twist', by checking limits? Check limits to determine if hingeX, hingeY, or hingeZ.
+                else:
+                    entry['rotation_mode'] = 'ball'
+        except AttributeError:  # FBModelRoot has no Attribute Color
+            pass
+        node_translation = FBVector3d()
+        node.GetVector(node_translation)
+        if node.Parent:
+            if parent_translation is None:  # Only the starting node's parent hasn't been visited.
+                parent_translation = FBVector3d()
+                node.Parent.GetVector(parent_translation)
+            offset = node_translation - parent_translation
+            entry['offset_x'] = offset[0] / 100.0
+            entry['offset_y'] = offset[1] / 100.0
+            entry['offset_z'] = offset[2] / 100.0
+        else:  # Must be root.
+            entry['parent'] = ''
+            entry['type'] = 'bone'
+            offset = None
+            entry['offset_x'] = ''
+            entry['offset_y'] = ''
+            entry['offset_z'] = ''
+            entry['rotation_mode'] = ''
+        
+        children = list(node.Children)
+        if len(children) == 0 and entry['type'] == 'bone':
+            entry['type'] = 'end'
+            entry['rotation_mode'] = ''
+        else:
+            if not is_empty(offset):
+                entry.update(get_bounds(offset))
+        
+        joint_list.append(entry)
+        # Reversed, so the children are visited in their order.
+        stack.extend((child, node_translation) for child in reversed(children))
+    return joint_list
+        
+
+def get_estimated_offsets(fullfilepath):
+    """
+    Load joint estimations from csv file.
+    :param fullfilepath: full path to csv file
+    :type fullfilepath: str
+    :return: Joint names and their offsets as array of shape (joints, 3), None if the file couldn't be read.
+    :rtype: tuple
+    """
+    try:
+        return read_offsets(fullfilepath)
+    except IOError:
+        FBMessageBox("Error", "Estimation file {}\n could not be read.".format(os.path.basename(fullfilepath)), "OK")
+    except ValueError as e:
+        FBMessageBox("Error", "Wrong file format\n{}".format(e), "OK")
+    return None
+
+
+def apply_estimated_offsets(template, names, offsets):
+    """
+    Apply estimated offsets to the skeleton data. Pops up a warning for joints that aren't in the skeleton data and
+    for joints of the skeleton data that have no estimated offset.
+    :param template: Skeleton template to apply the offsets to.
+    :type template: SkeletonTemplate
+    :param names: Joint names.
+    :type names: list
+    :param offsets: Offsets of shape (len(names), 3).
+    :type offsets: numpy.ndarray
+    :return: Names of the unknown joints and of the joints without offset.
+    :rtype: tuple
+    """
+    unknown = template.apply_offsets(names, offsets)
+    missing = template.get_missing_offsets(names)
+    warnings = list()
+    if not is_empty(unknown):
+        warnings.append("Joint(s) {} aren't in the skeleton data.".format(",".join(unknown)))
+    if not is_empty(missing):
+        warnings.append("Joint(s) {} have no estimated offset and keep their template offset.".format(
+            ",".join(missing)))
+    if warnings:
+        FBMessageBox("Warning", "\n".join(warnings), "OK")
+    return unknown, missing
+
+
+@profiled()
+def characterize_skeleton(char_name, joints, create_control_rig=False):
+    """
+    Characterize the skeleton and create a control rig if necessary.
+    :param char_name: Name of the character.
+    :type char_name: str
+    :param joints: List of FBModelSkeleton nodes.
+    :type joints: list
+    :param create_control_rig: Whether to create a control rig.
+    :type create_control_rig: bool
+    :return: character
+    :rtype: FBCharacter
+    """
+    # Create a new character.
+    character = FBCharacter(char_name)
+    FBApplication().CurrentCharacter = character
+    
+    # Add each joint in our list to the character.
+    fails = list()
+    for joint in joints:
+        slot = character.PropertyList.Find(joint.Name + 'Link')  # todo: This only works for HIK naming convention. Prompt for preset?
+        if slot is not None:
+            slot.append(joint)
+        else:
+            fails.append(joint.Name)
+    if not is_empty(fails):
+        print("While characterization, no slots were found for {}.".format(",".join(fails)))
+    
+    # Flag that the character has been characterized.
+    character.SetCharacterizeOn(True)
+    
+    if create_control_rig:
+        # Create a control rig using Forward and Inverse Kinematics
+        character.CreateControlRig(create_control_rig)
+        # Set the control rig to active.
+        character.ActiveInput = create_control_rig
+    
+    return character
+
+
+# Just for visual style and to prevent error when no mesh is attached to skeleton
+def create_visualization_primitive(geometry='Sphere'):
+    """
+    Create a model which will be applied to each joint in the skeleton.
+    :param geometry: Which form of primitive model should be created.
+    :type geometry: str
+    :return: model
+    """
+    # Create a sphere.
+    model = FBCreateObject('Browsing/Templates/Elements/Primitives', geometry, geometry)
+    model.Scaling = FBVector3d(0.5, 0.5, 0.5)
+    
+    # Define a slightly reflective dark material.
+    material = FBMaterial('SkeletonMaterial')
+    material.Ambient = FBColor(0, 0, 0)
+    material.Diffuse = FBColor(0, 0.04, 0.08)
+    material.Specular = FBColor(0, 0.7, 0.86)
+    material.Shininess = 100
+    model.Materials.append(material)
+    
+    # Create a cartoon-like shader.
+    shader = FBCreateObject('Browsing/Templates/Shading Elements/Shaders', 'Edge Cartoon', 'SkeletonShader')
+    
+    # For a list of all the shader's properties do:
+    # for item in shader.PropertyList:
+    #    print(item.Name)
+    alias_prop = shader.PropertyList.Find('Antialiasing')
+    alias_prop.Data = True
+    color_prop = shader.PropertyList.Find('EdgeColor')
+    color_prop.Data = FBColor(0, 0.83, 1)
+    width_prop = shader.PropertyList.Find('EdgeWidth')
+    width_prop.Data = 8
+    
+    # Append the cartoon shader to the model.
+    model.Shaders.append(shader)
+    
+    # The default shader must also be applied to the model.
+    default_shader = FBSystem().Scene.Shaders[0]
+    model.Shaders.append(default_shader)
+    
+    # Use the default shading mode.
+    model.ShadingMode = FBModelShadingMode.kFBModelShadingDefault
+    
+    return model
+
+
+@profiled()
+def apply_model_to_skeleton(skeleton_node, model):
+    """
+    Apply a copy of model to each joint in the skeleton.
+    :param skeleton_node: Reference to root skeleton node in the scene.
+    :param model: Reference to the model that should be applied.
+    """
+    # Do not apply the model to the Reference node or anything below it.
+    joints = walk_hierarchy([skeleton_node], prune=lambda node: node.Name.lower() == 'reference')
+    # Do not apply model to leaves. Collect the joints before the copies become their children.
+    joints = [joint for joint in joints if len(joint.Children) > 0]
+    FBBeginChangeAllModels()
+    try:
+        for joint in joints:
+            # Parent the copied model to the joint.
+            new_model = model.Clone()
+            new_model.Parent = joint
+            new_model.Show = True
+            
+            # Use the joint name as a prefix.
+            new_model.Name = joint.Name + "_" + model.Name
+            new_model.ProcessObjectNamespace(FBNamespaceAction.kFBConcatNamespace, joint.OwnerNamespace.Name)
+            
+            # Reset the model's translation to place it at the same
+            # location as its parent joint.
+            new_model.Translation = FBVector3d(0, 0, 0)  # ToDo: Copy rotation in case model is not a sphere? Scale model to bone length.
+    finally:
+        FBEndChangeAllModels()
+
+
+@profiled()
+def map_markers_to_character(template, marker_namespace, character=None):
+    """
+    Connect the markers to the skeleton with flexible mocap workflow.
+    :param template: Skeleton template with information for each joint's name, parent, offsets, type, rotation_mode
+    :type template: SkeletonTemplate
+    :param character: Character whose joints shall be constrained to markers.
+    :return: Whether the mapping was successful or not.
+    :rtype: bool
+    """
+    if character is None:
+        character = FBApplication().CurrentCharacter
+    # If there's still no character, abort.
+    if character is None:
+        FBMessageBox("Warning", "No character to map markers to!\nCharacterize skeleton first.", "Ok")
+        return False
+    
+    # Get rid of any existing MarkerSet first and create new one.
+    marker_set = character.GetCharacterMarkerSet(True)
+    if marker_set:
+        marker_set.FBDelete()
+    character.CreateCharacterMarkerSet(True)
+    marker_set = character.GetCharacterMarkerSet(True)
+    
+    # Find the marker models in the scene before connecting them changes the scene.
+    all_marker_names = template.get_names('marker')
+    marker_model_map = dict(zip(all_marker_names, scene_registry.find_all(all_marker_names, marker_namespace)))
+    
+    # Whatever THAT does, but it's in the sample code, so...
+    FBBeginChangeAllModels()
+    
+    # Fill the markerset properties.
+    for prop in marker_set.PropertyList:
+        if prop.Name.endswith('.Markers'):
+            joint_name = prop.Name.replace('.Markers', '')
+            # Todo: Doesn't this require joints to follow HIK naming convention? Need Mapping?
+            # Entries that have this joint as parent and are of type marker.
+            marker_names = template.get_children(joint_name, 'marker')
+            # If the joint has no markers as children, or if there's no such joint in the list, we can't map to it.
+            if is_empty(marker_names):
+                continue
+            # Find the matching marker models in the scene.
+            marker_models = [marker_model_map[name] for name in marker_names if marker_model_map[name]]
+            num_markers = len(marker_models)
+            
+            # Begins a change on multiple plugs.
+            prop.BeginChange()
+            prop.DisconnectAllSrc()
+            # Connect the marker models to the joint.
+            for marker in marker_models:
+                prop.ConnectSrc(marker)
+            
+            # Ends a change on multiple plugs.
+            prop.EndChange()
+            
+            # Set the type of goal for the joint.
+            constraint_type = marker_set.PropertyList.Find(prop.Name.replace('.Markers', '.Constraint'))
+            if constraint_type is not None and num_markers > 0:
+                # Expects an integer
+                constraint_type.Data = get_goal_type(num_markers)
+    
+    # Again, I have no idea...
+    FBEndChangeAllModels()
+    return True
+
+
+# ---SPREADSHEET FUNCTIONS---
+def spreadInit(spread):
+    """
+    Deletes spreadsheet content and resets columns.
+    :param spread: spread sheet instance.
+    """
+    # Delete the previous content.
+    spread.Clear()
+    
+    spread.GetColumn(-1).Width = 100
+    spread.ColumnAdd("Parent")
+    spread.GetColumn(0).Width = 100
+    spread.ColumnAdd("Type")
+    spread.GetColumn(1).Width = 80
+    spread.ColumnAdd("Rotation Mode")
+    spread.GetColumn(2).Width = 80
+    spread.ColumnAdd("rel. X")
+    spread.GetColumn(3).Width = 60
+    spread.ColumnAdd("rel. Y")
+    spread.GetColumn(4).Width = 60
+    spread.ColumnAdd("rel. Z")
+    spread.GetColumn(5).Width = 60
+    spread.ColumnAdd("Constraint")
+    spread.GetColumn(6).Width = 150
+
+
+def get_spreadsheet_rows(template):
+    """
+    Get the content of the spreadsheet for a skeleton template.
+    :param template: Skeleton template with information on joint's name, parent, offsets, type, rotation_mode.
+    :type template: SkeletonTemplate
+    :return: List of joint name and tuple of cell values for each row.
+    :rtype: list
+    """
+    if not template:
+        return list()
+    # Empty offsets are NaN and get empty cells.
+    offsets = [['' if v != v else v for v in offset] for offset in template.offsets.tolist()]
+    rows = list()
+    for i, name in enumerate(template.names):
+        # Show the type of constraint the markers will put on the joint.
+        goal_type = get_goal_type(len(template.get_children(name, 'marker')))
+        rows.append((name, (template.parents[i], template.types[i], template.rotation_modes[i],
+                            offsets[i][0], offsets[i][1], offsets[i][2], GOAL_TYPE_NAMES.get(goal_type, ''))))
+    return rows
+
+
+def update_spreadsheet(spread, template):
+    """
+    Resets the spreadsheet and fills the cells with data from the skeleton template.
+    :param spread: spreadsheet instance.
+    :param template: Skeleton template with information on joint's name, parent, offsets, type, rotation_mode.
+    :type template: SkeletonTemplate
+    """
+    spreadInit(spread)
+    
+    for rowRefIndex, (name, cells) in enumerate(get_spreadsheet_rows(template)):
+        # Add a joint.
+        spread.RowAdd(name, rowRefIndex)
+        for axis in range(3):
+            spread.GetSpreadCell(rowRefIndex, 3 + axis).Style = FBCellStyle.kFBCellStyleDouble
+        # Set cell values.
+        for column, value in enumerate(cells):
+            spread.SetCellValue(rowRefIndex, column, value)
+        # todo Radiobutton for 3 options for contraint?
+
+
+class SpreadsheetView(object):
+    """
+    Keeps the spreadsheet in sync with a skeleton template by only writing the cells that changed since the last
+    update. Rows can't be removed from an FBSpread, so removed or reordered joints reset the spreadsheet.
+    """
+    def __init__(self, spread):
+        """
+        :param spread: spreadsheet instance.
+        """
+        self.spread = spread
+        self.rows = list()  # Joint name and cell values of each row that's shown.
+        spreadInit(spread)
+
+    def clear(self):
+        """ Delete all rows. """
+        spreadInit(self.spread)
+        self.rows = list()
+
+    def update(self, template):
+        """
+        Show a skeleton template. Only rows that were added and cells whose values changed are written.
+        :param template: Skeleton template with information on joint's name, parent, offsets, type, rotation_mode.
+        :type template: SkeletonTemplate
+        :return: Number of cells that were written.
+        :rtype: int
+        """
+        rows = get_spreadsheet_rows(template)
+        shown_names = [name for name, cells in self.rows]
+        if [name for name, cells in rows[:len(shown_names)]] != shown_names:
+            self.clear()
+        spread = self.spread
+        num_writes = 0
+        for rowRefIndex, (name, cells) in enumerate(rows):
+            if rowRefIndex < len(self.rows):
+                shown_cells = self.rows[rowRefIndex][1]
+            else:
+                # Add a joint.
+                spread.RowAdd(name, rowRefIndex)
+                for axis in range(3):
+                    spread.GetSpreadCell(rowRefIndex, 3 + axis).Style = FBCellStyle.kFBCellStyleDouble
+                shown_cells = (None,) * len(cells)
+            for column, value in enumerate(cells):
+                if value != shown_cells[column]:
+                    spread.SetCellValue(rowRefIndex, column, value)
+                    num_writes += 1
+        self.rows = rows
+        return num_writes
@@ -0,0 +1,318 @@
+"""
+Streaming filters for live marker frames, between the marker stream and the solver.
+
+OneEuroFilter smooths jitter while keeping fast movements responsive, CriticallyDampedPredictor estimates velocities
+and extrapolates the markers by a look-ahead time to make up for the latency of the pipeline. Both process all
+markers of a frame as one array and keep their state in preallocated arrays. Markers that aren't visible keep their
+last state and restart from their measurement when they reappear.
+
+A recording can be replayed through the filters offline to tune them:
+    python -m flexible_mocap.filtering recording.c3d [--look-ahead 0.02]
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import sys
+
+import numpy as np
+
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.stream import UNIT_SCALES
+
+
+def _smoothing_factor(cutoff, dt):
+    """ Smoothing factor of an exponential filter with cutoff frequency in Hz, for arrays and scalars. """
+    tau = 1.0 / (2.0 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter(object):
+    """
+    One Euro filter (Casiez et al. 2012) on 3D positions. The cutoff frequency rises with the speed of each marker,
+    so slow movements are smoothed strongly and fast movements lag little.
+
+    :ivar positions: Filtered positions of shape shape + (3,).
+    :ivar velocities: Filtered velocities of the same shape.
+    :ivar active: Which markers have a state, shape shape.
+    """
+    def __init__(self, shape, frame_rate, min_cutoff=1.0, beta=20.0, derivative_cutoff=1.0):
+        """
+        :param shape: Shape of the markers, e.g. (markers,) or (performers, markers).
+        :type shape: tuple
+        :param frame_rate: Frames per second, used when no time step is given to update.
+        :type frame_rate: float
+        :param min_cutoff: Cutoff frequency in Hz of still markers. Lower values smooth more.
+        :type min_cutoff: float
+        :param beta: Increase of the cutoff frequency per unit of speed (per m/s for points in meter).
+                     Higher values lag less.
+        :type beta: float
+        :param derivative_cutoff: Cutoff frequency in Hz of the velocities the speed is taken from.
+        :type derivative_cutoff: float
+        """
+        shape = tuple(np.atleast_1d(shape))
+        self.dt = 1.0 / frame_rate
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.positions = np.zeros(shape + (3,))
+        self.velocities = np.zeros(shape + (3,))
+        self.active = np.zeros(shape, dtype=bool)
+        # Buffers of the intermediate results.
+        self._delta = np.zeros(shape + (3,))
+        self._speed = np.zeros(shape)
+        self._alpha = np.zeros(shape)
+        self._update = np.zeros(shape, dtype=bool)
+
+    def reset(self):
+        self.active[:] = False
+
+    def update(self, positions, visible, dt=None):
+        """
+        Filter a frame.
+        :param positions: Measured positions of shape shape + (3,).
+        :type positions: numpy.ndarray
+        :param visible: Which markers were measured, shape shape.
+        :type visible: numpy.ndarray
+        :param dt: Seconds since the previous frame. Defaults to 1 / frame_rate.
+        :type dt: float
+        :return: The filtered positions, overwritten by the next call.
+        :rtype: numpy.ndarray
+        """
+        dt = self.dt if dt is None else dt
+        # Markers that (re)appear start at their measurement.
+        np.greater(visible, self.active, out=self._update)
+        self.positions[self._update] = positions[self._update]
+        self.velocities[self._update] = 0.0
+        np.logical_and(visible, self.active, out=self._update)
+        np.copyto(self.active, visible)
+
+        update = self._update[..., np.newaxis]
+        delta = self._delta
+        np.subtract(positions, self.positions, out=delta)
+        # Smoothed velocities, then their speed sets each marker's cutoff.
+        delta /= dt
+        delta -= self.velocities
+        delta *= _smoothing_factor(self.derivative_cutoff, dt)
+        np.add(self.velocities, delta, out=self.velocities, where=update)
+        np.einsum('...i,...i->...', self.velocities, self.velocities, out=self._speed)
+        np.sqrt(self._speed, out=self._speed)
+        # alpha = 1 / (1 + tau / dt) with tau = 1 / (2 pi cutoff).
+        cutoff = self._speed
+        cutoff *= self.beta
+        cutoff += self.min_cutoff
+        cutoff *= 2.0 * math.pi * dt
+        np.add(cutoff, 1.0, out=self._alpha)
+        np.divide(cutoff, self._alpha, out=self._alpha)
+        np.subtract(positions, self.positions, out=delta)
+        delta *= self._alpha[..., np.newaxis]
+        np.add(self.positions, delta, out=self.positions, where=update)
+        return self.positions
+
+
+class CriticallyDampedPredictor(object):
+    """
+    Critically damped alpha-beta (g-h) filter that tracks positions and velocities and extrapolates them.
+    Both gains follow from one smoothing parameter theta: g = 1 - theta^2 and h = (1 - theta)^2.
+
+    :ivar positions: Estimated positions of shape shape + (3,).
+    :ivar velocities: Estimated velocities of the same shape.
+    :ivar predictions: Positions extrapolated by the look-ahead time.
+    :ivar active: Which markers have a state, shape shape.
+    """
+    def __init__(self, shape, frame_rate, theta=0.5, look_ahead=0.0):
+        """
+        :param shape: Shape of the markers, e.g. (markers,) or (performers, markers).
+        :type shape: tuple
+        :param frame_rate: Frames per second, used when no time step is given to update.
+        :type frame_rate: float
+        :param theta: Smoothing between 0 (follow the measurements) and 1 (ignore them).
+        :type theta: float
+        :param look_ahead: Seconds to extrapolate, e.g. the latency from capture to display.
+        :type look_ahead: float
+        """
+        if not 0.0 <= theta < 1.0:
+            raise ValueError("theta must be in [0, 1).")
+        shape = tuple(np.atleast_1d(shape))
+        self.dt = 1.0 / frame_rate
+        self.theta = theta
+        self.look_ahead = look_ahead
+        self.positions = np.zeros(shape + (3,))
+        self.velocities = np.zeros(shape + (3,))
+        self.predictions = np.zeros(shape + (3,))
+        self.active = np.zeros(shape, dtype=bool)
+        self._residual = np.zeros(shape + (3,))
+        self._correction = np.zeros(shape + (3,))
+        self._update = np.zeros(shape, dtype=bool)
+
+    @property
+    def gains(self):
+        return 1.0 - self.theta ** 2, (1.0 - self.theta) ** 2
+
+    def reset(self):
+        self.active[:] = False
+
+    def update(self, positions, visible, dt=None):
+        """
+        Track a frame and extrapolate it.
+        :param positions: Measured positions of shape shape + (3,).
+        :type positions: numpy.ndarray
+        :param visible: Which markers were measured, shape shape.
+        :type visible: numpy.ndarray
+        :param dt: Seconds since the previous frame. Defaults to 1 / frame_rate.
+        :type dt: float
+        :return: The predicted positions, overwritten by the next call.
+        :rtype: numpy.ndarray
+        """
+        dt = self.dt if dt is None else dt
+        g, h = self.gains
+        np.greater(visible, self.active, out=self._update)
+        self.positions[self._update] = positions[self._update]
+        self.velocities[self._update] = 0.0
+        np.logical_and(visible, self.active, out=self._update)
+        np.copyto(self.active, visible)
+
+        update = self._update[..., np.newaxis]
+        residual = self._residual
+        correction = self._correction
+        # Predict by the velocity, then correct by the residual to the measurement.
+        np.multiply(self.velocities, dt, out=correction)
+        np.add(self.positions, correction, out=self.positions, where=update)
+        np.subtract(positions, self.positions, out=residual)
+        np.multiply(residual, h / dt, out=correction)
+        np.add(self.velocities, correction, out=self.velocities, where=update)
+        np.multiply(residual, g, out=correction)
+        np.add(self.positions, correction, out=self.positions, where=update)
+
+        np.multiply(self.velocities, self.look_ahead, out=self.predictions)
+        self.predictions += self.positions
+        return self.predictions
+
+
+class MarkerFilter(object):
+    """
+    Filter stage of the live pipeline: One Euro smoothing followed by critically damped prediction.
+    Takes and returns points with residuals as streamed or read from C3D.
+    """
+    def __init__(self, shape, frame_rate, min_cutoff=1.0, beta=20.0, derivative_cutoff=1.0, theta=0.5,
+                 look_ahead=0.0):
+        """
+        :param shape: Shape of the markers, e.g. (markers,) or (performers, markers).
+        :type shape: tuple
+        :param frame_rate: Frames per second.
+        :type frame_rate: float
+        :param look_ahead: Seconds to extrapolate the markers. See the filters for the other parameters.
+        :type look_ahead: float
+        """
+        shape = tuple(np.atleast_1d(shape))
+        self.smoothing = OneEuroFilter(shape, frame_rate, min_cutoff, beta, derivative_cutoff)
+        self.prediction = CriticallyDampedPredictor(shape, frame_rate, theta, look_ahead)
+        self.points = np.zeros(shape + (4,))
+        self._visible = np.zeros(shape, dtype=bool)
+
+    @property
+    def look_ahead(self):
+        return self.prediction.look_ahead
+
+    @look_ahead.setter
+    def look_ahead(self, value):
+        self.prediction.look_ahead = value
+
+    def reset(self):
+        self.smoothing.reset()
+        self.prediction.reset()
+
+    def update(self, points, dt=None):
+        """
+        Filter a frame.
+        :param points: Points of shape shape + (4,) with X, Y, Z and residual, -1 for invisible markers.
+        :type points: numpy.ndarray
+        :param dt: Seconds since the previous frame. Defaults to 1 / frame_rate.
+        :type dt: float
+        :return: Filtered points of the same shape with the input's residuals, overwritten by the next call.
+                 Invisible markers hold their last filtered position.
+        :rtype: numpy.ndarray
+        """
+        np.greater_equal(points[..., 3], 0.0, out=self._visible)
+        smoothed = self.smoothing.update(points[..., :3], self._visible, dt)
+        self.points[..., :3] = self.prediction.update(smoothed, self._visible, dt)
+        self.points[..., 3] = points[..., 3]
+        return self.points
+
+
+def filter_recording(points, frame_rate, **kwargs):
+    """
+    Replay a recording frame by frame through a MarkerFilter, the same way live frames are filtered.
+    :param points: Points of shape (frames, markers, 4) as read from C3D.
+    :type points: numpy.ndarray
+    :param frame_rate: Frames per second of the recording.
+    :type frame_rate: float
+    :param kwargs: Parameters of MarkerFilter.
+    :return: Filtered points of the same shape.
+    :rtype: numpy.ndarray
+    """
+    marker_filter = MarkerFilter(points.shape[1:-1], frame_rate, **kwargs)
+    filtered = np.empty(points.shape)
+    for f in range(len(points)):
+        filtered[f] = marker_filter.update(points[f])
+    return filtered
+
+
+def get_filter_errors(points, filtered, frame_rate, look_ahead=0.0):
+    """
+    Measure jitter and tracking error of filtered points against the raw points.
+    :param points: Raw points of shape (frames, markers, 4).
+    :type points: numpy.ndarray
+    :param filtered: Filtered points of the same shape.
+    :type filtered: numpy.ndarray
+    :param frame_rate: Frames per second.
+    :type frame_rate: float
+    :param look_ahead: Seconds the filtered points were extrapolated. They are compared to the raw points that
+                       much later.
+    :type look_ahead: float
+    :return: Mean acceleration magnitude of the raw and of the filtered points in units per second squared, and mean
+             distance of the filtered points to the raw points they predict.
+    :rtype: tuple
+    """
+    visible = points[..., 3] >= 0.0
+    # Only count markers that are visible in all frames of the second differences.
+    valid = visible[2:] & visible[1:-1] & visible[:-2]
+
+    def jitter(p):
+        acceleration = (p[2:, :, :3] - 2.0 * p[1:-1, :, :3] + p[:-2, :, :3]) * frame_rate ** 2
+        return np.sqrt((acceleration ** 2).sum(axis=-1))[valid].mean()
+
+    shift = int(round(look_ahead * frame_rate))
+    later = slice(shift, None)
+    earlier = slice(None, len(points) - shift)
+    both = visible[later] & visible[earlier]
+    distance = np.sqrt(((filtered[earlier, :, :3] - points[later, :, :3]) ** 2).sum(axis=-1))[both].mean()
+    return jitter(points), jitter(filtered), distance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a C3D file through the marker filters.")
+    parser.add_argument('c3d', help="C3D file to replay.")
+    parser.add_argument('--min-cutoff', type=float, default=1.0)
+    parser.add_argument('--beta', type=float, default=20.0)
+    parser.add_argument('--theta', type=float, default=0.5)
+    parser.add_argument('--look-ahead', type=float, default=0.0, help="Seconds to extrapolate.")
+    args = parser.parse_args(argv)
+
+    with C3DFile(args.c3d) as c3d:
+        points, _ = c3d.read_points()
+        points = points.astype(np.float64)
+        points[..., :3] *= UNIT_SCALES.get(c3d.units, 1.0)
+        frame_rate = c3d.frame_rate
+    filtered = filter_recording(points, frame_rate, min_cutoff=args.min_cutoff, beta=args.beta, theta=args.theta,
+                                look_ahead=args.look_ahead)
+    raw_jitter, filtered_jitter, distance = get_filter_errors(points, filtered, frame_rate, args.look_ahead)
+    print("{} frames, {} markers at {} Hz".format(points.shape[0], points.shape[1], frame_rate))
+    print("Jitter raw: {:.3f} m/s^2, filtered: {:.3f} m/s^2".format(raw_jitter, filtered_jitter))
+    print("Mean distance to the raw markers {:.0f} ms later: {:.2f} mm".format(args.look_ahead * 1000.0,
+                                                                               distance * 1000.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
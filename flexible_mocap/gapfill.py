@@ -0,0 +1,147 @@
+"""
+Fill occlusion gaps in marker trajectories with rigid bodies.
+
+For every frame and rigid body, the body's reference marker layout is fitted to its visible markers
+(Kabsch algorithm) and the occluded markers are reconstructed from the fitted transform.
+All frames and rigid bodies are solved together with batched array operations.
+"""
+import numpy as np
+
+# Scale from a rigid body preset's units (MotionBuilder works in cm) to the units of C3D point data.
+UNIT_SCALES = {'mm': 10.0, 'cm': 1.0, 'm': 0.01}
+
+
+def get_rigid_body_indices(rigid_body_set, labels):
+    """
+    Map the markers of all rigid bodies to marker indices of the point data.
+    Rigid bodies with less than 3 markers in the point data are skipped, because they can't be fitted.
+    :param rigid_body_set: Rigid bodies as read from a preset.
+    :type rigid_body_set: flexible_mocap.rbs.RigidBodySet
+    :param labels: Marker labels of the point data.
+    :type labels: list
+    :return: Rigid bodies that can be used, marker indices into the point data of shape (bodies, max_markers)
+             padded with 0, marker indices into the set of the same shape and mask of valid entries.
+    :rtype: tuple
+    """
+    label_index = dict()
+    for i, label in enumerate(labels):
+        label_index.setdefault(label, i)
+        label_index.setdefault(label.split(':')[-1], i)
+
+    bodies = list()
+    for rigid_body in rigid_body_set.rigid_bodies:
+        pairs = [(label_index[name], set_index)
+                 for name, set_index in zip(rigid_body.marker_names, rigid_body.marker_indices)
+                 if name in label_index]
+        if len(pairs) >= 3:
+            bodies.append((rigid_body, pairs))
+
+    max_markers = max([len(pairs) for _, pairs in bodies] or [0])
+    point_indices = np.zeros((len(bodies), max_markers), dtype=np.intp)
+    set_indices = np.zeros((len(bodies), max_markers), dtype=np.intp)
+    valid = np.zeros((len(bodies), max_markers), dtype=bool)
+    for b, (_, pairs) in enumerate(bodies):
+        point_indices[b, :len(pairs)] = [p for p, _ in pairs]
+        set_indices[b, :len(pairs)] = [s for _, s in pairs]
+        valid[b, :len(pairs)] = True
+    return [rigid_body for rigid_body, _ in bodies], point_indices, set_indices, valid
+
+
+def fit_rigid_bodies(reference, targets, weights):
+    """
+    Batched weighted Kabsch fit of reference marker layouts onto target positions.
+    :param reference: Reference positions of shape (..., markers, 3).
+    :type reference: numpy.ndarray
+    :param targets: Target positions of shape (..., markers, 3).
+    :type targets: numpy.ndarray
+    :param weights: Weights of shape (..., markers), e.g. visibility. At least 3 must be non-zero.
+    :type weights: numpy.ndarray
+    :return: Rotations of shape (..., 3, 3), reference centroids and target centroids of shape (..., 3),
+             such that targets ~ (reference - reference centroid) @ rotation.T + target centroid.
+    :rtype: tuple
+    """
+    total = np.maximum(weights.sum(axis=-1), 1e-12)[..., np.newaxis]
+    reference_centroid = np.einsum('...k,...ki->...i', weights, reference) / total
+    target_centroid = np.einsum('...k,...ki->...i', weights, targets) / total
+    centered_reference = reference - reference_centroid[..., np.newaxis, :]
+    centered_targets = targets - target_centroid[..., np.newaxis, :]
+    covariance = np.einsum('...k,...ki,...kj->...ij', weights, centered_reference, centered_targets)
+
+    u, _, vt = np.linalg.svd(covariance)
+    # Correct reflections so that we always get proper rotations.
+    d = np.sign(np.linalg.det(np.matmul(u, vt)))
+    vt[..., 2, :] *= d[..., np.newaxis]
+    rotation = np.matmul(u, vt).swapaxes(-1, -2)
+    return rotation, reference_centroid, target_centroid
+
+
+def fill_gaps(points, visible, labels, rigid_body_set, scale=1.0, reference_frame=None, max_error=None,
+              chunk_size=65536):
+    """
+    Reconstruct occluded markers of rigid bodies.
+    :param points: Marker positions of shape (frames, markers, 3) or (frames, markers, 4) as read from C3D.
+    :type points: numpy.ndarray
+    :param visible: Visibility mask of shape (frames, markers).
+    :type visible: numpy.ndarray
+    :param labels: Marker labels of the point data.
+    :type labels: list
+    :param rigid_body_set: Rigid bodies as read from a preset.
+    :type rigid_body_set: flexible_mocap.rbs.RigidBodySet
+    :param scale: Factor to convert the preset's positions to the units of points, see UNIT_SCALES.
+    :type scale: float
+    :param reference_frame: Optional frame index at which to take the reference layout of fully visible rigid bodies
+                            from the point data instead of the preset.
+    :type reference_frame: int
+    :param max_error: Optional maximum root mean square distance of the fitted visible markers. Frames with a worse fit
+                      aren't filled.
+    :type max_error: float
+    :param chunk_size: Number of frames that are solved at once. Limits memory usage.
+    :type chunk_size: int
+    :return: Copy of points with filled gaps and mask of shape (frames, markers) of the markers that were filled.
+    :rtype: tuple
+    """
+    visible = np.asarray(visible, dtype=bool)
+    filled_points = np.array(points, copy=True)
+    filled = np.zeros(visible.shape, dtype=bool)
+    rigid_bodies, point_indices, set_indices, valid = get_rigid_body_indices(rigid_body_set, labels)
+    if not rigid_bodies:
+        return filled_points, filled
+
+    reference = rigid_body_set.positions[set_indices] * scale  # (bodies, markers, 3)
+    if reference_frame is not None:
+        frame_visible = visible[reference_frame][point_indices] | ~valid
+        use_frame = frame_visible.all(axis=1)
+        reference[use_frame] = filled_points[reference_frame, :, :3][point_indices[use_frame]]
+
+    for start in range(0, filled_points.shape[0], chunk_size):
+        stop = start + chunk_size
+        chunk_visible = visible[start:stop][:, point_indices] & valid  # (frames, bodies, markers)
+        missing = ~chunk_visible & valid
+        # Only rigid bodies with gaps and at least 3 visible markers need solving.
+        solvable = (chunk_visible.sum(axis=-1) >= 3) & missing.any(axis=-1)
+        frame_idx, body_idx = np.nonzero(solvable)
+        if frame_idx.size == 0:
+            continue
+
+        targets = filled_points[start + frame_idx[:, np.newaxis], point_indices[body_idx], :3].astype(np.float64)
+        weights = chunk_visible[frame_idx, body_idx].astype(np.float64)
+        body_reference = reference[body_idx]
+        rotation, reference_centroid, target_centroid = fit_rigid_bodies(body_reference, targets, weights)
+        fitted = np.matmul(body_reference - reference_centroid[:, np.newaxis], rotation.swapaxes(-1, -2)) + \
+            target_centroid[:, np.newaxis]
+
+        fill = missing[frame_idx, body_idx]
+        if max_error is not None:
+            squared = ((fitted - targets) ** 2).sum(axis=-1)
+            rms = np.sqrt((squared * weights).sum(axis=-1) / weights.sum(axis=-1))
+            fill &= (rms <= max_error)[:, np.newaxis]
+
+        # Markers shared by several rigid bodies take the result of the last body in the preset.
+        rows, cols = np.nonzero(fill)
+        frames = start + frame_idx[rows]
+        markers = point_indices[body_idx[rows], cols]
+        filled_points[frames, markers, :3] = fitted[rows, cols]
+        if filled_points.shape[-1] > 3:
+            filled_points[frames, markers, 3] = 0.0  # Residual of reconstructed markers.
+        filled[frames, markers] = True
+    return filled_points, filled
@@ -0,0 +1,27 @@
+"""
+Goal types of the marker set's constraints, shared by the MotionBuilder setup and the solver.
+
+A joint's goal depends on the number of markers that constrain it.
+"""
+
+GOAL_POSITION_ROTATION = 0  # Position and rotate joint in markers.
+GOAL_AIM = 1  # Aim joint at markers.
+GOAL_ROTATION = 2  # Rotate joint in markers.
+GOAL_TYPE_NAMES = {GOAL_POSITION_ROTATION: 'Position & Rotation', GOAL_AIM: 'Aim', GOAL_ROTATION: 'Rotation'}
+
+
+def get_goal_type(num_markers):
+    """
+    Make the goal type dependent on the number of markers.
+    :param num_markers: Number of markers constraining the joint.
+    :type num_markers: int
+    :return: Goal type, None if there are no markers.
+    :rtype: int
+    """
+    if num_markers == 1:
+        return GOAL_AIM
+    elif num_markers == 2:
+        return GOAL_ROTATION
+    elif num_markers >= 3:
+        return GOAL_POSITION_ROTATION
+    return None
@@ -0,0 +1,150 @@
+"""
+Fast path for the head pose from the markers of the head and of the HMD.
+
+In VR the head is the joint where latency is noticed first, so its transform is computed directly from the few
+markers on the head each frame, without waiting for the full-body solve. The markers of the head joint in the skeleton
+template and the HMDLeft and HMDRight markers are fitted to their offsets with one small Kabsch fit. The offsets of
+the HMD markers relative to the head are usually not in the template, because the HMD is put on after the marker
+setup, so they're measured on a calibration frame.
+
+When fewer than 3 of the markers are visible, 2 markers turn the previous rotation onto their direction and a single
+marker moves the head with the previous rotation.
+"""
+import timeit
+
+import numpy as np
+
+from flexible_mocap.filtering import MarkerFilter
+from flexible_mocap.gapfill import fit_rigid_bodies
+from flexible_mocap.transforms import rotation_between
+
+HMD_MARKERS = ['HMDLeft', 'HMDRight']
+
+
+class HeadPoseTracker(object):
+    """
+    Tracks the global transform of the head joint from its markers.
+
+    :ivar marker_names: Names of the markers that are used, the head's markers first.
+    :ivar offsets: Offsets of the markers relative to the head joint in meter of shape (markers, 3).
+                   NaN for HMD markers that aren't calibrated yet.
+    :ivar rotation: Global rotation of the head of the last frame.
+    :ivar position: Global position of the head of the last frame.
+    :ivar solve_time: Seconds it took to compute the last frame.
+    """
+    def __init__(self, template, labels, joint='Head', hmd_markers=HMD_MARKERS, hmd_offsets=None, frame_rate=None,
+                 look_ahead=0.0):
+        """
+        :param template: Skeleton template with the markers of the head joint.
+        :type template: flexible_mocap.template.SkeletonTemplate
+        :param labels: Labels of the markers in the frames, e.g. the streamed markers.
+        :type labels: list
+        :param joint: Name of the head joint.
+        :type joint: str
+        :param hmd_markers: Labels of the markers on the HMD.
+        :type hmd_markers: list
+        :param hmd_offsets: Optional dictionary of HMD marker name to offset relative to the head in meter.
+                            Taken from the template if the HMD markers are children of the head there.
+        :type hmd_offsets: dict
+        :param frame_rate: Frames per second. If given, the markers are filtered and extrapolated by look_ahead.
+        :type frame_rate: float
+        :param look_ahead: Seconds to extrapolate the markers, see MarkerFilter.
+        :type look_ahead: float
+        """
+        if joint not in template:
+            raise ValueError("Joint {} isn't in the skeleton template.".format(joint))
+        head_markers = template.get_children(joint, 'marker')
+        names = head_markers + [name for name in hmd_markers if name not in head_markers]
+        label_index = dict()
+        for i, label in enumerate(labels):
+            label_index.setdefault(label, i)
+            label_index.setdefault(label.split(':')[-1], i)
+        # Markers that aren't in the frames can't be used.
+        self.marker_names = [name for name in names if name in label_index]
+        self.indices = np.array([label_index[name] for name in self.marker_names], dtype=np.intp)
+        if not len(self.indices):
+            raise ValueError("None of the markers {} are in the labels.".format(", ".join(names)))
+
+        self.offsets = np.full((len(self.marker_names), 3), np.nan)
+        for i, name in enumerate(self.marker_names):
+            if name in template and template[name].parent == joint:
+                self.offsets[i] = template[name].offset
+            elif hmd_offsets and name in hmd_offsets:
+                self.offsets[i] = hmd_offsets[name]
+        self.joint = joint
+        self.hmd_markers = list(hmd_markers)
+        self.marker_filter = MarkerFilter(len(self.indices), frame_rate, look_ahead=look_ahead) if frame_rate else None
+
+        self.rotation = np.eye(3)
+        self.position = np.zeros(3)
+        self.solve_time = 0.0
+        self._points = np.zeros((len(self.indices), 4))
+
+    @property
+    def calibrated(self):
+        """ Whether all markers have offsets. """
+        return not np.isnan(self.offsets).any()
+
+    def get_hmd_offsets(self):
+        """ Dictionary of HMD marker name to its offset relative to the head, e.g. to save them. """
+        return dict((name, self.offsets[i].copy()) for i, name in enumerate(self.marker_names)
+                    if name in self.hmd_markers and not np.isnan(self.offsets[i]).any())
+
+    def calibrate(self, points):
+        """
+        Measure the offsets of the markers without offsets, e.g. the HMD's, on a frame where the head is tracked.
+        :param points: Points of a frame of shape (markers, 4) with X, Y, Z in meter and residual.
+        :type points: numpy.ndarray
+        :return: Whether the head could be tracked by its other markers and offsets were measured.
+        :rtype: bool
+        """
+        known = ~np.isnan(self.offsets).any(axis=1)
+        frame = points[self.indices]
+        visible = frame[:, 3] >= 0.0
+        if (known & visible).sum() < 3 or not visible[~known].all():
+            return False
+        rotation, position = self._fit(frame[:, :3], (known & visible).astype(np.float64))
+        # Offsets are the markers' positions in the head's rest orientation.
+        self.offsets[~known] = np.dot(frame[~known, :3] - position, rotation)
+        return True
+
+    def _fit(self, positions, weights):
+        """ Fit the offsets of the weighted markers onto their positions. """
+        offsets = np.nan_to_num(self.offsets)
+        rotation, reference_centroid, target_centroid = fit_rigid_bodies(offsets, positions, weights)
+        return rotation, target_centroid - np.dot(rotation, reference_centroid)
+
+    def update(self, points, dt=None):
+        """
+        Compute the head transform of a frame.
+        :param points: Points of a frame of shape (markers, 4) in the order of labels, in meter.
+        :type points: numpy.ndarray
+        :param dt: Seconds since the previous frame, for the filter. Defaults to 1 / frame_rate.
+        :type dt: float
+        :return: Global rotation of shape (3, 3), global position of shape (3,) and whether the markers determined
+                 the full pose. The arrays are overwritten by the next call.
+        :rtype: tuple
+        """
+        start = timeit.default_timer()
+        frame = self._points
+        frame[:] = points[self.indices]
+        if self.marker_filter is not None:
+            frame[:] = self.marker_filter.update(frame, dt)
+        usable = (frame[:, 3] >= 0.0) & ~np.isnan(self.offsets[:, 0])
+        count = usable.sum()
+        if count >= 3:
+            rotation, position = self._fit(frame[:, :3], usable.astype(np.float64))
+            self.rotation[:] = rotation
+            self.position[:] = position
+        elif count == 2:
+            # Keep the previous rotation about the axis through both markers.
+            first, second = np.flatnonzero(usable)
+            reference = np.dot(self.rotation, self.offsets[second] - self.offsets[first])
+            self.rotation[:] = np.dot(rotation_between(reference, frame[second, :3] - frame[first, :3]),
+                                      self.rotation)
+            self.position[:] = frame[first, :3] - np.dot(self.rotation, self.offsets[first])
+        elif count == 1:
+            marker = np.flatnonzero(usable)[0]
+            self.position[:] = frame[marker, :3] - np.dot(self.rotation, self.offsets[marker])
+        self.solve_time = timeit.default_timer() - start
+        return self.rotation, self.position, count >= 3
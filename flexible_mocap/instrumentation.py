@@ -0,0 +1,212 @@
+"""
+Timing of the stages of the live pipeline per frame.
+
+Stages record their start and end times into preallocated arrays, from which percentiles and histograms are computed
+afterwards, and which can be exported as Chrome trace JSON (open it in chrome://tracing or https://ui.perfetto.dev).
+Counters, e.g. of dropped frames, are recorded along with the time they changed.
+
+Disabled instrumentation returns from its methods right away, so the hooks can stay in the pipeline.
+
+Times are wall clock times from time.time, so they can be compared with the send times of streamed frames.
+"""
+import json
+import time
+
+import numpy as np
+
+# Stages of the live pipeline in the order they run.
+STAGES = ['ingestion', 'filtering', 'solving', 'scene write']
+
+
+class Instrumentation(object):
+    """
+    Records durations of stages and counter changes.
+
+    Each stage keeps the last capacity events. Stages that aren't known yet are added on their first event.
+
+    :ivar enabled: Whether events are recorded.
+    :ivar counters: Dictionary of counter name to its current value.
+    """
+    def __init__(self, stages=STAGES, capacity=65536, enabled=True):
+        """
+        :param stages: Names of the stages in the order they should be listed.
+        :type stages: list
+        :param capacity: Number of events kept per stage.
+        :type capacity: int
+        :param enabled: Whether to record events.
+        :type enabled: bool
+        """
+        self.enabled = enabled
+        self.capacity = capacity
+        self.stages = list()
+        self._starts = dict()
+        self._durations = dict()
+        self._frames = dict()
+        self._counts = dict()
+        self.counters = dict()
+        self._counter_events = list()
+        for stage in stages:
+            self._add_stage(stage)
+
+    def _add_stage(self, stage):
+        self.stages.append(stage)
+        self._starts[stage] = np.zeros(self.capacity)
+        self._durations[stage] = np.zeros(self.capacity)
+        self._frames[stage] = np.zeros(self.capacity, dtype=np.int64)
+        self._counts[stage] = 0
+
+    def reset(self):
+        """ Forget all events and counters. """
+        for stage in self.stages:
+            self._counts[stage] = 0
+        self.counters.clear()
+        del self._counter_events[:]
+
+    def now(self):
+        """ Current time in seconds, 0 when disabled. """
+        if not self.enabled:
+            return 0.0
+        return time.time()
+
+    def record(self, stage, start, end=None, frame=-1):
+        """
+        Record that a stage ran. Returns the end time, so consecutive stages can be chained:
+        t = instrumentation.record('filtering', t, frame=frame)
+        :param stage: Name of the stage.
+        :type stage: str
+        :param start: Time the stage started in seconds.
+        :type start: float
+        :param end: Time the stage ended in seconds. Defaults to now.
+        :type end: float
+        :param frame: Number of the frame the stage processed.
+        :type frame: int
+        :return: End time, 0 when disabled.
+        :rtype: float
+        """
+        if not self.enabled:
+            return 0.0
+        if end is None:
+            end = time.time()
+        if stage not in self._counts:
+            self._add_stage(stage)
+        i = self._counts[stage] % self.capacity
+        self._starts[stage][i] = start
+        self._durations[stage][i] = end - start
+        self._frames[stage][i] = frame
+        self._counts[stage] += 1
+        return end
+
+    def count(self, name, amount=1):
+        """
+        Increase a counter, e.g. of dropped frames.
+        :param name: Name of the counter.
+        :type name: str
+        :param amount: Amount to add.
+        :type amount: int
+        """
+        if not self.enabled or not amount:
+            return
+        value = self.counters.get(name, 0) + amount
+        self.counters[name] = value
+        self._counter_events.append((time.time(), name, value))
+
+    def get_count(self, stage):
+        """ Number of events that were recorded for a stage, including those that didn't fit into capacity. """
+        return self._counts.get(stage, 0)
+
+    def _ordered(self, arrays, stage):
+        """ Events of a stage from the oldest to the newest one. """
+        count = self._counts.get(stage, 0)
+        values = arrays[stage]
+        if count <= self.capacity:
+            return values[:count]
+        first = count % self.capacity
+        return np.concatenate([values[first:], values[:first]])
+
+    def get_durations(self, stage):
+        """
+        Durations of the kept events of a stage.
+        :return: Durations in seconds, oldest first.
+        :rtype: numpy.ndarray
+        """
+        return self._ordered(self._durations, stage)
+
+    def percentiles(self, stage, q=(50, 95, 99)):
+        """
+        Percentiles of the durations of a stage.
+        :param q: Percentiles to compute.
+        :type q: tuple
+        :return: Durations in seconds, NaN if there are no events.
+        :rtype: numpy.ndarray
+        """
+        durations = self.get_durations(stage)
+        if not len(durations):
+            return np.full(len(q), np.nan)
+        return np.percentile(durations, q)
+
+    def histogram(self, stage, bins=None):
+        """
+        Histogram of the durations of a stage.
+        :param bins: Bin edges in seconds. Defaults to logarithmic bins from 1 us to 1 s.
+        :type bins: numpy.ndarray
+        :return: Counts per bin and the bin edges.
+        :rtype: tuple
+        """
+        if bins is None:
+            bins = np.logspace(-6, 0, 25)
+        return np.histogram(self.get_durations(stage), bins=bins)
+
+    def summary(self):
+        """
+        Statistics of all stages that have events.
+        :return: List of dictionaries with stage, count and mean, p50, p95, p99 and max in milliseconds.
+        :rtype: list
+        """
+        rows = list()
+        for stage in self.stages:
+            durations = self.get_durations(stage)
+            if not len(durations):
+                continue
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1000.0
+            rows.append({'stage': stage, 'count': self._counts[stage], 'mean': durations.mean() * 1000.0,
+                         'p50': p50, 'p95': p95, 'p99': p99, 'max': durations.max() * 1000.0})
+        return rows
+
+    def format_summary(self):
+        """ Summary as table and the counters as text. """
+        lines = ["{:>12}  {:>8}  {:>9}  {:>9}  {:>9}  {:>9}  {:>9}".format('stage', 'count', 'mean', 'p50', 'p95',
+                                                                          'p99', 'max')]
+        for row in self.summary():
+            lines.append("{stage:>12}  {count:>8d}  {mean:>7.3f}ms  {p50:>7.3f}ms  {p95:>7.3f}ms  {p99:>7.3f}ms  "
+                         "{max:>7.3f}ms".format(**row))
+        for name in sorted(self.counters):
+            lines.append("{}: {}".format(name, self.counters[name]))
+        return "\n".join(lines)
+
+    def get_chrome_trace(self):
+        """
+        Events in the Chrome trace event format. Each stage is shown as its own track.
+        :return: Dictionary that can be written as JSON.
+        :rtype: dict
+        """
+        events = list()
+        for tid, stage in enumerate(self.stages):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': stage}})
+            starts = self._ordered(self._starts, stage) * 1e6
+            durations = self._ordered(self._durations, stage) * 1e6
+            frames = self._ordered(self._frames, stage)
+            for start, duration, frame in zip(starts.tolist(), durations.tolist(), frames.tolist()):
+                events.append({'name': stage, 'ph': 'X', 'pid': 1, 'tid': tid, 'ts': start, 'dur': duration,
+                               'args': {'frame': frame}})
+        for timestamp, name, value in self._counter_events:
+            events.append({'name': name, 'ph': 'C', 'pid': 1, 'ts': timestamp * 1e6, 'args': {name: value}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, fullpath):
+        """
+        Write the events as Chrome trace JSON file.
+        :param fullpath: full file path to where the JSON file should be saved.
+        :type fullpath: str
+        """
+        with open(fullpath, 'w') as f:
+            json.dump(self.get_chrome_trace(), f)
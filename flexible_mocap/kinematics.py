@@ -0,0 +1,133 @@
+"""
+Forward kinematics over a skeleton hierarchy for all frames at once.
+
+Joints are grouped by their depth in the hierarchy. All joints of a depth only depend on joints of the depth above,
+so each depth is one batched matrix product over all frames and joints, instead of one evaluation per joint and
+frame like GetVector in the scene.
+"""
+import numpy as np
+
+from flexible_mocap.template import get_topological_order
+
+
+def get_depths(parent_indices, order):
+    """
+    Get the depth of each joint in the hierarchy.
+    :param parent_indices: Indices of the parents, -1 for root joints.
+    :type parent_indices: numpy.ndarray
+    :param order: Indices of the joints in topological order, parents before their children.
+    :type order: numpy.ndarray
+    :return: Depth of each joint, 0 for root joints.
+    :rtype: numpy.ndarray
+    """
+    depths = np.zeros(len(parent_indices), dtype=np.intp)
+    for i in order:
+        parent = parent_indices[i]
+        if parent >= 0:
+            depths[i] = depths[parent] + 1
+    return depths
+
+
+class ForwardKinematics(object):
+    """
+    Computes global rotations and positions of joints from their local transforms.
+
+    :ivar parent_indices: Indices of the parents, -1 for root joints.
+    :ivar offsets: Local translations of the joints as array of shape (joints, 3). Used where no translations are
+                   given, e.g. the template's offsets.
+    :ivar levels: For each depth in the hierarchy the indices of its joints and of their parents.
+    """
+    def __init__(self, parent_indices, offsets, order=None):
+        """
+        :param parent_indices: Indices of the parents, -1 for root joints.
+        :type parent_indices: numpy.ndarray
+        :param offsets: Local translations of shape (joints, 3). NaN counts as 0.
+        :type offsets: numpy.ndarray
+        :param order: Indices of the joints in topological order. Computed if not given.
+        :type order: numpy.ndarray
+        """
+        self.parent_indices = np.asarray(parent_indices, dtype=np.intp)
+        self.offsets = np.nan_to_num(np.asarray(offsets, dtype=np.float64).reshape(-1, 3))
+        if order is None:
+            order = get_topological_order(self.parent_indices)
+        depths = get_depths(self.parent_indices, order)
+        self.levels = list()
+        for depth in range(depths.max() + 1 if len(depths) else 0):
+            joints = np.flatnonzero(depths == depth)
+            self.levels.append((joints, self.parent_indices[joints]))
+
+    @classmethod
+    def from_template(cls, template, scale=1.0):
+        """
+        Create the forward kinematics of a skeleton template.
+        :param template: The skeleton template.
+        :type template: flexible_mocap.template.SkeletonTemplate
+        :param scale: Factor to convert the offsets from meter, e.g. 100 for cm.
+        :type scale: float
+        :return: Forward kinematics with the template's offsets.
+        :rtype: ForwardKinematics
+        """
+        return cls(template.parent_indices, template.offsets * scale, template.order)
+
+    def __len__(self):
+        return len(self.parent_indices)
+
+    def compute(self, rotations=None, translations=None, root_translations=None):
+        """
+        Compute global rotations and positions of all joints for all frames.
+        :param rotations: Local rotation matrices of shape (frames, joints, 3, 3). None for the rest pose.
+        :type rotations: numpy.ndarray
+        :param translations: Local translations of shape (frames, joints, 3). None uses the offsets.
+        :type translations: numpy.ndarray
+        :param root_translations: Translations of the root joints of shape (frames, 3) or (frames, roots, 3).
+                                  They replace the root joints' translations.
+        :type root_translations: numpy.ndarray
+        :return: Global rotations of shape (frames, joints, 3, 3) and positions of shape (frames, joints, 3).
+        :rtype: tuple
+        """
+        num_joints = len(self.parent_indices)
+        num_frames = 1
+        for array in (rotations, translations, root_translations):
+            if array is not None:
+                num_frames = len(array)
+                break
+        if rotations is None:
+            rotations = np.broadcast_to(np.eye(3), (num_frames, num_joints, 3, 3))
+        if translations is None:
+            translations = np.broadcast_to(self.offsets, (num_frames, num_joints, 3))
+
+        global_rotations = np.empty((num_frames, num_joints, 3, 3))
+        positions = np.empty((num_frames, num_joints, 3))
+        roots = self.levels[0][0] if self.levels else np.empty(0, dtype=np.intp)
+        global_rotations[:, roots] = rotations[:, roots]
+        if root_translations is None:
+            positions[:, roots] = translations[:, roots]
+        else:
+            positions[:, roots] = np.asarray(root_translations, dtype=np.float64).reshape(num_frames, -1, 3)
+        for joints, parents in self.levels[1:]:
+            parent_rotations = global_rotations[:, parents]
+            global_rotations[:, joints] = np.matmul(parent_rotations, rotations[:, joints])
+            positions[:, joints] = positions[:, parents] + np.einsum('fjik,fjk->fji', parent_rotations,
+                                                                     translations[:, joints])
+        return global_rotations, positions
+
+    def compute_transforms(self, rotations=None, translations=None, root_translations=None):
+        """
+        Compute global 4x4 transformation matrices of all joints for all frames. See compute for the parameters.
+        :return: Transformation matrices of shape (frames, joints, 4, 4).
+        :rtype: numpy.ndarray
+        """
+        global_rotations, positions = self.compute(rotations, translations, root_translations)
+        transforms = np.zeros(positions.shape[:2] + (4, 4))
+        transforms[..., :3, :3] = global_rotations
+        transforms[..., :3, 3] = positions
+        transforms[..., 3, 3] = 1.0
+        return transforms
+
+    def rest_positions(self):
+        """
+        Global positions of the joints in the rest pose, i.e. with all local rotations being identity.
+        :return: Positions of shape (joints, 3).
+        :rtype: numpy.ndarray
+        """
+        return self.compute()[1][0]
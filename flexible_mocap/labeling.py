@@ -0,0 +1,118 @@
+"""
+Label markers by their position instead of their order.
+
+Unlabeled markers are matched to the template's marker positions (e.g. the marker dummies of a created skeleton).
+A KD-tree limits the candidate pairs to the nearest template markers, an optimal assignment then resolves conflicts
+so that every label is used at most once. Markers only compete for labels with markers that share candidates, so the
+assignment is solved for each group of connected candidates separately instead of for all markers at once.
+
+SciPy is imported when markers are matched, so the MotionBuilder tool loads without it.
+"""
+import numpy as np
+
+
+def _assign_component(distances, rows, columns):
+    """
+    Optimal assignment of the candidate pairs of one connected component.
+    :param distances: Distances of the candidate pairs.
+    :type distances: numpy.ndarray
+    :param rows: Marker index of each pair.
+    :type rows: numpy.ndarray
+    :param columns: Template marker index of each pair.
+    :type columns: numpy.ndarray
+    :return: Marker and template marker indices of the matched pairs.
+    :rtype: tuple
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    markers, local_rows = np.unique(rows, return_inverse=True)
+    template_markers, local_columns = np.unique(columns, return_inverse=True)
+    # Pairs that aren't candidates get a cost that's higher than any combination of candidate pairs.
+    no_match = (distances.max() + 1.0) * (len(markers) + 1)
+    cost = np.full((len(markers), len(template_markers)), no_match)
+    cost[local_rows, local_columns] = distances
+    marker_idx, template_idx = linear_sum_assignment(cost)
+    valid = cost[marker_idx, template_idx] < no_match
+    return markers[marker_idx[valid]], template_markers[template_idx[valid]]
+
+
+def match_markers(positions, template_positions, max_distance=None, candidates=4):
+    """
+    Find the optimal one-to-one assignment of markers to template markers by distance.
+    Numbers of markers and template markers don't need to match.
+    :param positions: Positions of the unlabeled markers of shape (markers, 3).
+    :type positions: numpy.ndarray
+    :param template_positions: Positions of the template markers of shape (template_markers, 3).
+    :type template_positions: numpy.ndarray
+    :param max_distance: Markers farther away from any template marker than this stay unmatched. None means no limit.
+    :type max_distance: float
+    :param candidates: Number of nearest template markers that are considered for each marker.
+    :type candidates: int
+    :return: Index of the matched template marker for each marker, -1 for unmatched markers.
+    :rtype: numpy.ndarray
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    template_positions = np.asarray(template_positions, dtype=np.float64).reshape(-1, 3)
+    num_markers = len(positions)
+    matches = np.full(num_markers, -1, dtype=np.intp)
+    if num_markers == 0 or len(template_positions) == 0:
+        return matches
+
+    k = min(candidates, len(template_positions))
+    tree = cKDTree(template_positions)
+    distances, indices = tree.query(positions, k=k,
+                                    distance_upper_bound=np.inf if max_distance is None else max_distance)
+    distances = distances.reshape(num_markers, k)
+    indices = indices.reshape(num_markers, k)
+    found = np.isfinite(distances)
+    if not found.any():
+        return matches
+    rows = np.repeat(np.arange(num_markers), k).reshape(-1, k)[found]
+    columns = indices[found]
+
+    # Bipartite graph of the candidate pairs, markers first, then template markers.
+    num_nodes = num_markers + len(template_positions)
+    graph = coo_matrix((np.ones(len(rows)), (rows, num_markers + columns)), shape=(num_nodes, num_nodes))
+    num_components, labels = connected_components(graph, directed=False)
+    # Usually most markers don't share candidates with any other marker and take their nearest candidate,
+    # which the KD-tree returns first.
+    has_candidates = found[:, 0]
+    marker_labels = labels[:num_markers]
+    markers_per_component = np.bincount(marker_labels[has_candidates], minlength=num_components)
+    alone = has_candidates & (markers_per_component[marker_labels] == 1)
+    matches[alone] = indices[alone, 0]
+
+    shared = ~alone[rows]
+    rows = rows[shared]
+    columns = columns[shared]
+    distances = distances[found][shared]
+    # Group the remaining pairs by component, so each component's pairs are a contiguous slice.
+    pair_labels = labels[rows]
+    order = np.argsort(pair_labels, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(pair_labels[order])) + 1
+    for pairs in np.split(order, bounds) if len(order) else ():
+        marker_idx, template_idx = _assign_component(distances[pairs], rows[pairs], columns[pairs])
+        matches[marker_idx] = template_idx
+    return matches
+
+
+def assign_labels(positions, template_positions, template_names, max_distance=None):
+    """
+    Get new labels for markers from the nearest template markers.
+    :param positions: Positions of the unlabeled markers of shape (markers, 3).
+    :type positions: numpy.ndarray
+    :param template_positions: Positions of the template markers of shape (template_markers, 3).
+    :type template_positions: numpy.ndarray
+    :param template_names: Names of the template markers.
+    :type template_names: list
+    :param max_distance: Markers farther away from any template marker than this stay unmatched. None means no limit.
+    :type max_distance: float
+    :return: New label for each marker, None for unmatched markers.
+    :rtype: list
+    """
+    matches = match_markers(positions, template_positions, max_distance)
+    return [template_names[i] if i >= 0 else None for i in matches]
@@ -0,0 +1,268 @@
+"""
+Live pipeline from marker frames to solved skeletons: ingestion, filtering, solving and scene write.
+
+Each step takes the latest frame of the ring buffer, filters its markers, solves the skeletons and hands the result
+to a writer, e.g. a function that sets the joints in the scene. Every stage is timed by the pipeline's
+Instrumentation, together with the frames that were lost in transit, skipped because the pipeline was busy, invalid or
+out of order.
+
+Without cameras, a C3D file can be replayed directly into the ring buffer, or streamed over the network by a
+C3DStreamServer:
+    python -m flexible_mocap.live template.csv recording.c3d [--labels labels.txt] [--network udp|tcp]
+                                  [--rate 480] [--look-ahead 0.0] [--trace trace.json] [--disable-instrumentation]
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from flexible_mocap.batch import read_labels
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.filtering import MarkerFilter
+from flexible_mocap.instrumentation import Instrumentation
+from flexible_mocap.solver import SegmentSolver
+from flexible_mocap.stream import (DEFAULT_PORT, UNIT_SCALES, C3DStreamServer, MarkerRingBuffer,
+                                   MarkerStreamReceiver)
+from flexible_mocap.template import load_template
+
+
+class LivePipeline(object):
+    """
+    Processes the latest frame of a ring buffer through the filter, the solver and the writer.
+
+    :ivar instrumentation: Timing of the stages, disabled instrumentation if none was given.
+    :ivar frame_count: Number of frames processed.
+    """
+    def __init__(self, ring, labels, solver, marker_filter=None, writer=None, instrumentation=None, namespaces=None):
+        """
+        :param ring: Ring buffer the frames are received into.
+        :type ring: flexible_mocap.stream.MarkerRingBuffer
+        :param labels: Labels of the markers in the ring buffer's frames.
+        :type labels: list
+        :param solver: Solver of the performers' skeletons.
+        :type solver: flexible_mocap.solver.SegmentSolver
+        :param marker_filter: Optional filter of shape (performers, markers) applied before solving.
+        :type marker_filter: flexible_mocap.filtering.MarkerFilter
+        :param writer: Optional function called with the solver's rotations and positions, e.g. to set the scene.
+        :type writer: function
+        :param instrumentation: Optional instrumentation to time the stages with.
+        :type instrumentation: flexible_mocap.instrumentation.Instrumentation
+        :param namespaces: Namespace of each performer's markers in labels, e.g. ['P1', 'P2'] for 'P1:A0'.
+                           None for a single performer without namespace.
+        :type namespaces: list
+        """
+        namespaces = namespaces or ['']
+        if len(namespaces) != solver.performer_count:
+            raise ValueError("The solver has {} performers, got {} namespaces.".format(solver.performer_count,
+                                                                                       len(namespaces)))
+        label_index = dict((label, i) for i, label in enumerate(labels))
+        names = [[namespace + ':' + name if namespace else name for name in solver.marker_names]
+                 for namespace in namespaces]
+        missing = [name for performer in names for name in performer if name not in label_index]
+        if missing:
+            raise ValueError("Marker(s) {} aren't in the labels.".format(",".join(missing)))
+        self.indices = np.array([[label_index[name] for name in performer] for performer in names], dtype=np.intp)
+
+        self.ring = ring
+        self.solver = solver
+        self.marker_filter = marker_filter
+        self.writer = writer
+        self.instrumentation = instrumentation or Instrumentation(enabled=False)
+        self.frame_count = 0
+        self._frame = np.zeros((ring.marker_count, 4), dtype=np.float32)
+        self._points = np.zeros(self.indices.shape + (4,), dtype=np.float32)
+        self._cursor = ring.write_count
+        self._lost = ring.lost_count
+        self._invalid = ring.invalid_count
+        self._out_of_order = ring.out_of_order_count
+
+    def step(self):
+        """
+        Process the latest frame if it's new.
+        :return: Whether a frame was processed.
+        :rtype: bool
+        """
+        ring = self.ring
+        count = ring.write_count
+        if count == self._cursor:
+            return False
+        result = ring.read_latest(self._frame)
+        if result is None:
+            return False
+        frame, sent, _ = result
+        instrumentation = self.instrumentation
+        if instrumentation.enabled:
+            # Frames that were received after the last step and before the latest one weren't processed.
+            instrumentation.count('skipped frames', count - self._cursor - 1)
+            instrumentation.count('lost frames', ring.lost_count - self._lost)
+            instrumentation.count('invalid frames', ring.invalid_count - self._invalid)
+            instrumentation.count('out-of-order frames', ring.out_of_order_count - self._out_of_order)
+            self._lost = ring.lost_count
+            self._invalid = ring.invalid_count
+            self._out_of_order = ring.out_of_order_count
+        self._cursor = count
+
+        # Ingestion covers the time from sending the frame to the pipeline picking it up.
+        t = instrumentation.record('ingestion', sent, frame=frame)
+        np.take(self._frame, self.indices, axis=0, out=self._points)
+        points = self._points
+        if self.marker_filter is not None:
+            points = self.marker_filter.update(points)
+            t = instrumentation.record('filtering', t, frame=frame)
+        rotations, positions = self.solver.solve(points)
+        t = instrumentation.record('solving', t, frame=frame)
+        if self.writer is not None:
+            self.writer(rotations, positions)
+            instrumentation.record('scene write', t, frame=frame)
+        self.frame_count += 1
+        return True
+
+    def run(self, receiver, max_frames=None):
+        """
+        Receive and process frames until the receiver times out, the TCP connection is closed or max_frames were
+        processed. Frames that arrive while a frame is processed are skipped.
+        :param receiver: Receiver of the ring buffer's frames.
+        :type receiver: flexible_mocap.stream.MarkerStreamReceiver
+        :param max_frames: Maximum number of frames to process.
+        :type max_frames: int
+        :return: Number of frames processed.
+        :rtype: int
+        """
+        while self.frame_count != max_frames:
+            try:
+                if not receiver.receive_latest():
+                    break
+            except (IOError, OSError):
+                # The server closed the connection, frames received before that are still processed.
+                break
+            self.step()
+        if self.frame_count != max_frames:
+            self.step()
+        return self.frame_count
+
+    def replay(self, fullpath, rate=None, max_frames=None):
+        """
+        Replay a C3D file into the ring buffer and process its frames, without network.
+        :param fullpath: full file path to the C3D file. Its markers must be in the order of the labels.
+        :type fullpath: str
+        :param rate: Frames per second. None uses the C3D's rate, 0 processes every frame as fast as possible.
+        :type rate: float
+        :param max_frames: Maximum number of frames to replay.
+        :type max_frames: int
+        :return: Number of frames processed.
+        :rtype: int
+        """
+        with C3DFile(fullpath) as c3d:
+            if c3d.point_count != self.ring.marker_count:
+                raise ValueError("{} has {} markers, the ring buffer {}.".format(fullpath, c3d.point_count,
+                                                                                self.ring.marker_count))
+            rate = c3d.frame_rate if rate is None else rate
+            period = 1.0 / rate if rate else 0.0
+            scale = UNIT_SCALES.get(c3d.units, 1.0)
+            # The replay numbers its frames from 0, like a new sender.
+            self.ring.reset_sequence()
+            start_time = time.time()
+            sent = 0
+            for _, points, _ in c3d.iter_points():
+                points[..., :3] *= scale
+                for frame in points:
+                    if sent == max_frames:
+                        return self.frame_count
+                    delay = start_time + sent * period - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                    self.ring.write(sent, time.time(), frame)
+                    sent += 1
+                    # When the pipeline is behind, frames that are already due are written without processing them,
+                    # like frames that arrive over the network while the pipeline is busy.
+                    if not period or time.time() < start_time + sent * period:
+                        self.step()
+            self.step()
+        return self.frame_count
+
+
+def _serve(fullpath, address, protocol, rate, max_frames):
+    """ Stream a C3D file, run in a separate process so it doesn't compete for the interpreter lock. """
+    server = C3DStreamServer(fullpath, address, protocol, rate=rate)
+    server.run(max_frames)
+    server.close()
+
+
+def _connect(receiver, timeout=5.0):
+    """ Connect to a TCP server that may not be listening yet. """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            receiver.open()
+            return
+        except (IOError, OSError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the live pipeline on a replay of a C3D file.")
+    parser.add_argument('template', help="Skeleton template CSV file.")
+    parser.add_argument('c3d', help="C3D file to replay.")
+    parser.add_argument('--labels', help="Text file with the C3D's marker labels in order.")
+    parser.add_argument('--network', choices=('udp', 'tcp'), help="Stream the C3D over the network.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--rate', type=float, default=None, help="Frames per second. Default: the C3D's rate.")
+    parser.add_argument('--frames', type=int, default=None, help="Maximum number of frames.")
+    parser.add_argument('--look-ahead', type=float, default=0.0, help="Seconds to extrapolate the markers.")
+    parser.add_argument('--trace', help="Chrome trace JSON file to write the stages' events to.")
+    parser.add_argument('--disable-instrumentation', action='store_true')
+    args = parser.parse_args(argv)
+
+    template = load_template(args.template)
+    with C3DFile(args.c3d) as c3d:
+        labels = read_labels(args.labels) if args.labels else list(c3d.labels)
+        rate = c3d.frame_rate if args.rate is None else args.rate
+    solver = SegmentSolver(template)
+    ring = MarkerRingBuffer(max(2, int(rate)), len(labels))
+    marker_filter = MarkerFilter((1, len(solver.marker_names)), rate or 60.0, look_ahead=args.look_ahead)
+    # Without a scene, the writer copies the results like setting the joints would read them.
+    rotations = np.zeros_like(solver.rotations)
+    positions = np.zeros_like(solver.positions)
+
+    def write(solved_rotations, solved_positions):
+        rotations[:] = solved_rotations
+        positions[:] = solved_positions
+
+    instrumentation = Instrumentation(enabled=not args.disable_instrumentation)
+    pipeline = LivePipeline(ring, labels, solver, marker_filter, write, instrumentation)
+    start = time.time()
+    if args.network:
+        address = ('127.0.0.1', args.port)
+        receiver = MarkerStreamReceiver(ring, address, args.network, timeout=1.0)
+        if args.network == 'udp':
+            receiver.open()
+        server = multiprocessing.Process(target=_serve, args=(args.c3d, address, args.network, rate, args.frames))
+        server.start()
+        try:
+            if args.network == 'tcp':
+                _connect(receiver)
+            pipeline.run(receiver, args.frames)
+        finally:
+            receiver.close()
+            server.join()
+    else:
+        pipeline.replay(args.c3d, rate, args.frames)
+    elapsed = time.time() - start
+
+    print("Processed {} frames in {:.2f}s".format(pipeline.frame_count, elapsed))
+    if instrumentation.enabled:
+        print(instrumentation.format_summary())
+    if args.trace:
+        instrumentation.write_chrome_trace(args.trace)
+        print("Wrote {}".format(args.trace))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
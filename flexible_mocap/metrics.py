@@ -0,0 +1,80 @@
+"""
+Per-joint error metrics between an animated skeleton and ground truth, e.g. a BVH file generated from the C3D.
+
+Errors are computed for all frames and joints at once. Frames where either side is missing (NaN) are ignored in
+the summaries.
+"""
+import numpy as np
+
+from flexible_mocap.transforms import rotation_angle
+
+
+def match_joints(names, reference_names):
+    """
+    Find the joints that two skeletons have in common by name.
+    :param names: Joint names of the skeleton.
+    :type names: list
+    :param reference_names: Joint names of the reference skeleton.
+    :type reference_names: list
+    :return: Common names, their indices in names and their indices in reference_names.
+    :rtype: tuple
+    """
+    reference_index = dict((name, i) for i, name in enumerate(reference_names))
+    common = [name for name in names if name in reference_index]
+    index = dict((name, i) for i, name in enumerate(names))
+    return (common,
+            np.array([index[name] for name in common], dtype=np.intp),
+            np.array([reference_index[name] for name in common], dtype=np.intp))
+
+
+def position_errors(positions, reference):
+    """
+    Euclidean distances between joint positions.
+    :param positions: Positions of shape (frames, joints, 3).
+    :type positions: numpy.ndarray
+    :param reference: Reference positions of the same shape and units.
+    :type reference: numpy.ndarray
+    :return: Distances of shape (frames, joints).
+    :rtype: numpy.ndarray
+    """
+    difference = np.asarray(positions, dtype=np.float64) - np.asarray(reference, dtype=np.float64)
+    return np.sqrt(np.einsum('...i,...i->...', difference, difference))
+
+
+def rotation_errors(rotations, reference):
+    """
+    Angles between joint rotations.
+    :param rotations: Rotation matrices of shape (frames, joints, 3, 3).
+    :type rotations: numpy.ndarray
+    :param reference: Reference rotation matrices of the same shape.
+    :type reference: numpy.ndarray
+    :return: Angles in degrees of shape (frames, joints).
+    :rtype: numpy.ndarray
+    """
+    return rotation_angle(rotations, reference)
+
+
+def summarize_errors(errors, percentile=95.0):
+    """
+    Summarize errors per joint over all frames.
+    :param errors: Errors of shape (frames, joints), NaN where they are unknown.
+    :type errors: numpy.ndarray
+    :param percentile: Percentile to include in the summary.
+    :type percentile: float
+    :return: Dictionary with the arrays 'mean', 'rms', 'percentile' and 'max' of shape (joints,).
+    :rtype: dict
+    """
+    errors = np.asarray(errors, dtype=np.float64)
+    valid = ~np.isnan(errors)
+    counts = valid.sum(axis=0)
+    filled = np.where(valid, errors, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=0) / counts
+        rms = np.sqrt((filled * filled).sum(axis=0) / counts)
+    summary = {'mean': mean, 'rms': rms,
+               'percentile': np.full(errors.shape[1:], np.nan), 'max': np.full(errors.shape[1:], np.nan)}
+    has_values = counts > 0
+    if has_values.any():
+        summary['percentile'][has_values] = np.nanpercentile(errors[:, has_values], percentile, axis=0)
+        summary['max'][has_values] = np.nanmax(errors[:, has_values], axis=0)
+    return summary
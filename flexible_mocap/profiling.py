@@ -0,0 +1,171 @@
+"""
+Opt-in profiling of the setup steps of the MotionBuilder tool.
+
+Functions decorated with profiled record their wall and CPU time and how often they were called. Calls are aggregated
+per call path over the session, so a step like "Create Skeleton" lists the functions it spent its time in:
+    Create Skeleton                    1    12.310s    11.950s
+      create_skeleton                  1    12.290s    11.940s
+
+Profiling is off unless the environment variable FLEXIBLE_MOCAP_PROFILE is set before MotionBuilder starts, to the
+path of the report file or to 1 for flexible_mocap_profile.txt in the temp directory. The report is rewritten each
+time a step finishes, so it's there even when MotionBuilder has to be killed during a later step.
+Disabled, the decorated functions only check a flag before they're called.
+"""
+from __future__ import print_function
+
+import functools
+import os
+import tempfile
+import time
+import timeit
+
+PROFILE_VARIABLE = 'FLEXIBLE_MOCAP_PROFILE'
+DEFAULT_REPORT_NAME = 'flexible_mocap_profile.txt'
+
+# CPU time of this process. time.clock measures wall time on Windows, so Python 2 falls back to os.times.
+try:
+    cpu_timer = time.process_time
+except AttributeError:
+    def cpu_timer():
+        user, system = os.times()[:2]
+        return user + system
+
+
+def get_report_path(value):
+    """
+    Report path for the value of the environment variable.
+    :param value: Value of FLEXIBLE_MOCAP_PROFILE.
+    :type value: str
+    :return: Path to the report file, None if profiling is off.
+    :rtype: str
+    """
+    if not value or value.strip().lower() in ('0', 'false', 'no', 'off'):
+        return None
+    if value.strip().lower() in ('1', 'true', 'yes', 'on'):
+        return os.path.join(tempfile.gettempdir(), DEFAULT_REPORT_NAME)
+    return value
+
+
+class SessionProfiler(object):
+    """
+    Aggregates the timings of profiled calls over a session.
+
+    :ivar enabled: Whether calls are timed.
+    :ivar report_path: File the report is written to after each outermost call. None to not write it automatically.
+    :ivar stats: Dictionary of call path (tuple of names) to a list of calls, wall time, CPU time and maximum wall
+                 time of a single call in seconds.
+    """
+    def __init__(self, enabled=False, report_path=None):
+        """
+        :param enabled: Whether to time calls.
+        :type enabled: bool
+        :param report_path: Optional file to write the report to after each outermost call.
+        :type report_path: str
+        """
+        self.enabled = enabled
+        self.report_path = report_path
+        self.stats = dict()
+        self.start_time = time.time()
+        self._stack = list()
+
+    @classmethod
+    def from_environment(cls):
+        """ Profiler that is enabled if FLEXIBLE_MOCAP_PROFILE is set. """
+        report_path = get_report_path(os.environ.get(PROFILE_VARIABLE))
+        return cls(report_path is not None, report_path)
+
+    def reset(self):
+        """ Forget all timings and start a new session. """
+        self.stats.clear()
+        self.start_time = time.time()
+
+    def profile(self, name=None):
+        """
+        Decorator that times calls of the function while profiling is enabled.
+        :param name: Name in the report. Defaults to the function's name.
+        :type name: str
+        :return: Decorator.
+        :rtype: function
+        """
+        def decorator(func):
+            label = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                return self.call(label, func, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def call(self, name, func, *args, **kwargs):
+        """
+        Call a function and record its timing under name, nested in the profiled calls it's called from.
+        :param name: Name in the report.
+        :type name: str
+        :param func: Function to call.
+        :type func: function
+        :return: Return value of the function.
+        """
+        self._stack.append(name)
+        path = tuple(self._stack)
+        wall_start = timeit.default_timer()
+        cpu_start = cpu_timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            wall = timeit.default_timer() - wall_start
+            cpu = cpu_timer() - cpu_start
+            self._stack.pop()
+            stats = self.stats.setdefault(path, [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+            stats[3] = max(stats[3], wall)
+            if not self._stack and self.report_path:
+                self._write_report_safely()
+
+    def _write_report_safely(self):
+        # A report that can't be written mustn't break the step that was profiled.
+        try:
+            self.write_report(self.report_path)
+        except (IOError, OSError) as e:
+            print("Could not write profiling report to {}: {}".format(self.report_path, e))
+
+    def format_report(self):
+        """
+        Timings of the session as text table. Nested calls are indented below the calls they were made from.
+        :return: Report.
+        :rtype: str
+        """
+        lines = ["Flexible MoCap setup profile, session started {}".format(
+                     time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.start_time))),
+                 "{:<40}  {:>6}  {:>10}  {:>10}  {:>10}  {:>10}".format('step', 'calls', 'wall', 'cpu', 'mean wall',
+                                                                        'max wall')]
+        # Sorting the paths puts the nested calls right after the call they were made from.
+        for path in sorted(self.stats):
+            calls, wall, cpu, max_wall = self.stats[path]
+            label = "  " * (len(path) - 1) + path[-1]
+            lines.append("{:<40}  {:>6d}  {:>9.3f}s  {:>9.3f}s  {:>9.3f}s  {:>9.3f}s".format(label, calls, wall, cpu,
+                                                                                             wall / calls, max_wall))
+        return "\n".join(lines)
+
+    def write_report(self, fullpath=None):
+        """
+        Write the report as text file.
+        :param fullpath: full file path to where the report should be saved. Defaults to report_path, or to
+                         flexible_mocap_profile.txt in the temp directory if there's no report_path either.
+        :type fullpath: str
+        :return: Path the report was written to.
+        :rtype: str
+        """
+        fullpath = fullpath or self.report_path or get_report_path('1')
+        with open(fullpath, 'w') as f:
+            f.write(self.format_report())
+            f.write("\n")
+        return fullpath
+
+
+# Profiler of this session, shared by the core functions and the tool's callbacks.
+profiler = SessionProfiler.from_environment()
+profiled = profiler.profile
@@ -0,0 +1,288 @@
+"""
+Streaming reader for MotionBuilder's rigid body marker presets (*.rbs).
+
+The presets are stored in the FBX 6 ASCII format. The file is tokenized line by line and turned into
+a stream of records by generators, so no intermediate tree of the whole file is built.
+"""
+import collections
+import io
+import os.path
+import re
+
+import numpy as np
+
+
+class RBSError(Exception):
+    """ Raised when a rigid body preset is malformed. """
+    pass
+
+
+# Tokens of the FBX ASCII format.
+TOKEN_KEY = 'key'
+TOKEN_VALUE = 'value'
+TOKEN_OPEN = '{'
+TOKEN_CLOSE = '}'
+
+_token_re = re.compile(r'\s*(?:'
+                       r'(?P<string>"[^"]*")|'
+                       r'(?P<brace>[{}])|'
+                       r'(?P<key>[A-Za-z_][\w|]*):|'
+                       r'(?P<comma>,)|'
+                       r'(?P<atom>[^\s,{}"]+))')
+
+# Events of the node stream.
+EVENT_BEGIN = 'begin'
+EVENT_END = 'end'
+EVENT_PROPERTY = 'property'
+
+# Records of the rigid body stream.
+RigidBodySetRecord = collections.namedtuple('RigidBodySetRecord', ['name'])
+MarkerRecord = collections.namedtuple('MarkerRecord', ['name', 'x', 'y', 'z'])
+RigidBodyRecord = collections.namedtuple('RigidBodyRecord', ['name', 'markers'])
+
+
+def _convert_atom(atom):
+    """ Convert an unquoted value to int or float if possible. """
+    try:
+        return int(atom)
+    except ValueError:
+        try:
+            return float(atom)
+        except ValueError:
+            return atom
+
+
+def tokenize(lines):
+    """
+    Split lines of an FBX ASCII file into tokens. Comments starting with ';' are skipped.
+    :param lines: Iterable of text lines, e.g. a file object.
+    :type lines: iterable
+    :return: Yields tuples of token type and value.
+    :rtype: generator
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(';'):
+            continue
+        for match in _token_re.finditer(line):
+            if match.group('string') is not None:
+                yield TOKEN_VALUE, match.group('string')[1:-1]
+            elif match.group('key') is not None:
+                yield TOKEN_KEY, match.group('key')
+            elif match.group('brace') is not None:
+                yield match.group('brace'), None
+            elif match.group('atom') is not None:
+                yield TOKEN_VALUE, _convert_atom(match.group('atom'))
+
+
+def iter_nodes(tokens):
+    """
+    Turn a token stream into a stream of node events.
+    Nodes with a block yield a begin and an end event, nodes without a block yield a property event.
+    :param tokens: Tokens as yielded by tokenize.
+    :type tokens: iterable
+    :return: Yields tuples of event, node name and list of values. Values of end events are None.
+    :rtype: generator
+    """
+    stack = list()
+    key = None
+    values = list()
+    for token, value in tokens:
+        if token == TOKEN_VALUE:
+            if key is None:
+                raise RBSError("Value {!r} without a key.".format(value))
+            values.append(value)
+            continue
+
+        if token == TOKEN_OPEN:
+            if key is None:
+                raise RBSError("Block without a key.")
+            stack.append(key)
+            yield EVENT_BEGIN, key, values
+        else:
+            if key is not None:
+                yield EVENT_PROPERTY, key, values
+            if token == TOKEN_CLOSE:
+                if not stack:
+                    raise RBSError("Unbalanced closing brace.")
+                yield EVENT_END, stack.pop(), None
+        key = value if token == TOKEN_KEY else None
+        values = list()
+
+    if key is not None:
+        yield EVENT_PROPERTY, key, values
+    if stack:
+        raise RBSError("Unexpected end of file inside {}.".format(stack[-1]))
+
+
+def iter_rigid_body_records(nodes):
+    """
+    Extract rigid body sets, their markers and rigid bodies from a node stream.
+    :param nodes: Node events as yielded by iter_nodes.
+    :type nodes: iterable
+    :return: Yields RigidBodySetRecord, MarkerRecord and RigidBodyRecord tuples in the order of the file.
+    :rtype: generator
+    """
+    path = list()
+    fields = dict()  # Properties of the marker or rigid body that's being read.
+    markers = list()  # Marker names of the rigid body that's being read.
+    for event, key, values in nodes:
+        if event == EVENT_BEGIN:
+            path.append(key)
+            if key == 'RIGIDBODYSET':
+                yield RigidBodySetRecord(values[0] if values else '')
+            elif path[-2:] == ['MARKERLIST', 'MARKER'] or key == 'RIGIDBODY':
+                fields = dict()
+                markers = list()
+        elif event == EVENT_END:
+            if 'RIGIDBODYSET' in path:
+                if path[-3:] == ['RIGIDBODYSET', 'MARKERLIST', 'MARKER']:
+                    try:
+                        yield MarkerRecord(fields['NAME'], float(fields['X']), float(fields['Y']), float(fields['Z']))
+                    except KeyError as e:
+                        raise RBSError("Marker is missing {}.".format(e))
+                elif key == 'RIGIDBODY':
+                    yield RigidBodyRecord(fields.get('NAME', ''), tuple(markers))
+            path.pop()
+        elif values:
+            if key == 'MARKER' and path[-2:] == ['RIGIDBODY', 'MARKERLIST']:
+                markers.append(values[0])
+            else:
+                fields[key] = values[0]
+
+
+class RigidBody(object):
+    """
+    A rigid body of a RigidBodySet. Marker positions are stored in the set's array.
+    """
+    __slots__ = ('name', 'rigid_body_set', 'marker_indices')
+
+    def __init__(self, name, rigid_body_set, marker_indices):
+        """
+        :param name: Name of the rigid body, e.g. 'Head'.
+        :type name: str
+        :param rigid_body_set: The set the rigid body's markers belong to.
+        :type rigid_body_set: RigidBodySet
+        :param marker_indices: Indices of the rigid body's markers in the set.
+        :type marker_indices: numpy.ndarray
+        """
+        self.name = name
+        self.rigid_body_set = rigid_body_set
+        self.marker_indices = marker_indices
+
+    def __len__(self):
+        return len(self.marker_indices)
+
+    def __repr__(self):
+        return "RigidBody({!r}, {})".format(self.name, list(self.marker_names))
+
+    @property
+    def marker_names(self):
+        """ Names of the markers that form the rigid body. """
+        return [self.rigid_body_set.marker_names[i] for i in self.marker_indices]
+
+    @property
+    def positions(self):
+        """ Positions of the markers as array of shape (markers, 3). """
+        return self.rigid_body_set.positions[self.marker_indices]
+
+
+class RigidBodySet(object):
+    """
+    Markers and rigid bodies of a RIGIDBODYSET node.
+
+    :ivar name: Name of the set, e.g. 'Model::C3D:optical'.
+    :ivar marker_names: Names of all markers in the set.
+    :ivar positions: Reference positions of all markers as array of shape (markers, 3).
+    :ivar rigid_bodies: List of RigidBody objects.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.marker_names = list()
+        self.positions = np.zeros((0, 3))
+        self.rigid_bodies = list()
+        self.marker_index = dict()  # Marker name to index.
+
+    def __repr__(self):
+        return "RigidBodySet({!r}, {} markers, {} rigid bodies)".format(self.name,
+                                                                       len(self.marker_names),
+                                                                       len(self.rigid_bodies))
+
+    def get_rigid_body(self, name):
+        """
+        Get a rigid body by name.
+        :param name: Name of the rigid body.
+        :type name: str
+        :return: The rigid body or None if there is none by that name.
+        :rtype: RigidBody
+        """
+        for rigid_body in self.rigid_bodies:
+            if rigid_body.name == name:
+                return rigid_body
+        return None
+
+
+def build_rigid_body_sets(records):
+    """
+    Collect records into RigidBodySet objects.
+    :param records: Records as yielded by iter_rigid_body_records.
+    :type records: iterable
+    :return: List of RigidBodySet objects.
+    :rtype: list
+    """
+    sets = list()
+    positions = list()
+
+    def finish():
+        # Convert collected coordinates into one compact array per set.
+        if sets:
+            sets[-1].positions = np.array(positions, dtype=np.float64).reshape(-1, 3)
+
+    for record in records:
+        if isinstance(record, RigidBodySetRecord):
+            finish()
+            sets.append(RigidBodySet(record.name))
+            positions = list()
+        elif isinstance(record, MarkerRecord):
+            current = sets[-1]
+            current.marker_index[record.name] = len(current.marker_names)
+            current.marker_names.append(record.name)
+            positions.append((record.x, record.y, record.z))
+        elif isinstance(record, RigidBodyRecord):
+            current = sets[-1]
+            try:
+                indices = np.array([current.marker_index[m] for m in record.markers], dtype=np.intp)
+            except KeyError as e:
+                raise RBSError("Rigid body {} references unknown marker {}.".format(record.name, e))
+            current.rigid_bodies.append(RigidBody(record.name, current, indices))
+    finish()
+    return sets
+
+
+_preset_cache = dict()  # Full path to tuple of modification time and list of RigidBodySet objects.
+
+
+def read_rigid_body_preset(fullpath):
+    """
+    Read rigid body sets from a *.rbs file.
+    Results are cached until the file is modified.
+    :param fullpath: full file path to the rbs file.
+    :type fullpath: str
+    :return: List of RigidBodySet objects.
+    :rtype: list
+    """
+    fullpath = os.path.abspath(fullpath)
+    mtime = os.path.getmtime(fullpath)
+    cached = _preset_cache.get(fullpath)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with io.open(fullpath, 'r', encoding='latin-1') as f:
+        sets = build_rigid_body_sets(iter_rigid_body_records(iter_nodes(tokenize(f))))
+    _preset_cache[fullpath] = (mtime, sets)
+    return sets
+
+
+def clear_preset_cache():
+    """ Forget all cached rigid body presets. """
+    _preset_cache.clear()
@@ -0,0 +1,149 @@
+"""
+Index of the scene's models by name.
+
+Looking up models one by one with FBFindModelByLabelName walks the scene for every name. The registry walks it
+once, keeps the models by their full label name (namespace:name) and rebuilds lazily after the scene changed.
+It only relies on attributes that MotionBuilder's models and the stand-in models share.
+"""
+
+
+def iter_hierarchy(root):
+    """
+    Iterate depth-first over all models below root, in the order of their children.
+    :param root: Model to start from. It's not yielded itself.
+    :return: Yields models.
+    :rtype: generator
+    """
+    stack = list(reversed(list(root.Children)))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(node.Children)))
+
+
+def walk_hierarchy(roots, prune=None):
+    """
+    Iterate depth-first over models and everything below them. Each model is yielded once, even if it's below
+    several roots, in the order of the roots and their children.
+    :param roots: Models to start from. They're yielded themselves.
+    :type roots: list
+    :param prune: Optional function that gets a model and returns True if the model and everything below it
+                  should be skipped.
+    :return: Yields models.
+    :rtype: generator
+    """
+    seen = set()
+    stack = list(reversed(list(roots)))
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        if prune is not None and prune(node):
+            continue
+        yield node
+        stack.extend(reversed(list(node.Children)))
+
+
+def get_label_name(name, namespace=''):
+    """
+    Join namespace and name to a label name as used by FBFindModelByLabelName.
+    :param name: Name of the model.
+    :type name: str
+    :param namespace: Namespace of the model, may be empty.
+    :type namespace: str
+    :return: Label name.
+    :rtype: str
+    """
+    return ':'.join([namespace, name]) if namespace else name
+
+
+class SceneRegistry(object):
+    """
+    Name to model index of a scene that is built on first use and invalidated on scene changes.
+    Register on_scene_change with the scene's OnChange event to keep it up to date.
+    """
+    def __init__(self, scene, ignored_changes=()):
+        """
+        :param scene: The scene whose models to index, e.g. FBSystem().Scene.
+        :param ignored_changes: Scene change types that don't invalidate the index, e.g. selection changes.
+        :type ignored_changes: tuple
+        """
+        self.scene = scene
+        self.ignored_changes = set(ignored_changes)
+        self._by_label = None
+        self._optical_markers = None
+
+    def invalidate(self):
+        """ Forget the index. It's rebuilt on the next lookup. """
+        self._by_label = None
+        self._optical_markers = None
+
+    def on_scene_change(self, control, event):
+        """
+        Callback for the scene's OnChange event.
+        :param control: The scene.
+        :param event: Scene change event.
+        """
+        if event.Type not in self.ignored_changes:
+            self.invalidate()
+
+    @property
+    def is_valid(self):
+        """ Whether the index is built and up to date. """
+        return self._by_label is not None
+
+    def _build(self):
+        """ Walk the scene once and index all models. """
+        by_label = dict()
+        optical_markers = list()
+        for model in iter_hierarchy(self.scene.RootModel):
+            # Like FBFindModelByLabelName, the first model with a label name wins.
+            by_label.setdefault(model.LongName, model)
+            if model.FbxGetObjectSubType() == 'FBModelMarkerOptical':
+                optical_markers.append(model)
+        self._by_label = by_label
+        self._optical_markers = optical_markers
+
+    def find(self, name, namespace=''):
+        """
+        Find a model by name.
+        :param name: Name of the model.
+        :type name: str
+        :param namespace: Namespace of the model, may be empty.
+        :type namespace: str
+        :return: The model or None.
+        """
+        if self._by_label is None:
+            self._build()
+        return self._by_label.get(get_label_name(name, namespace))
+
+    def find_all(self, names, namespace='', subtype=None):
+        """
+        Find models for several names.
+        :param names: Names of the models.
+        :type names: list
+        :param namespace: Namespace of the models, may be empty.
+        :type namespace: str
+        :param subtype: Optional subtype the models must have, e.g. 'FBModelMarkerOptical'.
+        :type subtype: str
+        :return: Models in the order of names, None for names that weren't found.
+        :rtype: list
+        """
+        models = list()
+        for name in names:
+            model = self.find(name, namespace)
+            if model is not None and subtype is not None and model.FbxGetObjectSubType() != subtype:
+                model = None
+            models.append(model)
+        return models
+
+    def get_optical_markers(self):
+        """
+        Get all optical markers in the scene.
+        :return: List of FBModelMarkerOptical models in hierarchy order.
+        :rtype: list
+        """
+        if self._optical_markers is None:
+            self._build()
+        return list(self._optical_markers)
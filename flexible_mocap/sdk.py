@@ -0,0 +1,12 @@
+"""
+MotionBuilder's pyfbsdk when it's available, the in-memory stand-in otherwise.
+
+Modules that work with scene models import the SDK from here instead of from pyfbsdk, so they can also be run and
+timed outside of MotionBuilder.
+"""
+try:
+    from pyfbsdk import *
+    HEADLESS = False
+except ImportError:
+    from flexible_mocap.standin import *
+    HEADLESS = True
@@ -0,0 +1,193 @@
+"""
+Fit skeletons to marker frames without MotionBuilder's marker set constraint.
+
+Every joint with markers in the skeleton template gets a goal by its number of markers, like map_markers_to_character
+sets up the constraint: 1 marker aims the joint at the marker, 2 markers rotate the joint, 3 or more position and
+rotate it. Position & Rotation goals of all joints and performers are fitted at once with a batched SVD (Kabsch).
+The other joints are then posed level by level along the hierarchy, all joints of a level and all performers at once.
+
+The solver holds its index arrays and results in preallocated arrays, so solving a frame only creates the
+temporary arrays of the batched operations.
+"""
+import numpy as np
+
+from flexible_mocap.gapfill import fit_rigid_bodies
+from flexible_mocap.goals import GOAL_AIM, GOAL_POSITION_ROTATION, GOAL_ROTATION, get_goal_type
+from flexible_mocap.kinematics import get_depths
+from flexible_mocap.transforms import rotation_between
+
+
+class SegmentSolver(object):
+    """
+    Solves the global rotations and positions of the joints of one or more performers per marker frame.
+
+    All performers share the template's hierarchy and markers, but may have their own offsets, e.g. after applying
+    each performer's estimated offsets. Joints whose markers aren't visible enough for their goal, and joints without
+    markers, keep their rest rotation relative to their parent.
+
+    :ivar names: Names of the solved joints (the template's bones and end joints) in topological order.
+    :ivar marker_names: Names of the template's markers, the order in which the solver expects the points.
+    :ivar goal_types: Goal type of each joint, -1 for joints without markers.
+    :ivar rotations: Global rotations of the last solved frame of shape (performers, joints, 3, 3).
+    :ivar positions: Global positions of the last solved frame of shape (performers, joints, 3).
+    :ivar solved: Whether each joint's goal was met in the last frame, shape (performers, joints).
+    """
+    def __init__(self, templates):
+        """
+        :param templates: Skeleton template or list of one template per performer, all with the same joints.
+        :type templates: flexible_mocap.template.SkeletonTemplate
+        """
+        if not isinstance(templates, (list, tuple)):
+            templates = [templates]
+        template = templates[0]
+        for other in templates[1:]:
+            if other.names != template.names or other.parents != template.parents or other.types != template.types:
+                raise ValueError("Templates of all performers must have the same joints and markers.")
+
+        joints = [i for i in template.order if template.types[i] != 'marker']
+        self.names = [template.names[i] for i in joints]
+        self.marker_names = template.get_names('marker')
+        joint_index = dict((name, i) for i, name in enumerate(self.names))
+        self.parent_indices = np.array([joint_index.get(template.parents[i], -1) for i in joints], dtype=np.intp)
+        marker_indices = template.get_indices(self.marker_names)
+        marker_joints = np.array([joint_index[template.parents[i]] for i in marker_indices], dtype=np.intp)
+
+        # Local offsets of the joints and the markers per performer in meter.
+        offsets = np.nan_to_num(np.array([t.offsets for t in templates]))
+        self.offsets = offsets[:, joints]
+        marker_offsets = offsets[:, marker_indices]
+        num_performers = len(templates)
+        num_joints = len(self.names)
+
+        joint_markers = [np.flatnonzero(marker_joints == j) for j in range(num_joints)]
+        self.goal_types = np.array([-1 if get_goal_type(len(m)) is None else get_goal_type(len(m))
+                                    for m in joint_markers], dtype=np.intp)
+
+        # Position & Rotation goals: marker indices padded to the joint with the most markers.
+        self._fit_joints = np.flatnonzero(self.goal_types == GOAL_POSITION_ROTATION)
+        max_markers = max([len(joint_markers[j]) for j in self._fit_joints] or [0])
+        self._fit_markers = np.zeros((len(self._fit_joints), max_markers), dtype=np.intp)
+        self._fit_valid = np.zeros((len(self._fit_joints), max_markers), dtype=bool)
+        for s, j in enumerate(self._fit_joints):
+            self._fit_markers[s, :len(joint_markers[j])] = joint_markers[j]
+            self._fit_valid[s, :len(joint_markers[j])] = True
+        self._fit_reference = marker_offsets[:, self._fit_markers] * self._fit_valid[..., np.newaxis]
+        self._fit_slot = np.full(num_joints, -1, dtype=np.intp)
+        self._fit_slot[self._fit_joints] = np.arange(len(self._fit_joints))
+
+        # Joints are posed level by level, each level only depends on the levels above.
+        depths = get_depths(self.parent_indices, np.arange(num_joints))
+        self._levels = list()
+        for depth in range(depths.max() + 1 if num_joints else 0):
+            level = np.flatnonzero(depths == depth)
+            goals = self.goal_types[level]
+            fit = level[goals == GOAL_POSITION_ROTATION]
+            aim = level[goals == GOAL_AIM]
+            rotate = level[goals == GOAL_ROTATION]
+            aim_markers = np.array([joint_markers[j][0] for j in aim], dtype=np.intp)
+            rotate_markers = np.array([joint_markers[j][:2] for j in rotate], dtype=np.intp).reshape(-1, 2)
+            self._levels.append({
+                'joints': level,
+                'parents': self.parent_indices[level],
+                'is_root': self.parent_indices[level] < 0,
+                'fit': (np.flatnonzero(goals == GOAL_POSITION_ROTATION), self._fit_slot[fit]),
+                'aim': (np.flatnonzero(goals == GOAL_AIM), aim_markers, marker_offsets[:, aim_markers]),
+                'rotate': (np.flatnonzero(goals == GOAL_ROTATION), rotate_markers,
+                           marker_offsets[:, rotate_markers[:, 1]] - marker_offsets[:, rotate_markers[:, 0]]),
+            })
+
+        self.rotations = np.tile(np.eye(3), (num_performers, num_joints, 1, 1))
+        self.positions = np.zeros((num_performers, num_joints, 3))
+        self.solved = np.zeros((num_performers, num_joints), dtype=bool)
+
+    @property
+    def performer_count(self):
+        return self.offsets.shape[0]
+
+    def solve(self, points, visible=None):
+        """
+        Solve one frame of all performers.
+        :param points: Marker positions in meter of shape (performers, markers, 3), or (performers, markers, 4) with
+                       residuals as streamed or read from C3D. Markers in the order of marker_names.
+        :type points: numpy.ndarray
+        :param visible: Visibility mask of shape (performers, markers). None derives it from the residuals of
+                        4 component points, or from NaN positions otherwise.
+        :type visible: numpy.ndarray
+        :return: Global rotations of shape (performers, joints, 3, 3) and positions of shape (performers, joints, 3).
+                 The arrays are overwritten by the next call.
+        :rtype: tuple
+        """
+        points = np.asarray(points)
+        if visible is None:
+            visible = points[..., 3] >= 0.0 if points.shape[-1] > 3 else ~np.isnan(points[..., 0])
+        # Invisible markers may be NaN, which would spread through the weighted sums of the fit even with weight 0.
+        positions = np.where(visible[..., np.newaxis], points[..., :3], 0.0).astype(np.float64)
+
+        # Fit all Position & Rotation goals at once.
+        if len(self._fit_joints):
+            weights = visible[:, self._fit_markers] & self._fit_valid
+            fit_ok = weights.sum(axis=-1) >= 3
+            fit_rotations, reference_centroids, target_centroids = fit_rigid_bodies(
+                self._fit_reference, positions[:, self._fit_markers], weights.astype(np.float64))
+            # The joint is at the origin of its markers' reference layout.
+            fit_positions = target_centroids - np.einsum('psij,psj->psi', fit_rotations, reference_centroids)
+
+        rotations = self.rotations
+        joint_positions = self.positions
+        for level in self._levels:
+            joints = level['joints']
+            parents = level['parents']
+            is_root = level['is_root']
+            # Start out with the rest pose relative to the parent.
+            parent_rotations = np.where(is_root[:, np.newaxis, np.newaxis], np.eye(3), rotations[:, parents])
+            parent_positions = np.where(is_root[:, np.newaxis], 0.0, joint_positions[:, parents])
+            level_rotations = parent_rotations.copy()
+            level_positions = parent_positions + np.einsum('pjik,pjk->pji', parent_rotations, self.offsets[:, joints])
+            level_solved = np.zeros(level_positions.shape[:2], dtype=bool)
+
+            columns, slots = level['fit']
+            if len(columns):
+                ok = fit_ok[:, slots]
+                level_rotations[:, columns] = np.where(ok[..., np.newaxis, np.newaxis], fit_rotations[:, slots],
+                                                       level_rotations[:, columns])
+                level_positions[:, columns] = np.where(ok[..., np.newaxis], fit_positions[:, slots],
+                                                       level_positions[:, columns])
+                level_solved[:, columns] = ok
+
+            # Aim and Rotation goals turn the rest rotation the shortest way onto the markers.
+            columns, markers, reference = level['aim']
+            if len(columns):
+                ok = visible[:, markers]
+                targets = positions[:, markers] - level_positions[:, columns]
+                self._turn(level_rotations, columns, reference, targets, ok)
+                level_solved[:, columns] = ok
+            columns, markers, reference = level['rotate']
+            if len(columns):
+                ok = visible[:, markers[:, 0]] & visible[:, markers[:, 1]]
+                targets = positions[:, markers[:, 1]] - positions[:, markers[:, 0]]
+                self._turn(level_rotations, columns, reference, targets, ok)
+                level_solved[:, columns] = ok
+
+            rotations[:, joints] = level_rotations
+            joint_positions[:, joints] = level_positions
+            self.solved[:, joints] = level_solved
+        return rotations, joint_positions
+
+    @staticmethod
+    def _turn(level_rotations, columns, reference, targets, ok):
+        """ Rotate joints so that their reference vectors in rest orientation point along the targets. """
+        rest = level_rotations[:, columns]
+        turn = rotation_between(np.einsum('pjik,pjk->pji', rest, reference), targets)
+        level_rotations[:, columns] = np.where(ok[..., np.newaxis, np.newaxis], np.matmul(turn, rest), rest)
+
+    def local_rotations(self):
+        """
+        Rotations of the joints relative to their parents of the last solved frame.
+        :return: Rotation matrices of shape (performers, joints, 3, 3).
+        :rtype: numpy.ndarray
+        """
+        parent_rotations = self.rotations[:, np.maximum(self.parent_indices, 0)]
+        local = np.matmul(parent_rotations.swapaxes(-1, -2), self.rotations)
+        roots = self.parent_indices < 0
+        local[:, roots] = self.rotations[:, roots]
+        return local
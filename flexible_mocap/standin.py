@@ -0,0 +1,523 @@
+"""
+Lightweight in-memory stand-in for the parts of MotionBuilder's pyfbsdk that the setup uses.
+
+It mimics names and behaviour of pyfbsdk closely enough to run and time the setup logic outside of MotionBuilder.
+Nothing is evaluated or drawn, models only keep their properties and hierarchy. Scene operations can be recorded
+with FBScene.start_recording to check what a function changes, and in which order.
+"""
+import collections
+
+# Joints of a HumanIK character that have a slot in the character definition and the marker set.
+HIK_JOINT_NAMES = (
+    ['Reference', 'Hips', 'Neck', 'Head'] +
+    ['Spine'] + ['Spine{}'.format(i) for i in range(1, 10)] +
+    ['Neck{}'.format(i) for i in range(1, 10)] +
+    [side + name for side in ('Left', 'Right') for name in (
+        'UpLeg', 'Leg', 'Foot', 'ToeBase', 'Shoulder', 'Arm', 'ForeArm', 'Hand', 'FingerBase',
+        'UpLegRoll', 'LegRoll', 'ArmRoll', 'ForeArmRoll')] +
+    [side + 'Hand' + finger + str(i) for side in ('Left', 'Right')
+     for finger in ('Thumb', 'Index', 'Middle', 'Ring', 'Pinky') for i in range(1, 5)] +
+    [side + 'Foot' + finger + str(i) for side in ('Left', 'Right')
+     for finger in ('Thumb', 'Index', 'Middle', 'Ring', 'Pinky') for i in range(1, 5)])
+
+
+class FBSceneChangeType(object):
+    """ Subset of the scene change types MotionBuilder reports. """
+    kFBSceneChangeNone = 0
+    kFBSceneChangeDestroy = 1
+    kFBSceneChangeAttach = 2
+    kFBSceneChangeDetach = 3
+    kFBSceneChangeAddChild = 4
+    kFBSceneChangeRemoveChild = 5
+    kFBSceneChangeSelect = 6
+    kFBSceneChangeUnselect = 7
+    kFBSceneChangeRenamed = 8
+
+
+class FBEventSceneChange(object):
+    def __init__(self, change_type, component, child=None):
+        self.Type = change_type
+        self.Component = component
+        self.ChildComponent = child
+
+
+class CallbackList(object):
+    """ Callbacks of an event like FBScene.OnChange. Callbacks are called with (control, event). """
+    def __init__(self, control):
+        self._control = control
+        self._callbacks = list()
+
+    def Add(self, callback):
+        self._callbacks.append(callback)
+
+    def Remove(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def RemoveAll(self):
+        del self._callbacks[:]
+
+    def fire(self, event):
+        for callback in list(self._callbacks):
+            callback(self._control, event)
+
+
+class FBVector3d(object):
+    __slots__ = ('_data',)
+
+    def __init__(self, *args):
+        if len(args) == 1:
+            args = tuple(args[0])
+        self._data = [float(v) for v in args] if args else [0.0, 0.0, 0.0]
+
+    def __getitem__(self, index):
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        self._data[index] = float(value)
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        return FBVector3d([a + b for a, b in zip(self, other)])
+
+    def __sub__(self, other):
+        return FBVector3d([a - b for a, b in zip(self, other)])
+
+    def __repr__(self):
+        return "FBVector3d({}, {}, {})".format(*self._data)
+
+
+class FBColor(FBVector3d):
+    __slots__ = ()
+
+    def __repr__(self):
+        return "FBColor({}, {}, {})".format(*self._data)
+
+
+class FBProperty(object):
+    """ A named property of a model, character or marker set, as returned by PropertyList.Find. """
+    def __init__(self, owner, name, data=None):
+        self._owner = owner
+        self._data = data
+        self.Name = name
+
+    @property
+    def Data(self):
+        return self._data
+
+    @Data.setter
+    def Data(self, value):
+        self._data = value
+        _scene.record('set', self._owner.LongName, self.Name, value)
+
+
+class FBPropertyListObject(FBProperty):
+    """ A property that holds a list of connected objects, e.g. a character's joint slot or a marker set's markers. """
+    def __init__(self, owner, name):
+        super(FBPropertyListObject, self).__init__(owner, name)
+        self._sources = list()
+
+    def __len__(self):
+        return len(self._sources)
+
+    def __getitem__(self, index):
+        return self._sources[index]
+
+    def append(self, component):
+        self.ConnectSrc(component)
+
+    def ConnectSrc(self, component):
+        self._sources.append(component)
+        _scene.record('connect', self._owner.LongName, self.Name, component.LongName)
+        return True
+
+    def DisconnectAllSrc(self):
+        del self._sources[:]
+
+    def GetSrcCount(self):
+        return len(self._sources)
+
+    def GetSrc(self, index):
+        return self._sources[index]
+
+    def BeginChange(self):
+        pass
+
+    def EndChange(self):
+        pass
+
+
+class FBPropertyList(object):
+    """ Properties by name, in the order they were added. """
+    def __init__(self, properties=()):
+        self._properties = collections.OrderedDict((prop.Name, prop) for prop in properties)
+
+    def __iter__(self):
+        return iter(list(self._properties.values()))
+
+    def __len__(self):
+        return len(self._properties)
+
+    def Find(self, name):
+        return self._properties.get(name)
+
+
+class FBModel(object):
+    """
+    A model in the scene hierarchy. Names may contain a namespace, e.g. 'C3D:A0'.
+    Setting attributes that start with an upper case letter, like in pyfbsdk, is recorded by the scene.
+    """
+    def __init__(self, name):
+        self._namespace, self._name = self._split(name)
+        if self._namespace:
+            _scene.add_namespace(self._namespace)
+        self._parent = None
+        self._property_list = None
+        _scene.record('create', type(self).__name__, self.LongName)
+        self.__dict__.update(Children=list(), Translation=FBVector3d(), Rotation=FBVector3d(),
+                             Show=False, Selected=False)
+        _scene.Components.append(self)
+        # New models are children of the scene's root, like in MotionBuilder.
+        if _scene.RootModel is not None:
+            FBModel.Parent.fset(self, _scene.RootModel)
+
+    @staticmethod
+    def _split(long_name):
+        namespace, _, name = long_name.rpartition(':')
+        return namespace, name
+
+    def __setattr__(self, name, value):
+        if name[0].isupper():
+            _scene.record('set', self.LongName, name, value)
+        object.__setattr__(self, name, value)
+
+    def FbxGetObjectSubType(self):
+        return type(self).__name__
+
+    @property
+    def PropertyList(self):
+        """ Only properties that aren't attributes of the stand-in models are listed. """
+        if self._property_list is None:
+            self._property_list = FBPropertyList(
+                FBProperty(self, name, FBVector3d()) for name in ('Rotation Pivot', 'Scaling Pivot',
+                                                                  'Rotation Offset', 'Scaling Offset'))
+        return self._property_list
+
+    def _notify(self, change_type, child=None):
+        _scene.OnChange.fire(FBEventSceneChange(change_type, self, child))
+
+    @property
+    def Name(self):
+        return self._name
+
+    @Name.setter
+    def Name(self, value):
+        self._name = value
+        self._notify(FBSceneChangeType.kFBSceneChangeRenamed)
+
+    @property
+    def LongName(self):
+        return ':'.join([self._namespace, self._name]) if self._namespace else self._name
+
+    @LongName.setter
+    def LongName(self, value):
+        self._namespace, self._name = self._split(value)
+        if self._namespace:
+            _scene.add_namespace(self._namespace)
+        self._notify(FBSceneChangeType.kFBSceneChangeRenamed)
+
+    @property
+    def Parent(self):
+        # Like in MotionBuilder, models at the top of the hierarchy have no parent, not the scene's root.
+        if self._parent is _scene.RootModel:
+            return None
+        return self._parent
+
+    @Parent.setter
+    def Parent(self, parent):
+        if self._parent is not None:
+            self._parent.Children.remove(self)
+            self._parent._notify(FBSceneChangeType.kFBSceneChangeRemoveChild, self)
+        self._parent = parent
+        if parent is not None:
+            parent.Children.append(self)
+            parent._notify(FBSceneChangeType.kFBSceneChangeAddChild, self)
+
+    def GetVector(self, vector):
+        """ Global translation, the sum of the local translations up the hierarchy (rotations are ignored). """
+        total = [0.0, 0.0, 0.0]
+        node = self
+        while node is not None:
+            for i in range(3):
+                total[i] += node.Translation[i]
+            node = node.Parent
+        for i in range(3):
+            vector[i] = total[i]
+
+    def FBDelete(self):
+        for child in list(self.Children):
+            child.FBDelete()
+        self.Parent = None
+        if self in _scene.Components:
+            _scene.Components.remove(self)
+        self._notify(FBSceneChangeType.kFBSceneChangeDestroy)
+
+
+class FBModelNull(FBModel):
+    pass
+
+
+class FBModelMarker(FBModel):
+    pass
+
+
+class FBModelMarkerOptical(FBModelMarker):
+    pass
+
+
+class FBModelSkeleton(FBModel):
+    def __init__(self, name):
+        super(FBModelSkeleton, self).__init__(name)
+        self.__dict__.update(Color=FBColor(0.8, 0.8, 0.8), Size=1.0, RotationActive=False)
+
+
+class FBModelRoot(FBModel):
+    def __init__(self, name):
+        super(FBModelRoot, self).__init__(name)
+        self.__dict__.update(Size=1.0)
+
+
+class FBNamespace(object):
+    def __init__(self, name):
+        self.Name = name
+
+
+class FBScene(object):
+    def __init__(self):
+        self.Components = list()
+        self.Namespaces = list()
+        self.OnChange = CallbackList(self)
+        self.RootModel = None
+        self.Characters = list()
+        self.current_character = None
+        self.change_depth = 0  # Nesting level of FBBeginChangeAllModels.
+        self.operations = None  # List of recorded operations while recording.
+
+    def start_recording(self):
+        """ Record scene operations as tuples like ('create', class name, label name) or ('set', label name,
+        attribute, value) until stop_recording is called. """
+        self.operations = list()
+
+    def stop_recording(self):
+        """ Stop recording and return the recorded operations. """
+        operations, self.operations = self.operations, None
+        return operations or list()
+
+    def record(self, *operation):
+        if self.operations is not None:
+            self.operations.append(operation)
+
+    def add_namespace(self, name):
+        if not self.NamespaceExist(name):
+            self.Namespaces.append(FBNamespace(name))
+
+    def NamespaceExist(self, name):
+        return any(namespace.Name == name for namespace in self.Namespaces)
+
+    def clear(self):
+        """ Start a new empty scene, like File > New. """
+        self.Components = list()
+        self.Namespaces = list()
+        self.Characters = list()
+        self.current_character = None
+        self.RootModel = None
+        self.RootModel = FBModel('Scene')
+        self.OnChange.fire(FBEventSceneChange(FBSceneChangeType.kFBSceneChangeDestroy, self))
+
+
+_scene = FBScene()
+_scene.clear()
+
+
+class FBSystem(object):
+    """ Access to the scene. All instances share the same scene, as in MotionBuilder. """
+    @property
+    def Scene(self):
+        return _scene
+
+
+class FBModelList(list):
+    pass
+
+
+def FBGetSelectedModels(model_list):
+    """ Add the selected models of the scene to model_list. """
+    for component in _scene.Components:
+        if isinstance(component, FBModel) and component.Selected:
+            model_list.append(component)
+
+
+class FBCharacterMarkerSet(object):
+    """ Marker set of a character with a '<joint>.Markers' and '<joint>.Constraint' property per HIK joint. """
+    def __init__(self, character):
+        self._character = character
+        self.Name = character.Name + '_MarkerSet'
+        properties = list()
+        for name in HIK_JOINT_NAMES:
+            properties.append(FBPropertyListObject(self, name + '.Markers'))
+            properties.append(FBProperty(self, name + '.Constraint', 0))
+        self.PropertyList = FBPropertyList(properties)
+
+    @property
+    def LongName(self):
+        return self.Name
+
+    def FBDelete(self):
+        if self._character._marker_set is self:
+            self._character._marker_set = None
+
+
+class FBCharacter(object):
+    """ Character with a '<joint>Link' slot per HIK joint. """
+    def __init__(self, name):
+        self.Name = name
+        self.ActiveInput = False
+        self.characterized = False
+        self.control_rig = None
+        self._marker_set = None
+        self.PropertyList = FBPropertyList(FBPropertyListObject(self, name + 'Link') for name in HIK_JOINT_NAMES)
+        _scene.Characters.append(self)
+
+    @property
+    def LongName(self):
+        return self.Name
+
+    def SetCharacterizeOn(self, characterize):
+        self.characterized = bool(characterize)
+        return True
+
+    def CreateControlRig(self, forward_and_inverse):
+        self.control_rig = forward_and_inverse
+        return True
+
+    def GetCharacterMarkerSet(self, find_default=False):
+        return self._marker_set
+
+    def CreateCharacterMarkerSet(self, add_to_character=True):
+        self._marker_set = FBCharacterMarkerSet(self)
+        return self._marker_set
+
+    def FBDelete(self):
+        if self in _scene.Characters:
+            _scene.Characters.remove(self)
+
+
+class FBApplication(object):
+    """ Access to the current character. All instances share it, as in MotionBuilder. """
+    @property
+    def CurrentCharacter(self):
+        return _scene.current_character
+
+    @CurrentCharacter.setter
+    def CurrentCharacter(self, character):
+        _scene.current_character = character
+
+
+class FBCellStyle(object):
+    kFBCellStyleDefault = 0
+    kFBCellStyleString = 1
+    kFBCellStyleDouble = 2
+    kFBCellStyleInteger = 3
+    kFBCellStyleButton = 4
+    kFBCellStyle2StatesButton = 5
+    kFBCellStyle3StatesButton = 6
+    kFBCellStyleMenu = 7
+    kFBCellStyleVoid = 8
+
+
+class FBSpreadColumn(object):
+    def __init__(self, caption=''):
+        self.Caption = caption
+        self.Width = 100
+
+
+class FBSpreadCell(object):
+    def __init__(self):
+        self.Style = FBCellStyle.kFBCellStyleDefault
+
+
+class FBSpread(object):
+    """
+    Spreadsheet that keeps its cells in memory. It counts the cells that are written to,
+    because that's where the time is spent in MotionBuilder.
+    """
+    def __init__(self):
+        self.Caption = ''
+        self.cell_writes = 0
+        self.Clear()
+
+    def Clear(self):
+        self.columns = collections.OrderedDict([(-1, FBSpreadColumn())])
+        self.rows = collections.OrderedDict()  # Row reference to caption.
+        self.cells = dict()  # (row reference, column) to value.
+        self.cell_styles = dict()  # (row reference, column) to FBSpreadCell.
+
+    def ColumnAdd(self, caption, reference=None):
+        self.columns[len(self.columns) - 1 if reference is None else reference] = FBSpreadColumn(caption)
+
+    def GetColumn(self, index):
+        return self.columns[index]
+
+    def RowAdd(self, caption, reference):
+        self.rows[reference] = caption
+
+    def GetRow(self, reference):
+        return self.rows[reference]
+
+    def SetCellValue(self, reference, column, value):
+        self.cells[(reference, column)] = value
+        self.cell_writes += 1
+
+    def GetCellValue(self, reference, column):
+        return self.cells.get((reference, column), '')
+
+    def GetSpreadCell(self, reference, column):
+        return self.cell_styles.setdefault((reference, column), FBSpreadCell())
+
+
+def FBFindModelByLabelName(label_name):
+    """ Find a model by its name including namespace. Walks the whole scene like the original. """
+    for component in _scene.Components:
+        if isinstance(component, FBModel) and component.LongName == label_name:
+            return component
+    return None
+
+
+def FBBeginChangeAllModels():
+    """ Begin a block of changes. MotionBuilder evaluates the scene only once at the end of the block. """
+    _scene.change_depth += 1
+    _scene.record('begin')
+
+
+def FBEndChangeAllModels():
+    if _scene.change_depth <= 0:
+        raise RuntimeError("FBEndChangeAllModels called without FBBeginChangeAllModels.")
+    _scene.change_depth -= 1
+    _scene.record('end')
+
+
+def FBMessageBox(title, message, *buttons):
+    """ There's no user to click, so messages are printed and the first button counts as clicked. """
+    print("{}: {}".format(title, message))
+    return 1
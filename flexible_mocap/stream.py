@@ -0,0 +1,549 @@
+"""
+Real-time optical marker stream over UDP or TCP.
+
+Each marker frame is sent as one fixed-size packet: a header with magic bytes, frame number, send time and marker
+count, followed by X, Y, Z and residual of every marker as little endian float32, like C3DFile.read_points returns
+them. Invisible markers have a residual of -1. Sender and receiver agree on the marker labels and their order
+beforehand, e.g. the marker names of the skeleton template.
+
+Packets are received directly into the slots of a preallocated MarkerRingBuffer, so no arrays are created per frame.
+The buffer has a single writer (the receiver thread) and any number of readers, which check the write counter
+instead of taking a lock.
+
+C3DStreamServer replays a C3D file at its capture rate, so the stream can be tested on any machine without cameras.
+
+Usage:
+    python -m flexible_mocap.stream recording.c3d [--host HOST] [--port PORT] [--protocol udp|tcp] [--loop]
+"""
+from __future__ import print_function
+
+import argparse
+import select
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+from flexible_mocap.c3d import C3DFile
+
+MAGIC = b'FMS1'
+DEFAULT_PORT = 7480
+
+# Scale from the units of C3D point data to meter.
+UNIT_SCALES = {'mm': 0.001, 'cm': 0.01, 'm': 1.0}
+# Seconds the server busy-waits at most before sending a frame, and the shortest sleep before that.
+SPIN_TIME = 0.0002
+MIN_SLEEP_TIME = 0.00005
+
+
+def get_packet_dtype(marker_count):
+    """
+    Get the layout of a marker frame packet.
+    :param marker_count: Number of markers per frame.
+    :type marker_count: int
+    :return: Packed structured dtype of one packet.
+    :rtype: numpy.dtype
+    """
+    return np.dtype([('magic', 'S4'),
+                     ('frame', '<u4'),
+                     ('timestamp', '<f8'),
+                     ('count', '<u4'),
+                     ('points', '<f4', (marker_count, 4))])
+
+
+class MarkerRingBuffer(object):
+    """
+    Preallocated ring buffer of marker frames with one writer and lock-free readers.
+
+    The writer fills the slot at write_count % capacity and only then increments write_count, so readers never
+    see a slot that's being written as the latest frame. A reader that falls behind by more than the capacity
+    loses the overwritten frames, which read_new reports.
+
+    Frames must arrive in the order of their frame numbers. A late or duplicate frame, e.g. a UDP datagram that took
+    another route, is dropped instead of being published after a newer frame. A frame number that's more than the
+    capacity behind the last one is taken as a restarted sender and starts the sequence anew.
+
+    :ivar packets: Structured array of shape (capacity,) holding the packets as they were received.
+    :ivar points: View onto the packets' points of shape (capacity, markers, 4).
+    :ivar frames: View onto the packets' frame numbers.
+    :ivar timestamps: View onto the packets' send times.
+    :ivar arrival_times: Time each packet was committed.
+    :ivar write_count: Number of frames written so far.
+    :ivar invalid_count: Number of packets that were rejected, e.g. with the wrong number of markers.
+    :ivar lost_count: Number of frames that were skipped by the sender's frame numbers, e.g. lost UDP packets.
+    :ivar out_of_order_count: Number of frames that were dropped because they weren't newer than the last frame.
+    """
+    def __init__(self, capacity, marker_count):
+        """
+        :param capacity: Number of frames the buffer holds, e.g. 1 second of frames.
+        :type capacity: int
+        :param marker_count: Number of markers per frame.
+        :type marker_count: int
+        """
+        self.capacity = capacity
+        self.marker_count = marker_count
+        self.packets = np.zeros(capacity, dtype=get_packet_dtype(marker_count))
+        self.packet_size = self.packets.dtype.itemsize
+        self.points = self.packets['points']
+        self.frames = self.packets['frame']
+        self.timestamps = self.packets['timestamp']
+        self.arrival_times = np.zeros(capacity)
+        # Writable views onto the bytes of each slot to receive packets into.
+        data = self.packets.view(np.uint8).reshape(capacity, self.packet_size)
+        self.slot_buffers = [memoryview(data[i]) for i in range(capacity)]
+        self.write_count = 0
+        self.invalid_count = 0
+        self.lost_count = 0
+        self.out_of_order_count = 0
+        self._last_frame = None
+
+    def __len__(self):
+        return min(self.write_count, self.capacity)
+
+    def next_buffer(self):
+        """ Writable buffer of the slot the next frame goes into. """
+        return self.slot_buffers[self.write_count % self.capacity]
+
+    def reset_sequence(self):
+        """ Accept any frame number as the next one, e.g. when connecting to a new sender. """
+        self._last_frame = None
+
+    def commit(self, arrival_time=None):
+        """
+        Publish the frame that was written into next_buffer, after checking it's a valid packet.
+        :param arrival_time: Time the frame arrived. Defaults to now.
+        :type arrival_time: float
+        :return: Whether the frame was valid, newer than the last frame and published.
+        :rtype: bool
+        """
+        slot = self.write_count % self.capacity
+        packet = self.packets[slot]
+        if packet['magic'] != MAGIC or packet['count'] != self.marker_count:
+            self.invalid_count += 1
+            return False
+        frame = int(packet['frame'])
+        last = self._last_frame
+        if last is not None:
+            if frame > last + 1:
+                self.lost_count += frame - last - 1
+            elif frame <= last and last - frame <= self.capacity:
+                # The slot is left unpublished and taken by the next frame.
+                self.out_of_order_count += 1
+                return False
+        self._last_frame = frame
+        self.arrival_times[slot] = time.time() if arrival_time is None else arrival_time
+        self.write_count += 1
+        return True
+
+    def write(self, frame, timestamp, points, arrival_time=None):
+        """
+        Copy a frame into the buffer, e.g. from a C3D replay without network.
+        :param frame: Frame number.
+        :type frame: int
+        :param timestamp: Time the frame was captured or sent.
+        :type timestamp: float
+        :param points: Points of shape (markers, 4) with X, Y, Z and residual.
+        :type points: numpy.ndarray
+        :param arrival_time: Time the frame arrived. Defaults to now.
+        :type arrival_time: float
+        :return: Whether the frame was published.
+        :rtype: bool
+        """
+        slot = self.write_count % self.capacity
+        self.packets['magic'][slot] = MAGIC
+        self.packets['count'][slot] = self.marker_count
+        self.frames[slot] = frame
+        self.timestamps[slot] = timestamp
+        self.points[slot] = points
+        return self.commit(arrival_time)
+
+    def read_latest(self, out):
+        """
+        Copy the latest frame's points.
+        :param out: Array of shape (markers, 4) to copy the points to.
+        :type out: numpy.ndarray
+        :return: Frame number, send time and arrival time of the frame, None if there's no frame yet.
+        :rtype: tuple
+        """
+        while True:
+            count = self.write_count
+            if not count:
+                return None
+            slot = (count - 1) % self.capacity
+            out[:] = self.points[slot]
+            result = int(self.frames[slot]), float(self.timestamps[slot]), float(self.arrival_times[slot])
+            # The slot is only overwritten once the writer went around the whole ring.
+            if self.write_count - count < self.capacity - 1:
+                return result
+
+    def read_new(self, cursor, out):
+        """
+        Copy all frames that were written since the cursor, oldest first.
+        :param cursor: write_count at the previous call, 0 at the first call.
+        :type cursor: int
+        :param out: Array of shape (capacity - 1, markers, 4) or larger to copy the points to.
+        :type out: numpy.ndarray
+        :return: New cursor, number of frames copied and number of frames that were overwritten before reading.
+        :rtype: tuple
+        """
+        count = self.write_count
+        # The slot after the latest frame may be being written, so at most capacity - 1 frames can be read.
+        readable = self.capacity - 1
+        missed = max(0, count - cursor - readable)
+        start = cursor + missed
+        num_frames = count - start
+        first = start % self.capacity
+        head = min(num_frames, self.capacity - first)
+        out[:head] = self.points[first:first + head]
+        out[head:num_frames] = self.points[:num_frames - head]
+        # The oldest frames may have been overwritten while copying.
+        overwritten = min(num_frames, max(0, self.write_count - start - readable))
+        if overwritten:
+            out[:num_frames - overwritten] = out[overwritten:num_frames]
+        return count, num_frames - overwritten, missed + overwritten
+
+    def visible(self, points):
+        """ Visibility mask of points that were read from the buffer. """
+        return points[..., 3] >= 0.0
+
+
+class MarkerStreamReceiver(object):
+    """
+    Receive marker frames into a ring buffer. Frames are received by calling receive, or by a background thread
+    with start and stop.
+
+    For UDP the receiver binds to the address, for TCP it connects to a server at the address.
+    """
+    def __init__(self, ring, address=('127.0.0.1', DEFAULT_PORT), protocol='udp', timeout=0.1):
+        """
+        :param ring: Ring buffer to receive into. Its marker count must match the sender's.
+        :type ring: MarkerRingBuffer
+        :param address: Host and port.
+        :type address: tuple
+        :param protocol: 'udp' or 'tcp'.
+        :type protocol: str
+        :param timeout: Seconds to wait for a frame before receive returns.
+        :type timeout: float
+        """
+        if protocol not in ('udp', 'tcp'):
+            raise ValueError("Unknown protocol {}.".format(protocol))
+        self.ring = ring
+        self.address = address
+        self.protocol = protocol
+        self.timeout = timeout
+        self.socket = None
+        self._thread = None
+        self._running = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        if self.socket is not None:
+            return
+        if self.protocol == 'udp':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # Room for a few frames in case the receiver is late.
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.ring.packet_size * 64)
+            self.socket.bind(self.address)
+        else:
+            self.socket = socket.create_connection(self.address, timeout=max(self.timeout, 1.0))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.settimeout(self.timeout)
+        self.ring.reset_sequence()
+
+    def close(self):
+        self.stop()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def receive(self):
+        """
+        Receive one frame into the ring buffer.
+        :return: Whether a valid frame was received. False on timeout.
+        :rtype: bool
+        :raises IOError: When the TCP connection was closed by the server.
+        """
+        buffer = self.ring.next_buffer()
+        size = self.ring.packet_size
+        try:
+            received = self.socket.recv_into(buffer, size)
+            if self.protocol == 'tcp':
+                if not received:
+                    raise IOError("Connection to {}:{} was closed.".format(*self.address))
+                while received < size:  # Rare, the rest of the packet is still in flight.
+                    more = self.socket.recv_into(buffer[received:], size - received)
+                    if not more:
+                        raise IOError("Connection to {}:{} was closed.".format(*self.address))
+                    received += more
+        except socket.timeout:
+            return False
+        if received != size:
+            self.ring.invalid_count += 1
+            return False
+        return self.ring.commit()
+
+    def receive_latest(self):
+        """
+        Receive the next frame and all frames that are already waiting, so the ring buffer's latest frame is the
+        newest one. Consumers that are slower than the stream use this to skip stale frames instead of falling behind.
+        :return: Number of valid frames received. 0 on timeout.
+        :rtype: int
+        :raises IOError: When the TCP connection was closed by the server.
+        """
+        if not self.receive():
+            return 0
+        count = 1
+        while select.select([self.socket], [], [], 0.0)[0]:
+            count += self.receive()
+        return count
+
+    def _run(self):
+        while self._running:
+            try:
+                self.receive()
+            except (IOError, OSError):
+                break
+        self._running = False
+
+    def start(self):
+        """ Open the socket and receive frames in a background thread. """
+        self.open()
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+
+class C3DStreamServer(object):
+    """
+    Replay the point data of a C3D file as marker stream at its capture rate.
+
+    For UDP the frames are sent to the address, for TCP the server listens at the address and streams to the first
+    client that connects.
+
+    :ivar labels: Labels of the streamed markers in the order of the packets.
+    :ivar frame_rate: Frames per second that are sent.
+    :ivar frame_count: Number of frames sent so far.
+    :ivar late_count: Number of frames that were sent later than one frame after their time.
+    """
+    def __init__(self, fullpath, address=('127.0.0.1', DEFAULT_PORT), protocol='udp', markers=None, rate=None,
+                 scale=None, loop=False, chunk_size=1024):
+        """
+        :param fullpath: full file path to the C3D file.
+        :type fullpath: str
+        :param address: Host and port.
+        :type address: tuple
+        :param protocol: 'udp' or 'tcp'.
+        :type protocol: str
+        :param markers: Labels of the markers to stream in that order. None streams all markers.
+        :type markers: list
+        :param rate: Frames per second. None uses the C3D's frame rate, 0 sends as fast as possible.
+        :type rate: float
+        :param scale: Factor for the positions. None converts the C3D's units to meter.
+        :type scale: float
+        :param loop: Whether to start over at the end of the recording.
+        :type loop: bool
+        :param chunk_size: Number of frames that are decoded from the C3D at once.
+        :type chunk_size: int
+        """
+        if protocol not in ('udp', 'tcp'):
+            raise ValueError("Unknown protocol {}.".format(protocol))
+        self.fullpath = fullpath
+        self.address = address
+        self.protocol = protocol
+        self.loop = loop
+        self.chunk_size = chunk_size
+        with C3DFile(fullpath) as c3d:
+            self.frame_rate = c3d.frame_rate if rate is None else rate
+            self.scale = UNIT_SCALES.get(c3d.units, 1.0) if scale is None else scale
+            if markers is None:
+                self.labels = list(c3d.labels)
+                self._marker_indices = None
+            else:
+                indices = c3d.marker_indices(markers)
+                missing = [name for name, i in zip(markers, indices) if i is None]
+                if missing:
+                    raise ValueError("Marker(s) {} couldn't be found in {}.".format(",".join(missing), fullpath))
+                self.labels = list(markers)
+                self._marker_indices = indices
+        self.frame_count = 0
+        self.late_count = 0
+        self.socket = None
+        self._connection = None
+        self._thread = None
+        self._running = False
+
+    def open(self):
+        """ Create the socket. For TCP the server listens from here on, so clients can connect. """
+        if self.protocol == 'udp':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(self.address)
+            self.socket.listen(1)
+
+    def close(self):
+        for sock in (self._connection, self.socket):
+            if sock is not None:
+                sock.close()
+        self._connection = None
+        self.socket = None
+
+    def _send(self, data):
+        if self.protocol == 'udp':
+            self.socket.sendto(data, self.address)
+        else:
+            self._connection.sendall(data)
+
+    def _wait_until(self, deadline):
+        """
+        Sleep until shortly before the deadline and spin for the rest, because sleep isn't precise.
+        Each sleep covers half of the time that's left, so an overshooting sleep rarely misses the deadline, and the
+        spin is bounded by SPIN_TIME to not take a core away from the receiver.
+        """
+        remaining = deadline - time.time()
+        while remaining > SPIN_TIME:
+            time.sleep(max(0.5 * (remaining - SPIN_TIME), MIN_SLEEP_TIME))
+            remaining = deadline - time.time()
+        while time.time() < deadline:
+            pass
+
+    def _accept(self):
+        """ Wait for a TCP client. Returns False if the server was stopped before one connected. """
+        self.socket.settimeout(0.1)
+        while self._running:
+            try:
+                self._connection, _ = self.socket.accept()
+            except socket.timeout:
+                continue
+            self._connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return True
+        return False
+
+    def run(self, max_frames=None):
+        """
+        Stream frames until the end of the recording, max_frames or stop.
+        :param max_frames: Maximum number of frames to send. None sends all frames.
+        :type max_frames: int
+        :return: Number of frames sent.
+        :rtype: int
+        """
+        if self.socket is None:
+            self.open()
+        self._running = True
+        return self._run(max_frames)
+
+    def _run(self, max_frames):
+        try:
+            if self.protocol == 'tcp' and not self._accept():
+                return self.frame_count
+            self._stream(max_frames)
+        except (IOError, OSError):
+            # The client disconnected.
+            pass
+        finally:
+            self._running = False
+        return self.frame_count
+
+    def _stream(self, max_frames):
+        """ Send the frames of the C3D file paced by the frame rate. """
+        # Packets of a chunk are prepared at once, sending them doesn't create objects.
+        packets = np.zeros(self.chunk_size, dtype=get_packet_dtype(len(self.labels)))
+        packets['magic'] = MAGIC
+        packets['count'] = len(self.labels)
+        data = packets.view(np.uint8).reshape(self.chunk_size, packets.dtype.itemsize)
+        buffers = [memoryview(data[i]) for i in range(self.chunk_size)]
+        period = 1.0 / self.frame_rate if self.frame_rate > 0 else 0.0
+        start_time = time.time()
+        sent = 0
+        with C3DFile(self.fullpath) as c3d:
+            while self._running:
+                for _, points, _ in c3d.iter_points(self.chunk_size, self._marker_indices):
+                    num_frames = len(points)
+                    packets['points'][:num_frames] = points
+                    packets['points'][:num_frames, :, :3] *= self.scale
+                    packets['frame'][:num_frames] = np.arange(self.frame_count, self.frame_count + num_frames)
+                    for i in range(num_frames):
+                        if not self._running or sent == max_frames:
+                            return
+                        deadline = start_time + sent * period
+                        if period and time.time() > deadline + period:
+                            self.late_count += 1
+                        self._wait_until(deadline)
+                        packets['timestamp'][i] = time.time()
+                        self._send(buffers[i])
+                        self.frame_count += 1
+                        sent += 1
+                if not self.loop:
+                    break
+
+    def start(self, max_frames=None):
+        """ Open the socket and stream frames in a background thread. """
+        self.open()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(max_frames,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.close()
+
+    @property
+    def running(self):
+        return self._running
+
+    def wait(self):
+        """ Block until the stream ended. """
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a C3D file as real-time marker stream.")
+    parser.add_argument('c3d', help="C3D file to replay.")
+    parser.add_argument('--host', default='127.0.0.1', help="Host to send to (UDP) or to listen at (TCP).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--protocol', choices=('udp', 'tcp'), default='udp')
+    parser.add_argument('--rate', type=float, default=None, help="Frames per second. Default: the C3D's rate.")
+    parser.add_argument('--loop', action='store_true', help="Start over at the end of the recording.")
+    args = parser.parse_args(argv)
+
+    server = C3DStreamServer(args.c3d, (args.host, args.port), args.protocol, rate=args.rate, loop=args.loop)
+    print("Streaming {} markers at {} Hz to {}:{} ({}).".format(len(server.labels), server.frame_rate, args.host,
+                                                                 args.port, args.protocol))
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    print("Sent {} frames, {} late.".format(server.frame_count, server.late_count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""
+Skeleton template data as read from the template CSV files.
+
+The template is parsed once into parallel arrays with typed offsets and bounds. Rows for CSV files are only
+created again when the template is saved.
+
+Saved templates are also cached in a binary .npz file next to the CSV file (e.g. template.csv.npz). The cache stores
+the modification time and size of the CSV file it was written with, and is only used while both still match.
+"""
+import csv
+import os
+import sys
+import tempfile
+import zipfile
+
+import numpy as np
+
+# Columns of the template CSV files.
+FIELDNAMES = ['name', 'parent', 'offset_x', 'offset_y', 'offset_z',
+              'bound_x_min', 'bound_x_max', 'bound_y_min', 'bound_y_max', 'bound_z_min', 'bound_z_max',
+              'type', 'rotation_mode', 'optimize_group']
+OFFSET_FIELDS = ['offset_x', 'offset_y', 'offset_z']
+BOUND_FIELDS = ['bound_x_min', 'bound_x_max', 'bound_y_min', 'bound_y_max', 'bound_z_min', 'bound_z_max']
+# Extension appended to CSV file paths for their binary cache and the version of its layout.
+CACHE_EXTENSION = '.npz'
+CACHE_VERSION = 2
+
+
+def open_csv(fullpath, mode='r'):
+    """
+    Open a CSV file the way the csv module expects it in Python 2 and 3.
+    :param fullpath: full file path to the CSV file.
+    :type fullpath: str
+    :param mode: 'r' or 'w'.
+    :type mode: str
+    :return: file object
+    """
+    if sys.version_info[0] < 3:
+        return open(fullpath, mode + 'b')
+    return open(fullpath, mode, newline='')
+
+
+def _to_float(value):
+    """ Convert a cell to float. Empty cells become NaN. """
+    if value is None or value == '':
+        return np.nan
+    return float(value)
+
+
+def _to_cell(value):
+    """ Convert a float to a cell. NaN becomes an empty cell. """
+    return '' if np.isnan(value) else float(value)
+
+
+def get_children_index(names, parents, types):
+    """
+    Index the children of each joint by their type, so they don't have to be searched for in the whole list.
+    :param names: Names of the joints.
+    :type names: list
+    :param parents: Names of the joints' parents, '' for root joints.
+    :type parents: list
+    :param types: Types of the joints.
+    :type types: list
+    :return: Dictionary of parent name to dictionary of type ('bone', 'end', 'marker') to list of child names.
+             The type None lists children of all types. Root joints are listed under the parent name ''.
+    :rtype: dict
+    """
+    index = dict()
+    for name, parent, joint_type in zip(names, parents, types):
+        children = index.setdefault(parent or '', dict())
+        children.setdefault(joint_type, list()).append(name)
+        children.setdefault(None, list()).append(name)
+    return index
+
+
+def get_children(children_index, parent, joint_type=None):
+    """
+    Get children of a joint from a children index.
+    :param children_index: Index as returned by get_children_index.
+    :type children_index: dict
+    :param parent: Name of the parent joint. '' for root joints.
+    :type parent: str
+    :param joint_type: Type of the children, e.g. 'marker'. None returns children of all types.
+    :type joint_type: str
+    :return: List of child names.
+    :rtype: list
+    """
+    return list(children_index.get(parent, dict()).get(joint_type, list()))
+
+
+def get_topological_order(parent_indices):
+    """
+    Order joints depth-first so that parents come before their children, each joint's subtree in one block.
+    :param parent_indices: Indices of the parents, -1 for root joints.
+    :type parent_indices: numpy.ndarray
+    :return: Indices of the joints in topological order.
+    :rtype: numpy.ndarray
+    :raises ValueError: If the hierarchy contains a cycle.
+    """
+    children = [list() for _ in parent_indices]
+    roots = list()
+    for i, parent in enumerate(parent_indices):
+        if parent < 0:
+            roots.append(i)
+        else:
+            children[parent].append(i)
+    order = list()
+    stack = list(reversed(roots))
+    while stack:
+        i = stack.pop()
+        order.append(i)
+        stack.extend(reversed(children[i]))
+    if len(order) != len(parent_indices):
+        raise ValueError("Hierarchy contains a cycle.")
+    return np.array(order, dtype=np.intp)
+
+
+class Joint(object):
+    """
+    View onto one joint of a SkeletonTemplate.
+    """
+    __slots__ = ('template', 'index')
+
+    def __init__(self, template, index):
+        self.template = template
+        self.index = index
+
+    def __repr__(self):
+        return "Joint({!r})".format(self.name)
+
+    @property
+    def name(self):
+        return self.template.names[self.index]
+
+    @property
+    def parent(self):
+        return self.template.parents[self.index]
+
+    @property
+    def parent_index(self):
+        return int(self.template.parent_indices[self.index])
+
+    @property
+    def type(self):
+        return self.template.types[self.index]
+
+    @property
+    def rotation_mode(self):
+        return self.template.rotation_modes[self.index]
+
+    @property
+    def offset(self):
+        """ Offset to the parent in meter. NaN for joints without offset. """
+        return self.template.offsets[self.index]
+
+    @property
+    def bounds(self):
+        """ Bounds of the offset as x_min, x_max, y_min, y_max, z_min, z_max. NaN where there are no bounds. """
+        return self.template.bounds[self.index]
+
+
+class SkeletonTemplate(object):
+    """
+    Topology, offsets and marker-to-joint mappings of a skeleton.
+
+    :ivar names: Names of the joints.
+    :ivar parents: Names of the joints' parents, '' for root joints.
+    :ivar parent_indices: Indices of the parents as array, -1 for root joints.
+    :ivar offsets: Offsets to the parents in meter as array of shape (joints, 3). NaN where the offset is empty.
+    :ivar bounds: Bounds for the offsets as array of shape (joints, 6). NaN where the bounds are empty.
+    :ivar types: Types of the joints, 'bone', 'end' or 'marker'.
+    :ivar rotation_modes: Rotation modes of the joints, e.g. 'ball', 'hingeX' or ''.
+    :ivar optimize_groups: Optimization groups of the joints as strings.
+    :ivar index: Dictionary of joint name to index.
+    :ivar order: Indices of the joints in topological order, parents before their children.
+    """
+    def __init__(self, names, parents, offsets, bounds, types, rotation_modes, optimize_groups=None):
+        self.names = list(names)
+        self.parents = [parent or '' for parent in parents]
+        self.offsets = np.asarray(offsets, dtype=np.float64).reshape(-1, 3)
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+        self.types = list(types)
+        self.rotation_modes = list(rotation_modes)
+        self.optimize_groups = list(optimize_groups) if optimize_groups is not None else [''] * len(self.names)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        if len(self.index) != len(self.names):
+            raise ValueError("Joint names in skeleton template must be unique.")
+        self.parent_indices = np.array([self.index.get(parent, -1) for parent in self.parents], dtype=np.intp)
+        self.order = get_topological_order(self.parent_indices)
+        self._children_index = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Create a template from rows of a template CSV file or entries as collected by get_joints_info.
+        :param rows: Iterable of dictionaries with keys of FIELDNAMES. Missing keys are treated as empty.
+        :type rows: iterable
+        :return: New template.
+        :rtype: SkeletonTemplate
+        """
+        names, parents, offsets, bounds, types, rotation_modes, optimize_groups = [], [], [], [], [], [], []
+        for row in rows:
+            names.append(row['name'])
+            parents.append(row.get('parent') or '')
+            offsets.append([_to_float(row.get(field)) for field in OFFSET_FIELDS])
+            bounds.append([_to_float(row.get(field)) for field in BOUND_FIELDS])
+            types.append(row.get('type') or '')
+            rotation_modes.append(row.get('rotation_mode') or '')
+            optimize_groups.append(row.get('optimize_group') or '')
+        return cls(names, parents, offsets, bounds, types, rotation_modes, optimize_groups)
+
+    def to_rows(self):
+        """
+        Convert the template to rows for a template CSV file.
+        :return: List of dictionaries with keys of FIELDNAMES.
+        :rtype: list
+        """
+        rows = list()
+        for i, name in enumerate(self.names):
+            row = {'name': name,
+                   'parent': self.parents[i],
+                   'type': self.types[i],
+                   'rotation_mode': self.rotation_modes[i],
+                   'optimize_group': self.optimize_groups[i]}
+            row.update(zip(OFFSET_FIELDS, [_to_cell(v) for v in self.offsets[i]]))
+            row.update(zip(BOUND_FIELDS, [_to_cell(v) for v in self.bounds[i]]))
+            rows.append(row)
+        return rows
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield Joint(self, i)
+
+    def __getitem__(self, key):
+        """ Get a joint by index or name. """
+        if not isinstance(key, (int, np.integer)):
+            key = self.index[key]
+        return Joint(self, key)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    @property
+    def children_index(self):
+        """ Children of each joint by type, see get_children_index. """
+        if self._children_index is None:
+            self._children_index = get_children_index(self.names, self.parents, self.types)
+        return self._children_index
+
+    def get_children(self, name, joint_type=None):
+        """
+        Get names of a joint's children.
+        :param name: Name of the parent joint. '' for root joints.
+        :type name: str
+        :param joint_type: Type of the children, e.g. 'marker'. None returns children of all types.
+        :type joint_type: str
+        :return: List of child names.
+        :rtype: list
+        """
+        return get_children(self.children_index, name, joint_type)
+
+    def get_names(self, joint_type=None):
+        """
+        Get names of all joints of a type.
+        :param joint_type: Type of the joints, e.g. 'marker'. None returns all joints.
+        :type joint_type: str
+        :return: List of names in template order.
+        :rtype: list
+        """
+        if joint_type is None:
+            return list(self.names)
+        return [name for name, t in zip(self.names, self.types) if t == joint_type]
+
+    def get_indices(self, names):
+        """
+        Get the indices of joints by name.
+        :param names: Names of joints.
+        :type names: list
+        :return: Array of indices, -1 for names that aren't joints of the template.
+        :rtype: numpy.ndarray
+        """
+        index = self.index
+        return np.array([index.get(name, -1) for name in names], dtype=np.intp)
+
+    def apply_offsets(self, names, offsets):
+        """
+        Replace the offsets of joints, e.g. with estimated offsets for a performer.
+        :param names: Names of the joints, as returned by read_offsets.
+        :type names: list
+        :param offsets: Offsets in meter of shape (len(names), 3).
+        :type offsets: numpy.ndarray
+        :return: Names that aren't joints of the template. Their offsets are ignored.
+        :rtype: list
+        """
+        indices = self.get_indices(names)
+        known = indices >= 0
+        self.offsets[indices[known]] = np.asarray(offsets, dtype=np.float64).reshape(-1, 3)[known]
+        return [name for name, i in zip(names, indices) if i < 0]
+
+    def get_missing_offsets(self, names):
+        """
+        Get the joints that have a parent but aren't in names, e.g. to check a file of estimated offsets.
+        :param names: Names of joints with offsets.
+        :type names: list
+        :return: Names of the joints without offsets in template order.
+        :rtype: list
+        """
+        has_offset = np.zeros(len(self.names), dtype=bool)
+        indices = self.get_indices(names)
+        has_offset[indices[indices >= 0]] = True
+        return [name for name, found, parent in zip(self.names, has_offset, self.parent_indices)
+                if not found and parent >= 0]
+
+    def get_global_offsets(self):
+        """
+        Accumulate the offsets along the hierarchy to get each joint's position relative to its root.
+        Empty offsets count as 0.
+        :return: Positions in meter as array of shape (joints, 3).
+        :rtype: numpy.ndarray
+        """
+        local = np.nan_to_num(self.offsets)
+        positions = np.zeros_like(local)
+        for i in self.order:
+            parent = self.parent_indices[i]
+            positions[i] = local[i] if parent < 0 else positions[parent] + local[i]
+        return positions
+
+
+def get_cache_path(fullpath):
+    """ Path of the binary cache of a CSV file. """
+    return fullpath + CACHE_EXTENSION
+
+
+def _get_source_stat(fullpath):
+    """ Modification time and size of a CSV file, which identify the version its cache was written from. """
+    stat = os.stat(fullpath)
+    return np.float64(stat.st_mtime), np.int64(stat.st_size)
+
+
+def _read_cache(fullpath):
+    """
+    Read the arrays of the cache of a CSV file if it was written from the CSV file as it is now.
+    Comparing the modification times only would also accept caches of CSV files that were replaced by older copies.
+    :param fullpath: full file path to the CSV file.
+    :type fullpath: str
+    :return: Dictionary of array name to array, None if there's no valid cache.
+    :rtype: dict
+    """
+    cache_path = get_cache_path(fullpath)
+    try:
+        source_mtime, source_size = _get_source_stat(fullpath)
+        with np.load(cache_path, allow_pickle=False) as data:
+            if (int(data['version']) != CACHE_VERSION or data['source_mtime'] != source_mtime
+                    or data['source_size'] != source_size):
+                return None
+            return dict((key, data[key]) for key in data.files)
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+        # Missing, stale or broken caches are ignored and the CSV file is read.
+        return None
+
+
+def _replace(source, destination):
+    """ Rename source to destination, replacing it if it exists. """
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        # Python 2 can't replace files on Windows by renaming.
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def _write_cache(fullpath, **arrays):
+    """
+    Write arrays to the cache of a CSV file. Failing to write it, e.g. in read-only folders, isn't an error.
+    The cache is written to a temporary file that replaces it when complete, so processes reading the cache at the
+    same time never see a partially written one.
+    """
+    cache_path = get_cache_path(fullpath)
+    source_mtime, source_size = _get_source_stat(fullpath)
+    temp_path = None
+    try:
+        handle, temp_path = tempfile.mkstemp(suffix=CACHE_EXTENSION, prefix='.', dir=os.path.dirname(cache_path))
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, version=CACHE_VERSION, source_mtime=source_mtime, source_size=source_size, **arrays)
+        _replace(temp_path, cache_path)
+    except (IOError, OSError):
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _to_strings(array):
+    """ Convert an array of strings from a cache to a list of str. """
+    return [str(value) for value in array.tolist()]
+
+
+def _save_template_cache(fullpath, template):
+    """ Write the arrays of a template to the cache of its CSV file. """
+    _write_cache(fullpath, names=np.array(template.names, dtype=str), parents=np.array(template.parents, dtype=str),
+                 offsets=template.offsets, bounds=template.bounds, types=np.array(template.types, dtype=str),
+                 rotation_modes=np.array(template.rotation_modes, dtype=str),
+                 optimize_groups=np.array(template.optimize_groups, dtype=str))
+
+
+def load_template(fullpath, use_cache=True):
+    """
+    Read a skeleton template from a CSV file, or from its binary cache if it was saved with save_template since.
+    Reading never writes a cache, so templates can be read from any folder without leaving files behind.
+    :param fullpath: full file path to the CSV file.
+    :type fullpath: str
+    :param use_cache: Whether to read the binary cache.
+    :type use_cache: bool
+    :return: The skeleton template.
+    :rtype: SkeletonTemplate
+    """
+    if use_cache:
+        data = _read_cache(fullpath)
+        if data is not None and 'names' in data:
+            return SkeletonTemplate(_to_strings(data['names']), _to_strings(data['parents']), data['offsets'],
+                                    data['bounds'], _to_strings(data['types']), _to_strings(data['rotation_modes']),
+                                    _to_strings(data['optimize_groups']))
+    with open_csv(fullpath) as csvfile:
+        return SkeletonTemplate.from_rows(csv.DictReader(csvfile))
+
+
+def read_offsets(fullpath):
+    """
+    Read estimated offsets from a CSV file with rows of name, x, y, z in meter and no header.
+    :param fullpath: full file path to the CSV file.
+    :type fullpath: str
+    :return: Joint names and their offsets as array of shape (joints, 3).
+    :rtype: tuple
+    """
+    with open_csv(fullpath) as csvfile:
+        rows = [row for row in csv.reader(csvfile) if row]
+    names = [row[0] for row in rows]
+    if len(set(names)) != len(names):
+        raise ValueError("Joint names in {} must be unique.".format(fullpath))
+    short = [row[0] for row in rows if len(row) < 4]
+    if short:
+        raise ValueError("Offsets of {} in {} need 3 values.".format(",".join(short), fullpath))
+    # The values are converted to floats by NumPy in one go, not cell by cell.
+    offsets = np.array([row[1:4] for row in rows], dtype=np.float64).reshape(-1, 3)
+    return names, offsets
+
+
+def save_template(fullpath, template, use_cache=True):
+    """
+    Save a skeleton template as CSV file and its binary cache next to it.
+    :param fullpath: full file path to where the CSV file should be saved.
+    :type fullpath: str
+    :param template: The skeleton template.
+    :type template: SkeletonTemplate
+    :param use_cache: Whether to write the binary cache.
+    :type use_cache: bool
+    """
+    with open_csv(fullpath, 'w') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(template.to_rows())
+    # The cache is written after the CSV file, so it records the saved file's modification time and size.
+    if use_cache:
+        _save_template_cache(fullpath, template)
@@ -0,0 +1,112 @@
+"""
+Batched rotation math on NumPy arrays.
+
+All functions work on arrays with any number of leading dimensions, e.g. (frames, joints, 3), so whole recordings
+are converted at once instead of frame by frame.
+"""
+import numpy as np
+
+AXES = {'X': 0, 'Y': 1, 'Z': 2}
+
+
+def axis_rotation(axis, angles):
+    """
+    Rotation matrices about one of the coordinate axes.
+    :param axis: 'X', 'Y' or 'Z'.
+    :type axis: str
+    :param angles: Angles in radians of any shape.
+    :type angles: numpy.ndarray
+    :return: Rotation matrices of shape angles.shape + (3, 3).
+    :rtype: numpy.ndarray
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    c = np.cos(angles)
+    s = np.sin(angles)
+    matrices = np.zeros(angles.shape + (3, 3))
+    i = AXES[axis.upper()]
+    j, k = (i + 1) % 3, (i + 2) % 3
+    matrices[..., i, i] = 1.0
+    matrices[..., j, j] = c
+    matrices[..., k, k] = c
+    matrices[..., j, k] = -s
+    matrices[..., k, j] = s
+    return matrices
+
+
+def euler_to_matrix(angles, order='XYZ', degrees=True):
+    """
+    Convert Euler angles to rotation matrices. The rotations are applied in the order of the axes' appearance as
+    in BVH files, i.e. for order 'ZXY' the matrix is Rz * Rx * Ry and transforms column vectors.
+    :param angles: Angles of shape (..., 3), the last axis in the same order as order.
+    :type angles: numpy.ndarray
+    :param order: Axes of the angles, e.g. 'ZXY'.
+    :type order: str
+    :param degrees: Whether the angles are in degrees instead of radians.
+    :type degrees: bool
+    :return: Rotation matrices of shape (..., 3, 3).
+    :rtype: numpy.ndarray
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    if degrees:
+        angles = np.radians(angles)
+    matrices = axis_rotation(order[0], angles[..., 0])
+    for i in range(1, 3):
+        matrices = np.matmul(matrices, axis_rotation(order[i], angles[..., i]))
+    return matrices
+
+
+def rotation_angle(rotations, reference, degrees=True):
+    """
+    Angle of the relative rotation between two sets of rotation matrices, i.e. the geodesic distance.
+    :param rotations: Rotation matrices of shape (..., 3, 3).
+    :type rotations: numpy.ndarray
+    :param reference: Rotation matrices of the same shape.
+    :type reference: numpy.ndarray
+    :param degrees: Whether to return the angles in degrees instead of radians.
+    :type degrees: bool
+    :return: Angles of shape (...).
+    :rtype: numpy.ndarray
+    """
+    # trace(A^T B) without building the relative rotation matrices.
+    trace = np.einsum('...ij,...ij->...', rotations, reference)
+    angles = np.arccos(np.clip((trace - 1.0) * 0.5, -1.0, 1.0))
+    return np.degrees(angles) if degrees else angles
+
+
+def rotation_between(vectors, targets):
+    """
+    Smallest rotations that turn vectors into the directions of targets.
+    :param vectors: Vectors of shape (..., 3).
+    :type vectors: numpy.ndarray
+    :param targets: Vectors of the same shape.
+    :type targets: numpy.ndarray
+    :return: Rotation matrices of shape (..., 3, 3). Identity where a vector has no length.
+    :rtype: numpy.ndarray
+    """
+    def normalized(v):
+        length = np.sqrt(np.einsum('...i,...i->...', v, v))[..., np.newaxis]
+        return np.divide(v, length, out=np.zeros_like(v), where=length > 1e-12), length[..., 0] > 1e-12
+
+    a, a_valid = normalized(np.asarray(vectors, dtype=np.float64))
+    b, b_valid = normalized(np.asarray(targets, dtype=np.float64))
+    axis = np.cross(a, b)
+    cosine = np.einsum('...i,...i->...', a, b)
+    # Rodrigues' formula with the axis scaled by the sine: R = I + [v]x + [v]x^2 / (1 + cos).
+    skew = np.zeros(axis.shape + (3,))
+    skew[..., 0, 1] = -axis[..., 2]
+    skew[..., 0, 2] = axis[..., 1]
+    skew[..., 1, 0] = axis[..., 2]
+    skew[..., 1, 2] = -axis[..., 0]
+    skew[..., 2, 0] = -axis[..., 1]
+    skew[..., 2, 1] = axis[..., 0]
+    opposite = cosine < -1.0 + 1e-9
+    factor = 1.0 / np.where(opposite, 1.0, 1.0 + cosine)
+    rotations = np.eye(3) + skew + np.matmul(skew, skew) * factor[..., np.newaxis, np.newaxis]
+    if opposite.any():
+        # Half turn about any axis perpendicular to the vector.
+        a_opposite = a[opposite]
+        helper = np.where(np.abs(a_opposite[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+        u, _ = normalized(np.cross(a_opposite, helper))
+        rotations[opposite] = 2.0 * u[:, :, np.newaxis] * u[:, np.newaxis, :] - np.eye(3)
+    rotations[~(a_valid & b_valid)] = np.eye(3)
+    return rotations
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# Make the flexible_mocap package in the repository's root importable.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'sample_data')
+
+
+@pytest.fixture
+def scene():
+    """ Empty stand-in scene, with the core's registry of the previous test forgotten. """
+    from flexible_mocap import core
+    from flexible_mocap.standin import FBSystem
+    scene = FBSystem().Scene
+    scene.clear()
+    core.scene_registry.invalidate()
+    yield scene
+    scene.stop_recording()
+    scene.clear()
+
+
+@pytest.fixture
+def template():
+    """ Skeleton template of the sample data, read from the CSV file so tests can change it. """
+    from flexible_mocap.template import load_template
+    return load_template(os.path.join(SAMPLE_DIR, 'skeleton_template.csv'), use_cache=False)
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from flexible_mocap.batch import check_session_names, read_manifest, run_batch
+
+from conftest import SAMPLE_DIR
+
+
+def write_manifest(tmpdir, names):
+    lines = ['name,template,offsets,c3d,labels']
+    for name in names:
+        lines.append('"{}",{},{},{},{}'.format(name, *[os.path.join(SAMPLE_DIR, filename) for filename in (
+            'skeleton_template.csv', 'estimated_offsets.csv', 'sample_recording.c3d', 'MarkerLabels-template.txt')]))
+    manifest = tmpdir.join('manifest.csv')
+    manifest.write('\n'.join(lines) + '\n')
+    return str(manifest)
+
+
+def test_run_batch(tmpdir):
+    sessions = read_manifest(write_manifest(tmpdir, ['Session 1', 'Session 2']))
+    output_dir = str(tmpdir.join('output'))
+    summaries = run_batch(sessions, output_dir, processes=1)
+    assert [summary['name'] for summary in summaries] == ['Session 1', 'Session 2']
+    assert all(summary['status'] != 'error' for summary in summaries)
+    assert sorted(name for name in os.listdir(output_dir) if name.endswith('.csv')) == ['Session 1.csv',
+                                                                                       'Session 2.csv']
+
+
+@pytest.mark.parametrize('names', [
+    ['../outside'],
+    ['sub/session'],
+    ['sub\\session'],
+    ['C:session'],
+    ['..'],
+    ['session.'],
+    [''],
+    ['summary'],
+    ['Summary'],
+    ['Session', 'session'],
+])
+def test_invalid_names_are_rejected(tmpdir, names):
+    with pytest.raises(ValueError):
+        check_session_names([{'name': name} for name in names])
+    # Nothing is written when the names are checked by run_batch.
+    output_dir = tmpdir.join('output')
+    with pytest.raises(ValueError):
+        run_batch([{'name': name} for name in names], str(output_dir))
+    assert not output_dir.check()
+
+
+def test_manifest_with_duplicate_names_is_rejected(tmpdir):
+    with pytest.raises(ValueError):
+        read_manifest(write_manifest(tmpdir, ['Session', 'Session']))
+
+
+def test_valid_names():
+    check_session_names([{'name': name} for name in ['Session 1', 'performer_02.take-3', 'summary_2']])
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from flexible_mocap.bvh import BVHError, read_bvh, write_bvh
+from flexible_mocap.transforms import euler_to_matrix
+
+
+def get_joint_names(template):
+    """ Names of the joints written to BVH, markers are left out. """
+    return [template.names[i] for i in template.order if template.types[i] != 'marker']
+
+
+def get_channel_count(template):
+    """ The root has position and rotation channels, all other joints rotation channels only. """
+    roots = sum(1 for i, joint_type in enumerate(template.types)
+                if joint_type != 'marker' and template.parent_indices[i] < 0)
+    return 3 * len(get_joint_names(template)) + 3 * roots
+
+
+def test_write_read_round_trip_of_array(tmpdir, template):
+    motion = np.random.RandomState(0).uniform(-90.0, 90.0, (1000, get_channel_count(template)))
+    fullpath = str(tmpdir.join('motion.bvh'))
+
+    # Smaller chunks than frames, so the array is written in several chunks.
+    assert write_bvh(fullpath, template, motion, 1.0 / 60.0, chunk_size=300) == len(motion)
+
+    bvh, read_motion = read_bvh(fullpath)
+    assert bvh.names == get_joint_names(template)
+    # The frame time is written with 6 decimals, 0.016667 s.
+    assert abs(bvh.frame_rate - 60.0) < 0.01
+    np.testing.assert_allclose(read_motion, motion, atol=1e-6)
+
+
+def test_write_chunks(tmpdir, template):
+    motion = np.zeros((20, get_channel_count(template)))
+    fullpath = str(tmpdir.join('chunks.bvh'))
+
+    assert write_bvh(fullpath, template, (motion[i:i + 7] for i in range(0, 20, 7)), 1.0 / 30.0) == 20
+    assert read_bvh(fullpath)[1].shape == motion.shape
+
+
+# Joints with different channel orders, End Sites and the root rotated by 90 degrees about Z in the second frame.
+HAND_WRITTEN = """HIERARCHY
+ROOT Hips
+{
+	OFFSET 0.0 0.0 0.0
+	CHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation
+	JOINT Spine
+	{
+		OFFSET 0.0 10.0 0.0
+		CHANNELS 3 Xrotation Yrotation Zrotation
+		End Site
+		{
+			OFFSET 0.0 5.0 0.0
+		}
+	}
+	JOINT Leg
+	{
+		OFFSET 5.0 0.0 0.0
+		CHANNELS 3 Yrotation Xrotation Zrotation
+		End Site
+		{
+			OFFSET 0.0 -40.0 0.0
+		}
+	}
+}
+MOTION
+Frames: 2
+Frame Time: 0.008333
+0 0 0 0 0 0 0 0 0 0 0 0
+1 2 3 90 0 0 90 0 0 0 0 45
+"""
+
+
+def write_text(tmpdir, name, text):
+    fullpath = str(tmpdir.join(name))
+    with open(fullpath, 'w') as f:
+        f.write(text)
+    return fullpath
+
+
+def test_read_hand_written_file(tmpdir):
+    bvh, motion = read_bvh(write_text(tmpdir, 'hand_written.bvh', HAND_WRITTEN))
+
+    assert bvh.names == ['Hips', 'Spine', 'Leg']
+    assert bvh.parents == ['', 'Hips', 'Hips']
+    assert bvh.channel_starts.tolist() == [0, 6, 9]
+    assert bvh.rotation_orders == ['ZXY', 'XYZ', 'YXZ']
+    assert sorted(bvh.end_sites) == [1, 2]
+    np.testing.assert_allclose(bvh.end_sites[2], [0.0, -40.0, 0.0])
+    assert bvh.frame_count == 2
+    assert abs(bvh.frame_rate - 120.0) < 0.01
+    assert motion.shape == (2, 12)
+
+    rotations, positions = bvh.get_global_transforms(motion)
+    np.testing.assert_allclose(positions[0], [[0.0, 0.0, 0.0], [0.0, 10.0, 0.0], [5.0, 0.0, 0.0]], atol=1e-9)
+    # The root's rotation turns the children's offsets, the children's own rotations don't move them.
+    np.testing.assert_allclose(positions[1], [[1.0, 2.0, 3.0], [-9.0, 2.0, 3.0], [1.0, 7.0, 3.0]], atol=1e-9)
+    np.testing.assert_allclose(rotations[1, 1], euler_to_matrix([90.0, 90.0, 0.0], 'ZXY'), atol=1e-9)
+    np.testing.assert_allclose(rotations[1, 2], euler_to_matrix([135.0, 0.0, 0.0], 'ZXY'), atol=1e-9)
+
+
+def test_malformed_motion_raises_bvh_error(tmpdir):
+    fullpath = write_text(tmpdir, 'malformed.bvh', HAND_WRITTEN.replace('90 0 0 0 0 45', '90 0 0 0 abc 45'))
+    with pytest.raises(BVHError):
+        read_bvh(fullpath)
+
+
+def test_incomplete_frame_raises_bvh_error(tmpdir):
+    fullpath = write_text(tmpdir, 'incomplete.bvh', HAND_WRITTEN.replace(' 0 0 45\n', '\n'))
+    with pytest.raises(BVHError):
+        read_bvh(fullpath)
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from flexible_mocap.c3d import C3DFile, _dec_to_ieee, read_c3d
+
+from conftest import SAMPLE_DIR
+
+C3D_PATH = os.path.join(SAMPLE_DIR, 'sample_recording.c3d')
+
+
+def test_header_and_labels():
+    with C3DFile(C3D_PATH) as c3d:
+        assert c3d.point_count == 46
+        assert c3d.frame_count == 3319
+        assert c3d.frame_rate == 60.0
+        assert c3d.units == 'mm'
+        assert c3d.is_float
+        assert len(c3d.labels) == 46
+        assert c3d.labels[:3] == ['M000', 'M001', 'M002']
+        assert c3d.marker_indices(['M002', 'C3D:M000', 'Unknown']) == [2, 0, None]
+
+
+def test_iter_points_matches_read_points():
+    with C3DFile(C3D_PATH) as c3d:
+        points, visible = c3d.read_points()
+        assert points.shape == (3319, 46, 4)
+        assert visible.shape == (3319, 46)
+        assert (points[..., 3][~visible] == -1.0).all()
+        assert (points[..., 3][visible] >= 0.0).all()
+
+        # Chunks that don't divide the number of frames, of all markers and of some.
+        chunks = list(c3d.iter_points(chunk_size=1000))
+        assert [start for start, _, _ in chunks] == [0, 1000, 2000, 3000]
+        np.testing.assert_array_equal(np.concatenate([chunk for _, chunk, _ in chunks]), points)
+        np.testing.assert_array_equal(np.concatenate([chunk for _, _, chunk in chunks]), visible)
+        markers = [5, 0, 45]
+        chunks = list(c3d.iter_points(chunk_size=512, markers=markers))
+        np.testing.assert_array_equal(np.concatenate([chunk for _, chunk, _ in chunks]), points[:, markers])
+
+        partial, _ = c3d.read_points(100, 110, markers)
+        np.testing.assert_array_equal(partial, points[100:110, markers])
+
+
+def test_read_c3d_by_names():
+    with C3DFile(C3D_PATH) as c3d:
+        points, _ = c3d.read_points(markers=[3, 1])
+    named_points, _, labels = read_c3d(C3D_PATH, ['M003', 'M001'])
+    assert labels == ['M003', 'M001']
+    np.testing.assert_array_equal(named_points, points)
+
+
+def to_dec(values):
+    """ DEC floats of IEEE floats: a quarter of the exponent bias and the 16 bit words swapped. """
+    raw = (np.asarray(values, dtype='f4') * 4.0).view('u4')
+    return ((raw & 0xffff) << 16) | (raw >> 16)
+
+
+def test_dec_floats():
+    # 1.0 is stored as the bytes 80 40 00 00.
+    assert _dec_to_ieee(np.array([0x00004080], dtype='u4'))[0] == 1.0
+    values = np.array([0.0, 1.0, -2.5, 1234.5625, 1e-3], dtype='f4')
+    np.testing.assert_array_equal(_dec_to_ieee(to_dec(values)), values)
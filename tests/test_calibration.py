@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+
+from flexible_mocap.batch import read_labels
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.calibration import (_symmetric_eigenvalues, find_calibration_frame, get_marker_rest_positions,
+                                        get_pose_error, rank_calibration_frames)
+from flexible_mocap.transforms import euler_to_matrix
+
+from conftest import SAMPLE_DIR
+
+
+def make_recording(rest_positions, t_pose_frame, num_frames=600):
+    """
+    Recording in mm of a performer turning at a constant rate, who only stands in the template's pose at one frame.
+    The markers drift from the pose linearly with time, so the drift doesn't add jitter.
+    """
+    frames = np.arange(num_frames)
+    drift = np.random.RandomState(0).uniform(-100.0, 100.0, rest_positions.shape) / 300.0
+    rotations = euler_to_matrix(np.column_stack([frames * 0.3, np.zeros(num_frames), np.zeros(num_frames)]), 'YXZ')
+    translations = np.column_stack([frames * 2.0, np.full(num_frames, 900.0), frames * -1.0])
+    local = rest_positions * 1000.0 + (frames - t_pose_frame)[:, np.newaxis, np.newaxis] * drift
+    points = np.matmul(local, rotations.swapaxes(-1, -2)) + translations[:, np.newaxis]
+    return points.astype(np.float32), np.ones(points.shape[:2], dtype=bool)
+
+
+def test_symmetric_eigenvalues():
+    rng = np.random.RandomState(1)
+    matrices = rng.normal(size=(1000, 3, 3))
+    matrices = np.concatenate([np.matmul(matrices.swapaxes(-1, -2), matrices),
+                               [np.eye(3), np.zeros((3, 3)), np.diag([0.0, 0.0, 2.0]), np.diag([1.0, 4.0, 4.0])]])
+    # Repeated eigenvalues are the least precise.
+    np.testing.assert_allclose(_symmetric_eigenvalues(matrices), np.linalg.eigvalsh(matrices), atol=1e-7)
+
+
+def test_pose_error_is_invariant_to_similarity_transforms(template):
+    _, rest_positions = get_marker_rest_positions(template)
+    rotation = euler_to_matrix([20.0, -60.0, 135.0], 'ZXY')
+    points = np.array([rest_positions, rest_positions.dot(rotation.T) * 1000.0 + [100.0, 900.0, -50.0]])
+    visible = np.ones(points.shape[:2], dtype=bool)
+    visible[1, :5] = False
+    np.testing.assert_allclose(get_pose_error(points, visible, rest_positions), [0.0, 0.0], atol=1e-4)
+
+
+def test_t_pose_frame_is_found(template):
+    _, rest_positions = get_marker_rest_positions(template)
+    points, visible = make_recording(rest_positions, 321)
+
+    order, score = rank_calibration_frames(points, visible, rest_positions)
+    assert order[0] == 321
+    assert np.argmin(score) == 321
+    assert np.argmin(get_pose_error(points, visible, rest_positions)) == 321
+
+    # Frames with all markers visible rank higher, even if another frame is closer to the pose.
+    visible[321, 0] = False
+    points[321, 0] = np.nan
+    order, score = rank_calibration_frames(points, visible, rest_positions)
+    assert order[0] in (320, 322)
+    assert order[-1] == 321
+
+
+def test_find_calibration_frame_of_sample(template):
+    with C3DFile(os.path.join(SAMPLE_DIR, 'sample_recording.c3d')) as c3d:
+        c3d.labels = read_labels(os.path.join(SAMPLE_DIR, 'MarkerLabels-template.txt'))
+        frame, all_visible = find_calibration_frame(template, c3d)
+        assert c3d.first_frame <= frame < c3d.first_frame + c3d.frame_count
+    assert all_visible
@@ -0,0 +1,80 @@
+from flexible_mocap import standin
+from flexible_mocap.commands import SceneCommandBuffer
+from flexible_mocap.core import create_skeleton, zero_joint_rotation
+from flexible_mocap.standin import FBVector3d
+
+
+def assert_single_change_block(operations):
+    """ All operations are applied within one FBBeginChangeAllModels/FBEndChangeAllModels block. """
+    kinds = [operation[0] for operation in operations]
+    assert kinds[0] == 'begin'
+    assert kinds[-1] == 'end'
+    assert kinds.count('begin') == 1
+    assert kinds.count('end') == 1
+
+
+def test_create_skeleton_flushes_in_one_block(scene, template):
+    scene.start_recording()
+    joints = create_skeleton('Mocap', template)
+    operations = scene.stop_recording()
+
+    assert_single_change_block(operations)
+    assert scene.change_depth == 0
+    bones = [name for name, joint_type in zip(template.names, template.types) if joint_type != 'marker']
+    assert [joint.LongName for joint in joints] == ['Mocap:' + name for name in bones]
+    creates = [operation[1:] for operation in operations if operation[0] == 'create']
+    assert sorted(label for _, label in creates) == sorted('Mocap:' + name for name in bones)
+    # Every joint but the root is parented, and each attribute is set once per joint.
+    sets = [operation[1:3] for operation in operations if operation[0] == 'set']
+    assert len(sets) == len(set(sets))
+    assert sum(1 for _, attribute in sets if attribute == 'Parent') == len(bones) - 1
+    for attribute in ('Translation', 'Size', 'Show', 'Color', 'Rotation Pivot', 'Scaling Pivot'):
+        assert sum(1 for _, name in sets if name == attribute) == len(bones)
+
+
+def test_create_skeleton_with_marker_dummies(scene, template):
+    joints = create_skeleton('Mocap', template, create_marker_dummies=True)
+    assert len(joints) == len(template.names)
+    root = joints[0]
+    assert root.Parent is None
+    assert all(joint.Parent is not None for joint in joints[1:])
+
+
+def test_existing_namespace_isnt_created_again(scene, template):
+    create_skeleton('Mocap', template)
+    scene.start_recording()
+    assert create_skeleton('Mocap', template) is None
+    assert scene.stop_recording() == []
+
+
+def test_zero_joint_rotation_flushes_in_one_block(scene, template):
+    joints = create_skeleton('Mocap', template)
+    for joint in joints:
+        joint.Rotation = FBVector3d(10.0, 20.0, 30.0)
+
+    scene.start_recording()
+    zero_joint_rotation(joints[0])
+    operations = scene.stop_recording()
+
+    assert_single_change_block(operations)
+    assert operations[1:-1] == [('set', joint.LongName, 'Rotation', FBVector3d(0.0, 0.0, 0.0)) for joint in joints]
+    assert all(joint.Rotation == FBVector3d(0.0, 0.0, 0.0) for joint in joints)
+
+
+def test_command_buffer_keeps_last_value(scene):
+    buffer = SceneCommandBuffer(standin)
+    label_name = buffer.create('FBModelNull', 'Test:Null')
+    buffer.set_translation(label_name, (1.0, 2.0, 3.0))
+    buffer.set_translation(label_name, (4.0, 5.0, 6.0))
+    buffer.set_attributes(label_name, Show=False)
+    buffer.set_attributes(label_name, Show=True)
+    assert len(buffer) == 3
+
+    scene.start_recording()
+    models = buffer.flush()
+    operations = scene.stop_recording()
+    assert operations == [('begin',), ('create', 'FBModelNull', 'Test:Null'),
+                          ('set', 'Test:Null', 'Translation', FBVector3d(4.0, 5.0, 6.0)),
+                          ('set', 'Test:Null', 'Show', True), ('end',)]
+    assert models[label_name].Translation == FBVector3d(4.0, 5.0, 6.0)
+    assert len(buffer) == 0
@@ -0,0 +1,23 @@
+import numpy as np
+
+from flexible_mocap.core import apply_estimated_offsets
+
+
+def test_apply_estimated_offsets_warns_about_unknown_and_missing_joints(template, capsys):
+    joints = [name for name, parent in zip(template.names, template.parents) if parent]
+    names = joints[1:] + ['Tail']
+    offsets = np.arange(len(names) * 3, dtype=np.float64).reshape(-1, 3)
+
+    unknown, missing = apply_estimated_offsets(template, names, offsets)
+    assert unknown == ['Tail']
+    assert missing == joints[:1]
+    np.testing.assert_array_equal(template.offsets[template.get_indices(joints[1:])], offsets[:-1])
+    message = capsys.readouterr().out
+    assert "Tail aren't in the skeleton data" in message
+    assert "{} have no estimated offset".format(joints[0]) in message
+
+
+def test_apply_complete_offsets_doesnt_warn(template, capsys):
+    joints = [name for name, parent in zip(template.names, template.parents) if parent]
+    assert apply_estimated_offsets(template, joints, np.zeros((len(joints), 3))) == ([], [])
+    assert capsys.readouterr().out == ''
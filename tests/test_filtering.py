@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.filtering import MarkerFilter, filter_recording, get_filter_errors
+from flexible_mocap.stream import UNIT_SCALES
+
+from conftest import SAMPLE_DIR
+
+
+@pytest.fixture(scope='module')
+def recording():
+    with C3DFile(os.path.join(SAMPLE_DIR, 'sample_recording.c3d')) as c3d:
+        points, _ = c3d.read_points()
+        points = points.astype(np.float64)
+        points[..., :3] *= UNIT_SCALES.get(c3d.units, 1.0)
+        return points, c3d.frame_rate
+
+
+def test_replay_reduces_jitter(recording):
+    points, frame_rate = recording
+    filtered = filter_recording(points, frame_rate)
+    raw_jitter, filtered_jitter, distance = get_filter_errors(points, filtered, frame_rate)
+    assert filtered_jitter < raw_jitter
+    # Smoothing doesn't drag the markers far from where they were measured.
+    assert distance < 0.02
+    # Residuals are passed through.
+    np.testing.assert_array_equal(filtered[..., 3], points[..., 3])
+
+
+def test_look_ahead_predicts_later_frames(recording):
+    points, frame_rate = recording
+    look_ahead = 1.0 / frame_rate
+    predicted = filter_recording(points, frame_rate, look_ahead=look_ahead)
+    _, _, predicted_distance = get_filter_errors(points, predicted, frame_rate, look_ahead)
+    # Holding the previous frame is what a pipeline without prediction shows.
+    _, _, held_distance = get_filter_errors(points, points, frame_rate, look_ahead)
+    assert predicted_distance < held_distance
+
+
+def test_reappearing_marker_restarts_from_measurement():
+    frame_rate = 60.0
+    marker_filter = MarkerFilter(2, frame_rate, look_ahead=0.05)
+    frame = np.zeros((2, 4))
+    for f in range(30):
+        frame[:, 0] = f / frame_rate  # Moving at 1 m/s.
+        marker_filter.update(frame)
+
+    # The first marker is occluded for a while and reappears somewhere else.
+    frame[0, 3] = -1.0
+    held = marker_filter.update(frame)[0, :3].copy()
+    for _ in range(10):
+        np.testing.assert_array_equal(marker_filter.update(frame)[0, :3], held)
+    frame[0] = [2.0, 1.0, -1.0, 0.0]
+    filtered = marker_filter.update(frame)
+    np.testing.assert_allclose(filtered[0, :3], [2.0, 1.0, -1.0])
+    assert filtered[0, 3] == 0.0
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.gapfill import UNIT_SCALES, fill_gaps
+from flexible_mocap.rbs import read_rigid_body_preset
+from flexible_mocap.transforms import euler_to_matrix
+
+from conftest import SAMPLE_DIR
+
+
+def get_preset():
+    return read_rigid_body_preset(os.path.join(SAMPLE_DIR, 'RigidBody_MarkerSet_Mxxx.rbs'))[0]
+
+
+def hide_head_markers(visible, labels, rigid_body_set):
+    """ Hide one of the head's 4 markers in turn in every frame in which all of them are visible. """
+    head = np.array([labels.index(name) for name in rigid_body_set.get_rigid_body('Head').marker_names])
+    hidden = np.zeros(visible.shape, dtype=bool)
+    frames = np.flatnonzero(visible[:, head].all(axis=1))
+    hidden[frames, head[frames % len(head)]] = True
+    return hidden
+
+
+def test_rigidly_moved_preset_is_reconstructed():
+    rigid_body_set = get_preset()
+    labels = list(rigid_body_set.marker_names)
+    num_frames = 20
+    rotations = euler_to_matrix(np.random.RandomState(0).uniform(-180.0, 180.0, (num_frames, 3)), 'ZXY')
+    # The preset is in cm, the points in mm.
+    reference = rigid_body_set.positions * UNIT_SCALES['mm']
+    points = np.ones((num_frames, len(labels), 4))
+    points[..., :3] = np.matmul(reference, rotations.swapaxes(-1, -2)) + np.arange(num_frames)[:, None, None] * 10.0
+    visible = np.ones(points.shape[:2], dtype=bool)
+    hidden = hide_head_markers(visible, labels, rigid_body_set)
+    occluded = points.copy()
+    occluded[hidden] = [0.0, 0.0, 0.0, -1.0]
+
+    filled_points, filled = fill_gaps(occluded, visible & ~hidden, labels, rigid_body_set, scale=UNIT_SCALES['mm'])
+    np.testing.assert_array_equal(filled, hidden)
+    np.testing.assert_allclose(filled_points[hidden, :3], points[hidden, :3], atol=1e-6)
+    assert (filled_points[hidden, 3] == 0.0).all()
+    np.testing.assert_array_equal(filled_points[~hidden], occluded[~hidden])
+
+
+def test_hidden_markers_of_sample_are_reconstructed():
+    rigid_body_set = get_preset()
+    with C3DFile(os.path.join(SAMPLE_DIR, 'sample_recording.c3d')) as c3d:
+        labels = list(c3d.labels)
+        points, visible = c3d.read_points(0, 600)
+    hidden = hide_head_markers(visible, labels, rigid_body_set)
+    # The reference layout is taken from a frame in which all markers are visible.
+    reference_frame = int(np.flatnonzero(visible.all(axis=1))[0])
+    hidden[reference_frame] = False
+    occluded = points.copy()
+    occluded[hidden] = [0.0, 0.0, 0.0, -1.0]
+
+    filled_points, filled = fill_gaps(occluded, visible & ~hidden, labels, rigid_body_set,
+                                      scale=UNIT_SCALES['mm'], reference_frame=reference_frame)
+    # Markers of other rigid bodies that are occluded in the recording are filled as well.
+    assert filled[hidden].all()
+    # The head's markers only move rigidly up to soft tissue artifacts and marker noise of some mm.
+    errors = np.linalg.norm(filled_points[hidden, :3] - points[hidden, :3], axis=-1)
+    assert np.median(errors) < 10.0
+    assert errors.max() < 50.0
+    # The markers that were visible are kept.
+    np.testing.assert_array_equal(filled_points[visible & ~hidden], points[visible & ~hidden])
+
+
+def test_unsolvable_rigid_bodies_are_not_filled():
+    rigid_body_set = get_preset()
+    labels = list(rigid_body_set.marker_names)
+    points = np.ones((2, len(labels), 4))
+    points[..., :3] = rigid_body_set.positions * UNIT_SCALES['mm']
+    visible = np.ones(points.shape[:2], dtype=bool)
+    head = [labels.index(name) for name in rigid_body_set.get_rigid_body('Head').marker_names]
+    # Only 2 of the head's markers are visible in the first frame.
+    visible[0, head[:2]] = False
+    # One marker is off by 10 cm in the second frame, which makes the fit worse than the maximum error.
+    visible[1, head[0]] = False
+    points[1, head[1], 0] += 100.0
+
+    filled_points, filled = fill_gaps(points, visible, labels, rigid_body_set, scale=UNIT_SCALES['mm'],
+                                      max_error=10.0)
+    assert not filled.any()
+    np.testing.assert_array_equal(filled_points, points)
@@ -0,0 +1,87 @@
+import numpy as np
+
+from flexible_mocap.headpose import HeadPoseTracker
+from flexible_mocap.transforms import euler_to_matrix
+
+HMD_OFFSETS = {'HMDLeft': np.array([-0.08, 0.1, 0.12]), 'HMDRight': np.array([0.08, 0.1, 0.12])}
+
+
+def axis_angle_matrix(axis, degrees):
+    """ Rotation about an axis with Rodrigues' formula. """
+    x, y, z = np.asarray(axis, dtype=np.float64) / np.linalg.norm(axis)
+    skew = np.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+    angle = np.radians(degrees)
+    return np.eye(3) + np.sin(angle) * skew + (1.0 - np.cos(angle)) * np.dot(skew, skew)
+
+
+def make_frame(tracker, offsets, rotation, position):
+    """ Visible markers of the head and the HMD with the head at a pose. """
+    frame = np.ones((len(tracker.marker_names), 4))
+    frame[:, :3] = np.dot(offsets, rotation.T) + position
+    return frame
+
+
+def get_offsets(template, tracker):
+    return np.array([HMD_OFFSETS[name] if name in HMD_OFFSETS else template[name].offset
+                     for name in tracker.marker_names])
+
+
+def test_calibrate_measures_hmd_offsets(template):
+    labels = template.get_children('Head', 'marker') + sorted(HMD_OFFSETS)
+    tracker = HeadPoseTracker(template, labels)
+    assert tracker.marker_names == labels
+    assert not tracker.calibrated
+    offsets = get_offsets(template, tracker)
+    frame = make_frame(tracker, offsets, euler_to_matrix([10.0, -30.0, 45.0], 'ZXY'), np.array([0.2, 1.7, -0.4]))
+
+    # The HMD markers must be visible to be measured.
+    occluded = frame.copy()
+    occluded[-1, 3] = -1.0
+    assert not tracker.calibrate(occluded)
+    assert not tracker.calibrated
+
+    assert tracker.calibrate(frame)
+    assert tracker.calibrated
+    hmd_offsets = tracker.get_hmd_offsets()
+    assert sorted(hmd_offsets) == sorted(HMD_OFFSETS)
+    for name, offset in HMD_OFFSETS.items():
+        np.testing.assert_allclose(hmd_offsets[name], offset, atol=1e-12)
+
+
+def test_update_with_fewer_markers(template):
+    labels = template.get_children('Head', 'marker') + sorted(HMD_OFFSETS)
+    tracker = HeadPoseTracker(template, labels, hmd_offsets=HMD_OFFSETS)
+    assert tracker.calibrated
+    offsets = get_offsets(template, tracker)
+
+    # 3 or more markers determine the pose.
+    rotation = euler_to_matrix([10.0, -30.0, 45.0], 'ZXY')
+    position = np.array([0.2, 1.7, -0.4])
+    frame = make_frame(tracker, offsets, rotation, position)
+    frame[:2, 3] = -1.0
+    solved_rotation, solved_position, full = tracker.update(frame)
+    assert full
+    np.testing.assert_allclose(solved_rotation, rotation, atol=1e-12)
+    np.testing.assert_allclose(solved_position, position, atol=1e-12)
+
+    # 2 markers turn the previous rotation the shortest way onto their direction, which recovers a turn about an axis
+    # perpendicular to them.
+    first, second = 0, len(offsets) - 1
+    direction = np.dot(rotation, offsets[second] - offsets[first])
+    rotation = np.dot(axis_angle_matrix(np.cross(direction, [0.0, 1.0, 0.0]), 20.0), rotation)
+    position = position + [0.05, -0.02, 0.1]
+    frame = make_frame(tracker, offsets, rotation, position)
+    frame[1:second, 3] = -1.0
+    solved_rotation, solved_position, full = tracker.update(frame)
+    assert not full
+    np.testing.assert_allclose(solved_rotation, rotation, atol=1e-12)
+    np.testing.assert_allclose(solved_position, position, atol=1e-12)
+
+    # A single marker moves the head with the previous rotation.
+    position = position + [-0.1, 0.0, 0.03]
+    frame = make_frame(tracker, offsets, rotation, position)
+    frame[1:, 3] = -1.0
+    solved_rotation, solved_position, full = tracker.update(frame)
+    assert not full
+    np.testing.assert_allclose(solved_rotation, rotation, atol=1e-12)
+    np.testing.assert_allclose(solved_position, position, atol=1e-12)
@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+
+from flexible_mocap.instrumentation import STAGES, Instrumentation
+
+
+def test_events_are_ordered_after_wrap_around():
+    instrumentation = Instrumentation(capacity=4)
+    for frame in range(10):
+        instrumentation.record('solving', float(frame), float(frame) + frame * 0.001, frame=frame)
+
+    assert instrumentation.get_count('solving') == 10
+    # Only the last 4 events are kept, oldest first.
+    np.testing.assert_allclose(instrumentation.get_durations('solving'), [0.006, 0.007, 0.008, 0.009])
+    trace = instrumentation.get_chrome_trace()
+    frames = [event['args']['frame'] for event in trace['traceEvents'] if event['ph'] == 'X']
+    assert frames == [6, 7, 8, 9]
+
+
+def test_percentiles_and_histogram():
+    instrumentation = Instrumentation()
+    for i in range(100):
+        instrumentation.record('filtering', 0.0, (i + 1) * 0.0001)
+
+    np.testing.assert_allclose(instrumentation.percentiles('filtering', q=(0, 50, 100)), [0.0001, 0.00505, 0.01])
+    assert np.isnan(instrumentation.percentiles('solving')).all()
+    counts, edges = instrumentation.histogram('filtering', bins=[0.0, 0.005, 0.02])
+    assert counts.tolist() == [49, 51]
+    assert counts.sum() == 100
+    # Only stages with events are summarized, in the order of the stages.
+    summary = instrumentation.summary()
+    assert [row['stage'] for row in summary] == ['filtering']
+    assert summary[0]['count'] == 100
+    assert abs(summary[0]['max'] - 10.0) < 1e-9
+
+
+def test_counters_and_chrome_trace(tmpdir):
+    instrumentation = Instrumentation()
+    instrumentation.record('ingestion', 1.0, 1.002, frame=7)
+    instrumentation.record('custom', 1.002, 1.003, frame=7)
+    instrumentation.count('lost frames', 2)
+    instrumentation.count('lost frames', 0)
+    instrumentation.count('lost frames')
+    assert instrumentation.counters == {'lost frames': 3}
+    assert instrumentation.stages == STAGES + ['custom']
+
+    fullpath = str(tmpdir.join('trace.json'))
+    instrumentation.write_chrome_trace(fullpath)
+    with open(fullpath) as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    # A named track per stage, a complete event per recorded stage and a counter event per change.
+    assert [event['args']['name'] for event in events if event['ph'] == 'M'] == STAGES + ['custom']
+    complete = [event for event in events if event['ph'] == 'X']
+    assert [(event['name'], event['tid'], event['args']['frame']) for event in complete] == \
+        [('ingestion', 0, 7), ('custom', len(STAGES), 7)]
+    assert abs(complete[0]['ts'] - 1e6) < 1e-3
+    assert abs(complete[0]['dur'] - 2000.0) < 1e-3
+    counters = [event for event in events if event['ph'] == 'C']
+    assert [event['args'] for event in counters] == [{'lost frames': 2}, {'lost frames': 3}]
+
+
+def test_disabled_instrumentation_doesnt_record():
+    instrumentation = Instrumentation(enabled=False)
+    assert instrumentation.now() == 0.0
+    assert instrumentation.record('solving', 1.0) == 0.0
+    instrumentation.count('lost frames', 5)
+
+    assert instrumentation.get_count('solving') == 0
+    assert instrumentation.counters == {}
+    assert instrumentation.summary() == []
+    assert instrumentation.get_chrome_trace()['traceEvents'] == [
+        {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': stage}}
+        for tid, stage in enumerate(STAGES)]
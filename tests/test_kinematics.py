@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from flexible_mocap.kinematics import ForwardKinematics
+from flexible_mocap.template import get_topological_order
+
+
+def test_topological_order_is_depth_first():
+    #     0
+    #   1   4
+    #  2 3
+    parent_indices = np.array([-1, 0, 1, 1, 0])
+    assert get_topological_order(parent_indices).tolist() == [0, 1, 2, 3, 4]
+    # Children listed before their parents.
+    assert get_topological_order(np.array([2, 2, -1])).tolist() == [2, 0, 1]
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError):
+        get_topological_order(np.array([-1, 2, 1]))
+
+
+def test_template_and_kinematics_share_the_order(template):
+    np.testing.assert_array_equal(template.order, get_topological_order(template.parent_indices))
+    # The rest pose puts the joints at their accumulated offsets, with or without the template's order.
+    for kinematics in (ForwardKinematics.from_template(template),
+                       ForwardKinematics(template.parent_indices, template.offsets)):
+        _, positions = kinematics.compute()
+        np.testing.assert_allclose(positions[0], template.get_global_offsets())
@@ -0,0 +1,53 @@
+import itertools
+
+import numpy as np
+
+from flexible_mocap.labeling import assign_labels, match_markers
+
+
+def brute_force(positions, template_positions, max_distance):
+    """ Number of matches and total distance of the best assignment of small sets. """
+    best = (0, 0.0)
+    for permutation in itertools.permutations(range(len(template_positions)), len(positions)):
+        distances = np.linalg.norm(positions - template_positions[list(permutation)], axis=1)
+        valid = distances <= max_distance
+        score = (valid.sum(), -distances[valid].sum())
+        best = max(best, score)
+    return best[0], -best[1]
+
+
+def test_matches_shuffled_markers():
+    random = np.random.RandomState(0)
+    template_positions = random.uniform(-1.0, 1.0, (46, 3))
+    order = random.permutation(46)
+    positions = template_positions[order] + random.normal(0.0, 0.005, (46, 3))
+    np.testing.assert_array_equal(match_markers(positions, template_positions), order)
+
+
+def test_conflicts_are_resolved_optimally():
+    random = np.random.RandomState(1)
+    for _ in range(50):
+        template_positions = random.uniform(0.0, 0.3, (6, 3))
+        positions = template_positions[random.randint(0, 6, 5)] + random.normal(0.0, 0.05, (5, 3))
+        matches = match_markers(positions, template_positions, max_distance=0.1, candidates=6)
+        matched = matches >= 0
+        assert len(set(matches[matched])) == matched.sum()
+        distances = np.linalg.norm(positions[matched] - template_positions[matches[matched]], axis=1)
+        count, total = brute_force(positions, template_positions, 0.1)
+        assert matched.sum() == count
+        assert abs(distances.sum() - total) < 1e-9
+
+
+def test_far_and_surplus_markers_stay_unmatched():
+    template_positions = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    positions = np.array([[0.01, 0.0, 0.0], [0.02, 0.0, 0.0], [5.0, 0.0, 0.0]])
+    assert match_markers(positions, template_positions, max_distance=0.5).tolist() == [0, -1, -1]
+    assert assign_labels(positions, template_positions, ['A0', 'B1'], max_distance=0.5) == ['A0', None, None]
+    assert match_markers(np.zeros((0, 3)), template_positions).tolist() == []
+
+
+def test_separate_groups_are_independent():
+    # Two clusters far apart compete for labels only within their cluster.
+    template_positions = np.array([[0.0, 0.0, 0.0], [0.1, 0.0, 0.0], [10.0, 0.0, 0.0], [10.1, 0.0, 0.0]])
+    positions = np.array([[0.06, 0.0, 0.0], [0.04, 0.0, 0.0], [10.11, 0.0, 0.0], [9.0, 0.0, 0.0]])
+    assert match_markers(positions, template_positions, max_distance=2.0).tolist() == [1, 0, 3, 2]
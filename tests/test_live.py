@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from flexible_mocap.batch import read_labels
+from flexible_mocap.filtering import MarkerFilter
+from flexible_mocap.instrumentation import Instrumentation
+from flexible_mocap.live import LivePipeline
+from flexible_mocap.solver import SegmentSolver
+from flexible_mocap.stream import MarkerRingBuffer
+
+from conftest import SAMPLE_DIR
+
+LABELS_PATH = os.path.join(SAMPLE_DIR, 'MarkerLabels-template.txt')
+
+
+def make_pipeline(template, labels, writes):
+    solver = SegmentSolver(template)
+    ring = MarkerRingBuffer(120, len(labels))
+    marker_filter = MarkerFilter((1, len(solver.marker_names)), 60.0)
+
+    def write(rotations, positions):
+        writes.append(positions.copy())
+
+    return LivePipeline(ring, labels, solver, marker_filter, write, Instrumentation())
+
+
+def test_replay_processes_every_frame(template):
+    writes = list()
+    pipeline = make_pipeline(template, read_labels(LABELS_PATH), writes)
+
+    assert pipeline.replay(os.path.join(SAMPLE_DIR, 'sample_recording.c3d'), rate=0, max_frames=300) == 300
+    instrumentation = pipeline.instrumentation
+    assert [instrumentation.get_count(stage) for stage in instrumentation.stages] == [300] * 4
+    # As fast as possible, no frame is skipped, lost or invalid.
+    assert instrumentation.counters == {}
+    assert len(writes) == 300
+    assert all(np.isfinite(positions).all() for positions in writes)
+
+
+def test_step_counts_skipped_and_lost_frames(template):
+    labels = read_labels(LABELS_PATH)
+    pipeline = make_pipeline(template, labels, list())
+    ring = pipeline.ring
+    points = np.zeros((len(labels), 4))
+    counters = pipeline.instrumentation.counters
+
+    assert not pipeline.step()
+    ring.write(0, 0.0, points)
+    assert pipeline.step()
+    assert not pipeline.step()
+    # Frames 1 and 2 arrive while the pipeline is busy, 3 and 4 are lost, 2 arrives late.
+    for frame in (1, 2, 5, 2):
+        ring.write(frame, 0.0, points)
+    assert pipeline.step()
+    assert pipeline.frame_count == 2
+    assert counters == {'skipped frames': 2, 'lost frames': 2, 'out-of-order frames': 1}
+
+
+def test_labels_must_contain_the_markers(template):
+    with pytest.raises(ValueError):
+        make_pipeline(template, ['A0', 'B1'], list())
@@ -0,0 +1,35 @@
+import numpy as np
+
+from flexible_mocap.metrics import match_joints, position_errors, rotation_errors, summarize_errors
+from flexible_mocap.transforms import axis_rotation
+
+
+def test_match_joints():
+    common, indices, reference_indices = match_joints(['Hips', 'Spine', 'Head'], ['Head', 'Hips', 'LeftLeg'])
+    assert common == ['Hips', 'Head']
+    assert indices.tolist() == [0, 2]
+    assert reference_indices.tolist() == [1, 0]
+
+
+def test_known_errors():
+    reference = np.zeros((2, 2, 3))
+    positions = np.array([[[3.0, 4.0, 0.0], [0.0, 0.0, 1.0]],
+                          [[0.0, 0.0, 0.0], [0.0, 2.0, 0.0]]])
+    np.testing.assert_allclose(position_errors(positions, reference), [[5.0, 1.0], [0.0, 2.0]])
+
+    angles = np.radians([[10.0, 90.0], [45.0, 0.0]])
+    errors = rotation_errors(axis_rotation('Y', angles), np.broadcast_to(np.eye(3), (2, 2, 3, 3)))
+    np.testing.assert_allclose(errors, [[10.0, 90.0], [45.0, 0.0]], atol=1e-6)
+
+
+def test_summary_ignores_missing_frames():
+    errors = np.array([[1.0, np.nan, np.nan],
+                       [3.0, 2.0, np.nan],
+                       [np.nan, 2.0, np.nan]])
+    summary = summarize_errors(errors, percentile=50.0)
+    np.testing.assert_allclose(summary['mean'][:2], [2.0, 2.0])
+    np.testing.assert_allclose(summary['rms'][:2], [np.sqrt(5.0), 2.0])
+    np.testing.assert_allclose(summary['percentile'][:2], [2.0, 2.0])
+    np.testing.assert_allclose(summary['max'][:2], [3.0, 2.0])
+    # A joint without any valid frame has no summary.
+    assert all(np.isnan(summary[key][2]) for key in ('mean', 'rms', 'percentile', 'max'))
@@ -0,0 +1,71 @@
+import os
+
+from flexible_mocap.profiling import DEFAULT_REPORT_NAME, SessionProfiler, get_report_path
+
+
+def test_nested_calls_are_aggregated(tmpdir):
+    report_path = str(tmpdir.join('profile.txt'))
+    profiler = SessionProfiler(enabled=True, report_path=report_path)
+
+    @profiler.profile()
+    def inner(value):
+        return value * 2
+
+    @profiler.profile("Step")
+    def step(value):
+        return inner(value) + inner(value)
+
+    assert step(1) == 4
+    assert step(2) == 8
+    assert sorted(profiler.stats) == [('Step',), ('Step', 'inner')]
+    assert profiler.stats[('Step',)][0] == 2
+    assert profiler.stats[('Step', 'inner')][0] == 4
+    assert all(value >= 0.0 for stats in profiler.stats.values() for value in stats[1:])
+    # The report is rewritten after each step, with nested calls indented.
+    with open(report_path) as f:
+        lines = f.read().splitlines()
+    assert lines[2].startswith('Step ')
+    assert lines[3].startswith('  inner ')
+
+
+def test_disabled_profiler_doesnt_record():
+    profiler = SessionProfiler()
+
+    @profiler.profile()
+    def step():
+        """ Docstring. """
+        return 1
+
+    assert step() == 1
+    assert not profiler.stats
+    assert step.__name__ == 'step'
+    assert step.__doc__ == """ Docstring. """
+
+
+def test_exceptions_are_recorded_and_propagate():
+    profiler = SessionProfiler(enabled=True)
+
+    @profiler.profile()
+    def fail():
+        raise ValueError()
+
+    try:
+        fail()
+    except ValueError:
+        pass
+    assert profiler.stats[('fail',)][0] == 1
+    assert not profiler._stack
+
+
+def test_write_report_without_report_path(tmpdir, monkeypatch):
+    monkeypatch.setattr('tempfile.tempdir', str(tmpdir))
+    profiler = SessionProfiler(enabled=True)
+    assert profiler.write_report() == str(tmpdir.join(DEFAULT_REPORT_NAME))
+    assert os.path.isfile(str(tmpdir.join(DEFAULT_REPORT_NAME)))
+
+
+def test_get_report_path():
+    assert get_report_path(None) is None
+    assert get_report_path('0') is None
+    assert get_report_path('1').endswith(DEFAULT_REPORT_NAME)
+    assert get_report_path('/tmp/report.txt') == '/tmp/report.txt'
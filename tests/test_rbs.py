@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+
+from flexible_mocap.rbs import (EVENT_BEGIN, EVENT_END, EVENT_PROPERTY, RBSError, build_rigid_body_sets,
+                                iter_nodes, iter_rigid_body_records, read_rigid_body_preset, tokenize)
+
+from conftest import SAMPLE_DIR
+
+PRESET = """; FBX 6.0.0 project file
+RIGIDBODYSET: "Model::Test" {
+    MARKERLIST:  {
+        MARKER:  {
+            NAME: "A"
+            X: 1.5
+            Y: -2
+            Z: 0
+        }
+        MARKER:  {
+            NAME: "B"
+            X: 0
+            Y: 1
+            Z: 2.25
+        }
+    }
+    RIGIDBODYLIST:  {
+        RIGIDBODY:  {
+            NAME: "Body"
+            MARKERLIST:  {
+                MARKER: "B"
+                MARKER: "A"
+            }
+        }
+    }
+}
+"""
+
+
+def parse(text):
+    return build_rigid_body_sets(iter_rigid_body_records(iter_nodes(tokenize(text.splitlines()))))
+
+
+def test_read_sample_preset():
+    rigid_body_sets = read_rigid_body_preset(os.path.join(SAMPLE_DIR, 'RigidBody_MarkerSet_Mxxx.rbs'))
+    assert len(rigid_body_sets) == 1
+    rigid_body_set = rigid_body_sets[0]
+    assert rigid_body_set.name == 'Model::C3D:optical'
+    assert len(rigid_body_set.marker_names) == 46
+    assert rigid_body_set.positions.shape == (46, 3)
+    assert len(rigid_body_set.rigid_bodies) == 15
+    head = rigid_body_set.get_rigid_body('Head')
+    assert head.marker_names == ['M000', 'M001', 'M002', 'M003']
+    np.testing.assert_allclose(head.positions[0], [-7.77452207978173, 181.442114959091, 4.46834601793901])
+    assert rigid_body_set.get_rigid_body('Tail') is None
+
+
+def test_tokens_and_nodes():
+    tokens = list(tokenize(['; comment', 'Key: 1, 2.5, "a b", c {', '}']))
+    assert tokens == [('key', 'Key'), ('value', 1), ('value', 2.5), ('value', 'a b'), ('value', 'c'), ('{', None),
+                      ('}', None)]
+    nodes = list(iter_nodes(tokenize(['Outer: {', 'Inner: 1', '}'])))
+    assert nodes == [(EVENT_BEGIN, 'Outer', []), (EVENT_PROPERTY, 'Inner', [1]), (EVENT_END, 'Outer', None)]
+
+
+def test_parse_preset():
+    rigid_body_set, = parse(PRESET)
+    assert rigid_body_set.name == 'Model::Test'
+    assert rigid_body_set.marker_names == ['A', 'B']
+    np.testing.assert_array_equal(rigid_body_set.positions, [[1.5, -2.0, 0.0], [0.0, 1.0, 2.25]])
+    body, = rigid_body_set.rigid_bodies
+    assert body.name == 'Body'
+    assert body.marker_names == ['B', 'A']
+
+
+def test_malformed_presets():
+    with pytest.raises(RBSError):
+        parse(PRESET.replace('MARKER: "A"', 'MARKER: "C"'))
+    with pytest.raises(RBSError):
+        parse(PRESET.rsplit('}', 1)[0])
+    with pytest.raises(RBSError):
+        parse(PRESET + '}')
@@ -0,0 +1,78 @@
+import pytest
+
+from flexible_mocap.registry import SceneRegistry, get_label_name, walk_hierarchy
+from flexible_mocap.standin import (FBEventSceneChange, FBModelMarkerOptical, FBModelNull, FBModelSkeleton,
+                                    FBSceneChangeType)
+
+
+@pytest.fixture
+def registry(scene):
+    registry = SceneRegistry(scene, ignored_changes=(FBSceneChangeType.kFBSceneChangeSelect,
+                                                     FBSceneChangeType.kFBSceneChangeUnselect))
+    scene.OnChange.Add(registry.on_scene_change)
+    yield registry
+    scene.OnChange.Remove(registry.on_scene_change)
+
+
+def test_get_label_name():
+    assert get_label_name('A0') == 'A0'
+    assert get_label_name('A0', 'C3D') == 'C3D:A0'
+
+
+def test_lookup_by_namespace(registry):
+    c3d_marker = FBModelMarkerOptical('C3D:A0')
+    owl_marker = FBModelMarkerOptical('OWL:A0')
+    plain = FBModelNull('A0')
+    parent = FBModelNull('C3D:Markers')
+    nested = FBModelMarkerOptical('C3D:B1')
+    nested.Parent = parent
+
+    assert registry.find('A0', 'C3D') is c3d_marker
+    assert registry.find('A0', 'OWL') is owl_marker
+    assert registry.find('A0') is plain
+    assert registry.find('B1', 'C3D') is nested
+    assert registry.find('B1') is None
+    assert registry.find_all(['A0', 'Markers', 'Missing'], 'C3D', subtype='FBModelMarkerOptical') == [
+        c3d_marker, None, None]
+    assert registry.get_optical_markers() == [c3d_marker, owl_marker, nested]
+
+
+def test_scene_changes_invalidate(registry):
+    FBModelSkeleton('Mocap:Hips')
+    assert registry.find('Hips', 'Mocap') is not None
+    assert registry.is_valid
+
+    # Creating a model adds it to the scene's root, which is a change.
+    leg = FBModelSkeleton('Mocap:LeftUpLeg')
+    assert not registry.is_valid
+    assert registry.find('LeftUpLeg', 'Mocap') is leg
+
+    leg.Name = 'LeftLeg'
+    assert not registry.is_valid
+    assert registry.find('LeftUpLeg', 'Mocap') is None
+    assert registry.find('LeftLeg', 'Mocap') is leg
+
+    leg.FBDelete()
+    assert registry.find('LeftLeg', 'Mocap') is None
+
+
+@pytest.mark.parametrize('change_type', [FBSceneChangeType.kFBSceneChangeSelect,
+                                         FBSceneChangeType.kFBSceneChangeUnselect])
+def test_selection_doesnt_invalidate(scene, registry, change_type):
+    hips = FBModelSkeleton('Mocap:Hips')
+    registry.find('Hips', 'Mocap')
+    scene.OnChange.fire(FBEventSceneChange(change_type, hips))
+    assert registry.is_valid
+
+
+def test_walk_hierarchy_prunes(scene):
+    root = FBModelSkeleton('Hips')
+    reference = FBModelNull('Reference')
+    reference.Parent = root
+    below = FBModelNull('Below')
+    below.Parent = reference
+    leg = FBModelSkeleton('LeftUpLeg')
+    leg.Parent = root
+
+    assert list(walk_hierarchy([root, leg])) == [root, reference, below, leg]
+    assert list(walk_hierarchy([root], prune=lambda node: node.Name == 'Reference')) == [root, leg]
@@ -0,0 +1,48 @@
+import numpy as np
+
+from flexible_mocap.solver import SegmentSolver
+from flexible_mocap.transforms import euler_to_matrix
+
+ROTATION = euler_to_matrix([30.0, -20.0, 75.0], 'ZXY')
+TRANSLATION = np.array([0.5, -1.0, 2.0])
+
+
+def get_moved_rest_pose(template, solver):
+    """ Markers of the rest pose, rotated and translated as a whole. """
+    rest = template.get_global_offsets()
+    markers = rest[template.get_indices(solver.marker_names)]
+    joints = rest[template.get_indices(solver.names)]
+    return (markers.dot(ROTATION.T) + TRANSLATION)[np.newaxis], joints.dot(ROTATION.T) + TRANSLATION
+
+
+def test_rigid_motion_of_rest_pose_is_recovered(template):
+    solver = SegmentSolver(template)
+    points, joint_positions = get_moved_rest_pose(template, solver)
+
+    rotations, positions = solver.solve(points)
+    assert solver.solved[0, solver.goal_types >= 0].all()
+    np.testing.assert_allclose(rotations[0], np.broadcast_to(ROTATION, rotations.shape[1:]), atol=1e-12)
+    np.testing.assert_allclose(positions[0], joint_positions, atol=1e-12)
+
+
+def test_occluded_markers_as_nan(template):
+    solver = SegmentSolver(template)
+    points, joint_positions = get_moved_rest_pose(template, solver)
+    # One of the hips' 4 markers, so the root is still solved, and too many markers of the other joints.
+    occluded = [solver.marker_names.index(name) for name in ('A36', 'C38', 'D39', 'E40', 'B22', 'A0', 'D3')]
+    points[0, occluded] = np.nan
+
+    rotations, positions = solver.solve(points)
+    assert np.isfinite(rotations).all()
+    assert np.isfinite(positions).all()
+    unsolved = [solver.names[j] for j in np.flatnonzero(~solver.solved[0] & (solver.goal_types >= 0))]
+    assert unsolved == ['RightLeg', 'RightFoot', 'Head', 'RightArm']
+    # Joints whose goals aren't met keep their rest pose relative to their parents, which moved rigidly as well.
+    np.testing.assert_allclose(rotations[0], np.broadcast_to(ROTATION, rotations.shape[1:]), atol=1e-12)
+    np.testing.assert_allclose(positions[0], joint_positions, atol=1e-12)
+
+    # The same with residuals of -1 instead of NaN.
+    frame = np.zeros(points.shape[:2] + (4,))
+    frame[..., :3] = np.nan_to_num(points)
+    frame[0, occluded, 3] = -1.0
+    np.testing.assert_allclose(solver.solve(frame)[1][0], joint_positions, atol=1e-12)
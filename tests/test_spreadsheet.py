@@ -0,0 +1,57 @@
+from flexible_mocap.core import SpreadsheetView
+from flexible_mocap.standin import FBSpread
+from flexible_mocap.template import SkeletonTemplate
+
+# Number of cell columns of a joint's row.
+COLUMNS = 7
+
+
+def test_only_changed_cells_are_written(template):
+    spread = FBSpread()
+    view = SpreadsheetView(spread)
+
+    assert view.update(template) == len(template.names) * COLUMNS
+    assert spread.cell_writes == len(template.names) * COLUMNS
+
+    # Nothing changed.
+    assert view.update(template) == 0
+    assert spread.cell_writes == len(template.names) * COLUMNS
+
+    # One offset changed.
+    template.offsets[1, 0] += 0.01
+    assert view.update(template) == 1
+    assert spread.GetCellValue(1, 3) == template.offsets[1, 0]
+
+
+def test_added_joint_writes_its_row_only(template):
+    spread = FBSpread()
+    view = SpreadsheetView(spread)
+    view.update(template)
+    rows = template.to_rows()
+    rows.append(dict(rows[-1], name='Extra', parent=template.names[0]))
+
+    assert view.update(SkeletonTemplate.from_rows(rows)) == COLUMNS
+    assert list(spread.rows.values())[-1] == 'Extra'
+
+
+def test_reorder_resets_the_sheet(template):
+    spread = FBSpread()
+    view = SpreadsheetView(spread)
+    view.update(template)
+    rows = template.to_rows()
+    reordered = SkeletonTemplate.from_rows(rows[1:] + rows[:1])
+    writes = spread.cell_writes
+
+    assert view.update(reordered) == len(reordered.names) * COLUMNS
+    assert spread.cell_writes - writes == len(reordered.names) * COLUMNS
+    assert list(spread.rows.values()) == reordered.names
+    assert [spread.GetCellValue(row, 0) for row in range(len(reordered.names))] == reordered.parents
+
+
+def test_clear(template):
+    spread = FBSpread()
+    view = SpreadsheetView(spread)
+    view.update(template)
+    view.clear()
+    assert not spread.rows
+    assert not spread.cells
@@ -0,0 +1,163 @@
+import os
+import socket
+import time
+
+import numpy as np
+
+from flexible_mocap.c3d import C3DFile
+from flexible_mocap.stream import (MAGIC, UNIT_SCALES, C3DStreamServer, MarkerRingBuffer, MarkerStreamReceiver,
+                                   get_packet_dtype)
+
+from conftest import SAMPLE_DIR
+
+C3D_PATH = os.path.join(SAMPLE_DIR, 'sample_recording.c3d')
+
+
+def read_sample_points(num_frames):
+    """ Points of the sample recording in meter as they're streamed. """
+    with C3DFile(C3D_PATH) as c3d:
+        points, _ = c3d.read_points(0, num_frames)
+        points[..., :3] *= UNIT_SCALES[c3d.units]
+    return points.astype(np.float32)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def make_packet(frame, marker_count, magic=MAGIC):
+    packet = np.zeros(1, dtype=get_packet_dtype(marker_count))
+    packet['magic'] = magic
+    packet['frame'] = frame
+    packet['timestamp'] = time.time()
+    packet['count'] = marker_count
+    packet['points'] = frame
+    return packet.tobytes()
+
+
+def test_udp_loopback():
+    points = read_sample_points(240)
+    ring = MarkerRingBuffer(64, points.shape[1])
+    receiver = MarkerStreamReceiver(ring, ('127.0.0.1', 0), 'udp')
+    receiver.start()
+    server = C3DStreamServer(C3D_PATH, receiver.socket.getsockname(), 'udp', rate=480.0)
+    try:
+        server.start(len(points))
+        server.wait()
+        wait_for(lambda: ring.write_count + ring.lost_count == len(points), timeout=1.0)
+    finally:
+        server.stop()
+        receiver.close()
+
+    assert server.frame_count == len(points)
+    # Datagrams may be dropped on a busy machine, but then they are counted as lost.
+    assert ring.write_count + ring.lost_count == len(points)
+    assert ring.invalid_count == 0
+    assert ring.out_of_order_count == 0
+    latest = np.empty(points.shape[1:], dtype=np.float32)
+    frame, sent, arrived = ring.read_latest(latest)
+    np.testing.assert_array_equal(latest, points[frame])
+    assert sent <= arrived
+
+
+def test_tcp_loopback():
+    points = read_sample_points(500)
+    # Smaller than the number of frames, so the ring wraps around.
+    ring = MarkerRingBuffer(64, points.shape[1])
+    server = C3DStreamServer(C3D_PATH, ('127.0.0.1', 0), 'tcp', rate=0)
+    server.start(len(points))
+    receiver = MarkerStreamReceiver(ring, server.socket.getsockname(), 'tcp', timeout=0.2)
+    received = np.empty((ring.capacity - 1,) + points.shape[1:], dtype=np.float32)
+    cursor = 0
+    frames = list()
+    try:
+        receiver.open()
+        while receiver.receive():
+            cursor, num_frames, missed = ring.read_new(cursor, received)
+            assert missed == 0
+            frames.append(received[:num_frames].copy())
+    finally:
+        server.stop()
+        receiver.close()
+
+    # TCP doesn't lose frames, and read_new returned each of them once across the ring's wrap-arounds.
+    assert ring.write_count == len(points)
+    assert ring.lost_count == 0
+    assert ring.invalid_count == 0
+    np.testing.assert_array_equal(np.concatenate(frames), points)
+
+
+def test_lost_invalid_and_out_of_order_packets():
+    marker_count = 3
+    ring = MarkerRingBuffer(8, marker_count)
+    receiver = MarkerStreamReceiver(ring, ('127.0.0.1', 0), 'udp', timeout=1.0)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        receiver.open()
+        address = receiver.socket.getsockname()
+        packets = [make_packet(0, marker_count), make_packet(1, marker_count),
+                   make_packet(4, marker_count),  # Frames 2 and 3 are lost.
+                   make_packet(3, marker_count),  # Late.
+                   make_packet(4, marker_count),  # Duplicate.
+                   make_packet(5, marker_count)[:-4],  # Truncated.
+                   make_packet(5, marker_count, magic=b'XXXX'),
+                   make_packet(5, marker_count + 1),  # Wrong number of markers.
+                   make_packet(5, marker_count)]
+        for packet in packets:
+            sender.sendto(packet, address)
+        results = [receiver.receive() for _ in packets]
+    finally:
+        sender.close()
+        receiver.close()
+
+    assert results == [True, True, True, False, False, False, False, False, True]
+    assert ring.write_count == 4
+    assert ring.lost_count == 2
+    assert ring.out_of_order_count == 2
+    assert ring.invalid_count == 3
+    latest = np.empty((marker_count, 4), dtype=np.float32)
+    assert ring.read_latest(latest)[0] == 5
+    assert (latest == 5.0).all()
+
+
+def test_restarted_sender_starts_a_new_sequence():
+    ring = MarkerRingBuffer(8, 1)
+    points = np.zeros((1, 4))
+    for frame in range(100, 110):
+        assert ring.write(frame, 0.0, points)
+    # Within the capacity it's a late frame, further back a sender that started over.
+    assert not ring.write(105, 0.0, points)
+    assert ring.write(0, 0.0, points)
+    assert ring.write(1, 0.0, points)
+    ring.reset_sequence()
+    assert ring.write(1, 0.0, points)
+    assert ring.out_of_order_count == 1
+    assert ring.lost_count == 0
+
+
+def test_read_new_wraps_around():
+    ring = MarkerRingBuffer(8, 2)
+    out = np.empty((ring.capacity - 1, 2, 4), dtype=np.float32)
+
+    def write(frames):
+        for frame in frames:
+            ring.write(frame, 0.0, np.full((2, 4), frame))
+
+    write(range(5))
+    cursor, num_frames, missed = ring.read_new(0, out)
+    assert (cursor, num_frames, missed) == (5, 5, 0)
+    np.testing.assert_array_equal(out[:num_frames, 0, 0], range(5))
+
+    # The next frames wrap around the end of the ring.
+    write(range(5, 11))
+    cursor, num_frames, missed = ring.read_new(cursor, out)
+    assert (cursor, num_frames, missed) == (11, 6, 0)
+    np.testing.assert_array_equal(out[:num_frames, 0, 0], range(5, 11))
+
+    # A reader that falls behind by more than the ring's capacity misses the oldest frames.
+    write(range(11, 31))
+    cursor, num_frames, missed = ring.read_new(cursor, out)
+    assert (cursor, num_frames, missed) == (31, 7, 13)
+    np.testing.assert_array_equal(out[:num_frames, 0, 0], range(24, 31))
@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import numpy as np
+
+from flexible_mocap import template as template_module
+from flexible_mocap.template import load_template, read_offsets, save_template
+
+from conftest import SAMPLE_DIR
+
+
+def copy_sample(tmpdir, name):
+    fullpath = str(tmpdir.join(name))
+    shutil.copy(os.path.join(SAMPLE_DIR, name), fullpath)
+    return fullpath
+
+
+def test_reading_doesnt_write_cache(tmpdir):
+    template_path = copy_sample(tmpdir, 'skeleton_template.csv')
+    offsets_path = copy_sample(tmpdir, 'estimated_offsets.csv')
+    load_template(template_path)
+    read_offsets(offsets_path)
+    assert sorted(os.listdir(str(tmpdir))) == ['estimated_offsets.csv', 'skeleton_template.csv']
+
+
+def test_saved_cache_is_used(tmpdir, monkeypatch):
+    fullpath = str(tmpdir.join('template.csv'))
+    template = load_template(os.path.join(SAMPLE_DIR, 'skeleton_template.csv'))
+    save_template(fullpath, template)
+    # No temporary files are left behind.
+    assert sorted(os.listdir(str(tmpdir))) == ['template.csv', 'template.csv.npz']
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The CSV file was read instead of the cache.")
+    monkeypatch.setattr(template_module, 'open_csv', fail)
+    cached = load_template(fullpath)
+    assert cached.names == template.names
+    np.testing.assert_array_equal(cached.offsets, template.offsets)
+
+
+def test_replaced_csv_with_older_copy_isnt_read_from_cache(tmpdir):
+    sample_path = os.path.join(SAMPLE_DIR, 'skeleton_template.csv')
+    fullpath = str(tmpdir.join('template.csv'))
+    template = load_template(sample_path)
+    template.offsets[1] += 1.0
+    save_template(fullpath, template)
+
+    # Copying with the original, older modification time, like cp -p or unzip.
+    shutil.copy2(sample_path, fullpath)
+    np.testing.assert_array_equal(load_template(fullpath).offsets, load_template(sample_path).offsets)
+
+
+def test_same_mtime_different_size_isnt_read_from_cache(tmpdir):
+    fullpath = str(tmpdir.join('template.csv'))
+    template = load_template(os.path.join(SAMPLE_DIR, 'skeleton_template.csv'))
+    save_template(fullpath, template)
+    stat = os.stat(fullpath)
+    template.names[0] = 'Pelvis'
+    save_template(fullpath, template, use_cache=False)
+    os.utime(fullpath, (stat.st_atime, stat.st_mtime))
+    assert load_template(fullpath).names[0] == 'Pelvis'